@@ -0,0 +1,165 @@
+"""Latency and throughput of the inference backends against the PyTorch one.
+
+Runs the same clips through `extract_keypoints_from_video` with the model of every
+backend and reports frames/s, the frame latency percentiles and how far the keypoints
+are from the PyTorch ones:
+    error_px       distance of the keypoints of the persons matched to the PyTorch ones
+                   (mean and max), over keypoints with Prob >= --min-prob
+    person_diff    frames whose number of persons differs from the PyTorch output
+Exports are cached next to the weights, so the first run also pays for the export.
+Without --videos, synthetic clips are generated in a temporary folder.
+
+Usage:
+    python -m benchmarks.bench_backends --model models/yolov8n-pose.pt \\
+        --videos data/interim/actions/shot --backends torch onnx openvino
+"""
+import argparse
+import json
+import os
+import pathlib
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.bench_stride import _list_clips
+from benchmarks.synthetic import write_synthetic_video
+from src.data.keypoints_factories import extract_keypoints_from_video
+from src.data.keypoints_store import KeyPointsStore
+from src.data.person_tracker import PersonTracker, associate
+from src.models.initialize_models import BACKENDS, initialize_yolo_model
+from src.utils.timing import StageTimer
+
+
+def keypoints_difference(
+    reference: KeyPointsStore, other: KeyPointsStore, min_prob: float
+) -> Dict[str, float]:
+    """Compares the keypoints of two runs on the same clip frame by frame."""
+    errors, person_diff = [], 0
+    tracker = PersonTracker()
+    for frame_number in np.union1d(reference.frames, other.frames):
+        reference_keypoints = reference.get_frame(int(frame_number))
+        other_keypoints = other.get_frame(int(frame_number))
+        person_diff += len(reference_keypoints) != len(other_keypoints)
+        matched_reference, matched_other = associate(
+            tracker.similarity(reference_keypoints, other_keypoints), 0.0
+        )
+        matched = reference_keypoints[matched_reference]
+        distances = np.linalg.norm(
+            matched[..., :2] - other_keypoints[matched_other][..., :2], axis=-1
+        )
+        errors.append(distances[matched[..., 2] >= min_prob])
+
+    errors = np.concatenate(errors) if errors else np.empty(0)
+    return {
+        "error_px_mean": float(errors.mean()) if len(errors) else 0.0,
+        "error_px_max": float(errors.max()) if len(errors) else 0.0,
+        "person_diff": int(person_diff),
+    }
+
+
+def run_report(
+    path_to_model: str,
+    clips: List[pathlib.Path],
+    backends: List[str],
+    min_prob: float,
+    tmp_dir: pathlib.Path,
+) -> dict:
+    report = {}
+    for backend in backends:
+        model = initialize_yolo_model(path_to_model, backend)
+        out_dir = tmp_dir / backend
+        out_dir.mkdir()
+        timer = StageTimer()
+        start = time.perf_counter()
+        for clip in clips:
+            extract_keypoints_from_video(
+                model, clip, out_dir / (clip.stem + ".kpts"), timer=timer
+            )
+        seconds = time.perf_counter() - start
+        report[backend] = {
+            "seconds": seconds,
+            "frames": timer.num_frames,
+            "frames_per_s": timer.num_frames / seconds if seconds else 0.0,
+            **{
+                f"latency_p{percentile}_ms": latency * 1000
+                for percentile, latency in timer.frame_latency_percentiles().items()
+            },
+        }
+
+    if "torch" in backends:
+        for backend in backends:
+            if backend == "torch":
+                continue
+            differences = []
+            for clip in clips:
+                paths = [
+                    tmp_dir / name / (clip.stem + ".kpts") for name in ("torch", backend)
+                ]
+                if all(path.exists() for path in paths):
+                    differences.append(
+                        keypoints_difference(
+                            KeyPointsStore.open(paths[0]),
+                            KeyPointsStore.open(paths[1]),
+                            min_prob,
+                        )
+                    )
+            report[backend]["speedup"] = (
+                report["torch"]["seconds"] / report[backend]["seconds"]
+            )
+            if differences:
+                report[backend].update(
+                    error_px_mean=float(np.mean([d["error_px_mean"] for d in differences])),
+                    error_px_max=float(max(d["error_px_max"] for d in differences)),
+                    person_diff=sum(d["person_diff"] for d in differences),
+                )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="models/yolov8n-pose.pt")
+    parser.add_argument("--videos", type=pathlib.Path, nargs="+", default=None)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["torch", "onnx"])
+    parser.add_argument("--min-prob", type=float, default=0.5)
+    parser.add_argument("--num-clips", type=int, default=4)
+    parser.add_argument("--clip-frames", type=int, default=50)
+    parser.add_argument("--output", type=pathlib.Path, default=None)
+    args = parser.parse_args()
+
+    os.makedirs("loggs", exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+        if args.videos is None:
+            args.videos = [tmp_dir / "clips"]
+            args.videos[0].mkdir()
+            for i in range(args.num_clips):
+                write_synthetic_video(
+                    args.videos[0] / f"clip_{i}.avi", args.clip_frames, 640, 360, seed=i
+                )
+        report = run_report(
+            args.model, _list_clips(args.videos), args.backends, args.min_prob, tmp_dir
+        )
+
+    for backend, summary in report.items():
+        line = (
+            f"{backend:<9} {summary['frames_per_s']:8.1f} frames/s"
+            f"  p50 {summary['latency_p50_ms']:6.1f} ms  p99 {summary['latency_p99_ms']:6.1f} ms"
+        )
+        if "speedup" in summary:
+            line += f"  speedup {summary['speedup']:.2f}x"
+        if "error_px_mean" in summary:
+            line += (
+                f"  error {summary['error_px_mean']:.2f}/{summary['error_px_max']:.2f} px"
+                f" (mean/max), {summary['person_diff']} frames with other persons"
+            )
+        print(line)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
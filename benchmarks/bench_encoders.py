@@ -0,0 +1,112 @@
+"""Encode speed, output size and quality of the video encoders.
+
+Every encoder writes the same frames and reports frames/s, the output size, its ratio
+to the MJPG output and the PSNR of the decoded output against the source frames.
+The x264 encoder needs ffmpeg (on PATH or --ffmpeg), it is skipped otherwise.
+Without --video, a synthetic clip is used.
+
+Usage:
+    python -m benchmarks.bench_encoders --video data/interim/actions/shot/clip.mp4 \\
+        --frames 300 --crf 23 28 --output encoders.json
+"""
+import argparse
+import json
+import os
+import pathlib
+import tempfile
+import time
+from itertools import islice
+from typing import List
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import write_synthetic_video
+from src.data.video_encoders import VideoEncoderSettings
+from src.data.video_handler import _read_video_frames, _video_writer
+
+
+def _psnr(frames: List[np.ndarray], path: pathlib.Path) -> float:
+    errors = [
+        np.mean((frame.astype(np.float32) - decoded.astype(np.float32)) ** 2)
+        for frame, (_, decoded) in zip(frames, _read_video_frames(path))
+    ]
+    mse = float(np.mean(errors)) if errors else 0.0
+    return 10 * np.log10(255**2 / mse) if mse else float("inf")
+
+
+def encode(
+    settings: VideoEncoderSettings,
+    frames: List[np.ndarray],
+    fps: int,
+    path_out: pathlib.Path,
+) -> dict:
+    height, width = frames[0].shape[:2]
+    start = time.perf_counter()
+    writer = _video_writer(path_out, fps, width, height, settings)
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+    seconds = time.perf_counter() - start
+    return {
+        "frames_per_s": len(frames) / seconds,
+        "size_mb": os.path.getsize(path_out) / 2**20,
+        "psnr_db": _psnr(frames, path_out),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--video", type=pathlib.Path, default=None)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--quality", type=int, nargs="+", default=[90, 75])
+    parser.add_argument("--crf", type=int, nargs="+", default=[23, 28])
+    parser.add_argument("--preset", default="veryfast")
+    parser.add_argument("--ffmpeg", default=None)
+    parser.add_argument("--output", type=pathlib.Path, default=None)
+    args = parser.parse_args()
+
+    candidates = {"mjpg": VideoEncoderSettings("mjpg")}
+    for quality in args.quality:
+        candidates[f"mjpg q{quality}"] = VideoEncoderSettings("mjpg", quality=quality)
+    candidates["mp4v"] = VideoEncoderSettings("mp4v")
+    x264 = VideoEncoderSettings("x264", preset=args.preset, ffmpeg=args.ffmpeg)
+    if x264.ffmpeg_path() is not None:
+        for crf in args.crf:
+            candidates[f"x264 crf{crf}"] = VideoEncoderSettings(
+                "x264", crf=crf, preset=args.preset, ffmpeg=args.ffmpeg
+            )
+    else:
+        print("ffmpeg is not found, skipping x264")
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+        if args.video is None:
+            args.video = write_synthetic_video(tmp_dir / "clip.avi", args.frames, 1280, 720)
+        cap = cv2.VideoCapture(str(args.video))
+        fps = int(cap.get(cv2.CAP_PROP_FPS)) or 25
+        cap.release()
+        frames = [frame for _, frame in islice(_read_video_frames(args.video), args.frames)]
+
+        for i, (name, settings) in enumerate(candidates.items()):
+            report[name] = encode(
+                settings, frames, fps, tmp_dir / f"out_{i}{settings.suffix}"
+            )
+
+    reference = next(iter(report.values()))["size_mb"]
+    for name, result in report.items():
+        result["size_ratio"] = result["size_mb"] / reference
+        print(
+            f"{name:<12} {result['frames_per_s']:8.1f} frames/s  "
+            f"{result['size_mb']:8.2f} MB ({result['size_ratio']:.2f}x)  "
+            f"PSNR {result['psnr_db']:.1f} dB"
+        )
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Throughput of cross-video frame batching against per-video streaming inference.
+
+Runs the same folder of short clips through `extract_keypoints_from_video` (one video
+at a time, batch size 1) and through `CrossVideoFrameBatcher`, and reports frames/s.
+Without --videos, synthetic clips are generated in a temporary folder.
+
+Usage:
+    python -m benchmarks.bench_frame_batching --model models/yolov8n-pose.pt \\
+        --videos data/interim/actions/shot --batch-size 16
+"""
+import argparse
+import glob
+import os
+import pathlib
+import tempfile
+import time
+
+from benchmarks.synthetic import write_synthetic_video
+from src.data.frame_batcher import CrossVideoFrameBatcher
+from src.data.keypoints_factories import extract_keypoints_from_video
+from src.models.initialize_models import initialize_yolo_model
+
+
+def _list_clips(path_to_videos: pathlib.Path) -> list:
+    clips = glob.glob("*.mp4", root_dir=path_to_videos) + glob.glob(
+        "*.avi", root_dir=path_to_videos
+    )
+    return sorted(path_to_videos / clip for clip in clips)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="models/yolov8n-pose.pt")
+    parser.add_argument("--videos", type=pathlib.Path, default=None)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-open-videos", type=int, default=4)
+    parser.add_argument("--num-clips", type=int, default=8)
+    parser.add_argument("--clip-frames", type=int, default=50)
+    args = parser.parse_args()
+
+    os.makedirs("loggs", exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+        if args.videos is None:
+            args.videos = tmp_dir / "clips"
+            args.videos.mkdir()
+            for i in range(args.num_clips):
+                write_synthetic_video(
+                    args.videos / f"clip_{i}.avi", args.clip_frames, 640, 360, seed=i
+                )
+        clips = _list_clips(args.videos)
+        model = initialize_yolo_model(args.model)
+
+        streamed_dir = tmp_dir / "streamed"
+        streamed_dir.mkdir()
+        start = time.perf_counter()
+        for clip in clips:
+            extract_keypoints_from_video(model, clip, streamed_dir / (clip.stem + ".kpts"))
+        streamed_seconds = time.perf_counter() - start
+
+        batched_dir = tmp_dir / "batched"
+        batched_dir.mkdir()
+        batcher = CrossVideoFrameBatcher(model, args.batch_size, args.max_open_videos)
+        start = time.perf_counter()
+        num_frames = batcher.run(
+            [(clip, batched_dir / (clip.stem + ".kpts")) for clip in clips]
+        )
+        batched_seconds = time.perf_counter() - start
+
+    print(f"clips={len(clips)} frames={num_frames}")
+    print(f"per-video stream (batch 1): {num_frames / streamed_seconds:.1f} frames/s")
+    print(
+        f"cross-video batch {args.batch_size}: {num_frames / batched_seconds:.1f} frames/s"
+    )
+    print(f"speedup: {streamed_seconds / batched_seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Import-time benchmark of the pipeline entry points.
+
+Imports every module in a fresh interpreter, reports the wall time and fails (exit code 1)
+if an import is slower than --max-seconds or pulls in a heavy module that must be
+imported lazily (mlflow, boto3, dotenv, ultralytics, torch).
+
+Usage:
+    python -m benchmarks.bench_import_time --max-seconds 1.0
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+MODULES = [
+    "src.labeling.auto_labeling_processor",
+    "src.aws.data_exchange",
+    "src.data.keypoints_factories",
+    "src.data.keypoints_processor",
+    "src.labeling.parallel_executor",
+]
+LAZY_MODULES = ["mlflow", "boto3", "dotenv", "ultralytics", "torch"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {lazy} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module: str, repeats: int = 3) -> dict:
+    """Imports a module in fresh interpreters and returns the best time and eagerly loaded heavy modules."""
+    best = None
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, lazy=LAZY_MODULES)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-seconds", type=float, default=1.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        result = measure_import(module, args.repeats)
+        status = "ok"
+        if result["seconds"] > args.max_seconds or result["loaded"]:
+            status = "REGRESSION"
+            failed = True
+        loaded = ", ".join(result["loaded"]) or "-"
+        print(
+            f"{module:45s} {result['seconds'] * 1000:8.1f} ms  "
+            f"eager heavy modules: {loaded:20s} {status}"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Micro-benchmark of `KeyPointsCSVWriter.extract_keypoints_from_frames`.
+
+Compares the per-frame cost of the former per-keypoint tensor->scalar conversion
+with the current one-transfer-per-frame extraction on synthetic results.
+
+Usage:
+    python -m benchmarks.bench_keypoints_extraction --frames 500 --persons 12
+"""
+import argparse
+import os
+import time
+
+from benchmarks.synthetic import synthetic_results
+from src.data.keypoints_handler import KeyPointsCSVWriter
+
+
+def extract_keypoints_per_element(results) -> list:
+    """The former extraction: one Python conversion per keypoint coordinate."""
+    keypoints_list = []
+    for frame_number, frame_data in enumerate(results):
+        if not frame_data.keypoints.data.numel():
+            continue
+        frame_keypoints = []
+        for person in frame_data.keypoints.data:
+            person_keypoints = []
+            for point in person:
+                x, y = map(int, point[:2])
+                prob = float(point[2])
+                person_keypoints.append((x, y, prob))
+            frame_keypoints.append(person_keypoints)
+        keypoints_list.append((frame_number, frame_keypoints))
+    return keypoints_list
+
+
+def _per_frame_ms(func, results, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(results)
+        best = min(best, time.perf_counter() - start)
+    return best / len(results) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--persons", type=int, default=12)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    os.makedirs("loggs", exist_ok=True)
+    results = synthetic_results(args.frames, args.persons)
+    writer = KeyPointsCSVWriter(results)
+
+    before = _per_frame_ms(extract_keypoints_per_element, results, args.repeats)
+    after = _per_frame_ms(
+        lambda _: writer.extract_keypoints_from_frames(), results, args.repeats
+    )
+    print(f"frames={args.frames} persons={args.persons}")
+    print(f"per-element extraction: {before:.3f} ms/frame")
+    print(f"vectorized extraction:  {after:.3f} ms/frame")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Throughput of the model pool by number of instances, and the optimal one.
+
+Every candidate K runs a `ModelPool` of K instances, each pinned to len(cores) / K cores
+with as many torch threads, on the same frames, and reports frames/s. The optimal K
+can be used as parallel.num_workers, with threads_per_worker = cores / K.
+Without --videos, frames of a synthetic clip are used.
+
+Usage:
+    python -m benchmarks.bench_model_pool --model models/yolov8n-pose.pt \\
+        --videos data/interim/actions/shot/clip.mp4 --instances 1 2 4 8
+"""
+import argparse
+import json
+import os
+import pathlib
+import tempfile
+from itertools import islice
+
+from benchmarks.synthetic import write_synthetic_video
+from src.data.video_handler import _read_video_frames
+from src.labeling.model_pool import available_cores, find_optimal_num_instances
+from src.models.initialize_models import BACKENDS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="models/yolov8n-pose.pt")
+    parser.add_argument("--videos", type=pathlib.Path, default=None)
+    parser.add_argument("--instances", type=int, nargs="+", default=None)
+    parser.add_argument("--backend", choices=BACKENDS, default="torch")
+    parser.add_argument("--frames", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--output", type=pathlib.Path, default=None)
+    args = parser.parse_args()
+
+    os.makedirs("loggs", exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.videos is None:
+            args.videos = pathlib.Path(tmp_dir) / "clip.avi"
+            write_synthetic_video(args.videos, args.frames, 1280, 720)
+        frames = [
+            frame for _, frame in islice(_read_video_frames(args.videos), args.frames)
+        ]
+
+    throughput = find_optimal_num_instances(
+        args.model,
+        frames,
+        args.instances,
+        batch_size=args.batch_size,
+        rounds=args.rounds,
+        backend=args.backend,
+    )
+    num_cores = len(available_cores())
+    optimal = max(throughput, key=throughput.get)
+    for num_instances, frames_per_s in throughput.items():
+        print(
+            f"K={num_instances:<3} ({num_cores // num_instances} cores each): "
+            f"{frames_per_s:8.1f} frames/s"
+        )
+    print(f"optimal K on {num_cores} cores: {optimal}")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(
+                {"cores": num_cores, "optimal": optimal, "frames_per_s": throughput},
+                file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
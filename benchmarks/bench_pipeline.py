@@ -0,0 +1,241 @@
+"""Benchmark suite for the pipeline stages on synthetic data.
+
+Builds a synthetic video, synthetic pose results, keypoints and detections files, then
+times every stage on its own in a fresh process:
+    csv_writer           KeyPointsCSVWriter.write_keypoints_to_csv
+    store_writer         KeyPointsStoreWriter.write_keypoints_to_store
+    csv_reader           KeyPointsVideoWriter.read_keypoints_from_csv
+    video_writer         KeyPointsVideoWriter.write_video_with_keypoints
+    keypoints_only       KeyPointsOnlyVideoWriter.write_video_with_keypoints
+    bboxes               VideoBoundingBoxProcessor.process_video
+and reports frames/s, rows/s and the peak RSS of the stage's process. Results are saved
+as JSON; with --baseline, the throughput is compared against a previous run.
+
+Usage:
+    python -m benchmarks.bench_pipeline --frames 500 --width 1280 --height 720 \\
+        --persons 12 --output bench.json --baseline bench_baseline.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import pathlib
+import platform
+import resource
+import tempfile
+import time
+from typing import Callable, Dict
+
+from benchmarks.synthetic import (
+    NUM_KEYPOINTS,
+    synthetic_results,
+    write_synthetic_bboxes,
+    write_synthetic_video,
+)
+
+COCO_PAIRS = [
+    [5, 6], [5, 7], [6, 8], [7, 9], [8, 10], [5, 11],
+    [6, 12], [11, 12], [11, 13], [12, 14], [13, 15], [14, 16],
+]  # fmt: skip
+
+
+def _results(params: dict):
+    return synthetic_results(
+        params["frames"],
+        params["persons"],
+        params["width"],
+        params["height"],
+        empty_every=params["empty_every"],
+    )
+
+
+def _stage_csv_writer(params: dict, paths: dict) -> Callable[[], None]:
+    from src.data.keypoints_handler import KeyPointsCSVWriter
+
+    writer = KeyPointsCSVWriter(iter(_results(params)))
+    return lambda: writer.write_keypoints_to_csv(paths["tmp"] / "out.csv")
+
+
+def _stage_store_writer(params: dict, paths: dict) -> Callable[[], None]:
+    from src.data.keypoints_handler import KeyPointsStoreWriter
+
+    writer = KeyPointsStoreWriter(iter(_results(params)))
+    return lambda: writer.write_keypoints_to_store(paths["tmp"] / "out.kpts")
+
+
+def _stage_csv_reader(params: dict, paths: dict) -> Callable[[], None]:
+    from src.data.keypoints_handler import KeyPointsVideoWriter
+
+    writer = KeyPointsVideoWriter(COCO_PAIRS)
+    return lambda: writer.read_keypoints_from_csv(paths["csv"])
+
+
+def _stage_video_writer(params: dict, paths: dict) -> Callable[[], None]:
+    from src.data.keypoints_handler import KeyPointsVideoWriter
+
+    writer = KeyPointsVideoWriter(COCO_PAIRS)
+    return lambda: writer.write_video_with_keypoints(
+        paths["video"], paths["tmp"] / "overlay.avi", paths["csv"]
+    )
+
+
+def _stage_keypoints_only(params: dict, paths: dict) -> Callable[[], None]:
+    from src.data.keypoints_handler import KeyPointsOnlyVideoWriter
+
+    writer = KeyPointsOnlyVideoWriter(COCO_PAIRS)
+    return lambda: writer.write_video_with_keypoints(
+        paths["video"], paths["tmp"] / "keypoints_only.avi", paths["csv"]
+    )
+
+
+def _stage_bboxes(params: dict, paths: dict) -> Callable[[], None]:
+    from src.data.bboxes_processor import VideoBoundingBoxProcessor
+
+    processor = VideoBoundingBoxProcessor(
+        str(paths["video"]), str(paths["bboxes"]), str(paths["tmp"] / "bboxes.avi")
+    )
+    return processor.process_video
+
+
+STAGES: Dict[str, Callable] = {
+    "csv_writer": _stage_csv_writer,
+    "store_writer": _stage_store_writer,
+    "csv_reader": _stage_csv_reader,
+    "video_writer": _stage_video_writer,
+    "keypoints_only": _stage_keypoints_only,
+    "bboxes": _stage_bboxes,
+}
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss survives exec on Linux, so a spawned process would report the peak of
+    # its parent; VmHWM belongs to the address space of this process only
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def _run_stage(name: str, params: dict, paths: dict, repeats: int, queue) -> None:
+    """Prepares a stage, times it and reports the metrics. Runs in its own process."""
+    os.makedirs("loggs", exist_ok=True)
+    best = float("inf")
+    for _ in range(repeats):
+        stage = STAGES[name](params, paths)
+        rss_before = _peak_rss_mb()
+        start = time.perf_counter()
+        stage()
+        best = min(best, time.perf_counter() - start)
+
+    frames = params["frames"]
+    rows = frames * params["persons"] * NUM_KEYPOINTS
+    queue.put(
+        {
+            "seconds": best,
+            "frames_per_s": frames / best,
+            "rows_per_s": rows / best,
+            "peak_rss_mb": _peak_rss_mb(),
+            "peak_rss_delta_mb": _peak_rss_mb() - rss_before,
+        }
+    )
+
+
+def run_benchmarks(params: dict, stages, repeats: int) -> dict:
+    """Builds the synthetic inputs and runs every stage in a fresh process."""
+    context = multiprocessing.get_context("spawn")
+    report = {"params": params, "stages": {}}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+        paths = {
+            "tmp": tmp_dir,
+            "video": write_synthetic_video(
+                tmp_dir / "video.avi",
+                params["frames"],
+                params["width"],
+                params["height"],
+                params["fps"],
+                params["persons"],
+            ),
+            "bboxes": write_synthetic_bboxes(
+                tmp_dir / "bboxes.txt",
+                params["frames"],
+                params["persons"],
+                params["width"],
+                params["height"],
+            ),
+            "csv": tmp_dir / "keypoints.csv",
+        }
+        from src.data.keypoints_handler import KeyPointsCSVWriter
+
+        os.makedirs("loggs", exist_ok=True)
+        KeyPointsCSVWriter(iter(_results(params))).write_keypoints_to_csv(paths["csv"])
+
+        for name in stages:
+            queue = context.Queue()
+            process = context.Process(
+                target=_run_stage, args=(name, params, paths, repeats, queue)
+            )
+            process.start()
+            report["stages"][name] = queue.get()
+            process.join()
+    return report
+
+
+def _print_report(report: dict, baseline: dict = None) -> None:
+    for name, metrics in report["stages"].items():
+        line = (
+            f"{name:16s} {metrics['seconds']:8.3f} s {metrics['frames_per_s']:10.1f} frames/s "
+            f"{metrics['rows_per_s']:12.0f} rows/s {metrics['peak_rss_mb']:8.1f} MB peak RSS"
+        )
+        baseline_metrics = (baseline or {}).get("stages", {}).get(name)
+        if baseline_metrics:
+            ratio = metrics["frames_per_s"] / baseline_metrics["frames_per_s"]
+            line += f"  {ratio:5.2f}x vs baseline"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--persons", type=int, default=12)
+    parser.add_argument(
+        "--empty-every", type=int, default=4, help="every N-th frame has no persons"
+    )
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--output", type=pathlib.Path, default=None)
+    parser.add_argument("--baseline", type=pathlib.Path, default=None)
+    args = parser.parse_args()
+
+    params = {
+        "frames": args.frames,
+        "width": args.width,
+        "height": args.height,
+        "fps": args.fps,
+        "persons": args.persons,
+        "empty_every": args.empty_every,
+    }
+    report = run_benchmarks(params, args.stages, args.repeats)
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+    _print_report(report, baseline)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
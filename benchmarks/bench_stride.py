@@ -0,0 +1,156 @@
+"""Report the speedup and the keypoint deviation of frame-stride inference.
+
+Every clip is processed at full rate and with each stride, and the interpolated frames
+are compared with the full-rate keypoints of the same frames:
+    speedup     full-rate time / strided time
+    error_px    distance of the interpolated keypoints to the full-rate ones
+                (mean, median and 95th percentile), over keypoints with Prob >= --min-prob
+    coverage    share of the full-rate persons of interpolated frames that were interpolated
+
+Usage:
+    python -m benchmarks.bench_stride --model models/yolov8n-pose.pt \\
+        --videos data/interim/actions/running --strides 2 3 5 --output stride.json
+"""
+import argparse
+import json
+import pathlib
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from src.data.keypoints_factories import extract_keypoints_from_video
+from src.data.keypoints_store import KeyPointsStore
+from src.data.person_tracker import PersonTracker, associate
+
+VIDEO_SUFFIXES = (".mp4", ".avi")
+
+
+def _list_clips(paths: List[pathlib.Path]) -> List[pathlib.Path]:
+    clips = []
+    for path in paths:
+        if path.is_dir():
+            clips.extend(sorted(p for p in path.iterdir() if p.suffix in VIDEO_SUFFIXES))
+        else:
+            clips.append(path)
+    return clips
+
+
+def _extract(model, clip: pathlib.Path, path_out: pathlib.Path, stride: int) -> float:
+    start = time.perf_counter()
+    extract_keypoints_from_video(model, clip, path_out, stride=stride)
+    return time.perf_counter() - start
+
+
+def _open_store(path: pathlib.Path) -> KeyPointsStore:
+    return KeyPointsStore.open(path) if path.exists() else None
+
+
+def keypoint_deviation(
+    full: KeyPointsStore, strided: KeyPointsStore, min_prob: float
+) -> Dict[str, float]:
+    """Compares the interpolated frames of a strided run with the full-rate keypoints."""
+    errors, num_full_persons, num_matched = [], 0, 0
+    tracker = PersonTracker()
+    for frame_number in strided.frames[strided.interpolated]:
+        full_keypoints = full.get_frame(int(frame_number))
+        strided_keypoints = strided.get_frame(int(frame_number))
+        num_full_persons += len(full_keypoints)
+        matched_full, matched_strided = associate(
+            tracker.similarity(full_keypoints, strided_keypoints), 0.0
+        )
+        num_matched += len(matched_full)
+        full_matched = full_keypoints[matched_full]
+        distances = np.linalg.norm(
+            full_matched[..., :2] - strided_keypoints[matched_strided][..., :2], axis=-1
+        )
+        errors.append(distances[full_matched[..., 2] >= min_prob])
+
+    errors = np.concatenate(errors) if errors else np.empty(0)
+    if not len(errors):
+        return {"interpolated_frames": int(strided.interpolated.sum())}
+    return {
+        "interpolated_frames": int(strided.interpolated.sum()),
+        "error_px_mean": float(errors.mean()),
+        "error_px_median": float(np.median(errors)),
+        "error_px_p95": float(np.percentile(errors, 95)),
+        "coverage": num_matched / num_full_persons if num_full_persons else 1.0,
+    }
+
+
+def run_report(model, clips: List[pathlib.Path], strides: List[int], min_prob: float) -> dict:
+    report = {"clips": {}, "strides": {}}
+    totals = {stride: [0.0, 0.0] for stride in strides}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+        for clip in clips:
+            full_path = tmp_dir / f"{clip.stem}_1.kpts"
+            full_seconds = _extract(model, clip, full_path, 1)
+            full = _open_store(full_path)
+            clip_report = {"full_rate_s": full_seconds}
+            for stride in strides:
+                strided_path = tmp_dir / f"{clip.stem}_{stride}.kpts"
+                seconds = _extract(model, clip, strided_path, stride)
+                strided = _open_store(strided_path)
+                totals[stride][0] += full_seconds
+                totals[stride][1] += seconds
+                clip_report[stride] = {"seconds": seconds, "speedup": full_seconds / seconds}
+                if full is not None and strided is not None:
+                    clip_report[stride].update(keypoint_deviation(full, strided, min_prob))
+            report["clips"][str(clip)] = clip_report
+
+    for stride, (full_seconds, seconds) in totals.items():
+        deviations = [
+            clip_report[stride]
+            for clip_report in report["clips"].values()
+            if "error_px_mean" in clip_report[stride]
+        ]
+        report["strides"][stride] = {
+            "speedup": full_seconds / seconds if seconds else None,
+            "error_px_mean": (
+                float(np.mean([d["error_px_mean"] for d in deviations]))
+                if deviations
+                else None
+            ),
+            "coverage": (
+                float(np.mean([d["coverage"] for d in deviations])) if deviations else None
+            ),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--videos", type=pathlib.Path, nargs="+", required=True)
+    parser.add_argument("--strides", type=int, nargs="+", default=[2, 3, 5])
+    parser.add_argument("--min-prob", type=float, default=0.5)
+    parser.add_argument("--output", type=pathlib.Path, default=None)
+    args = parser.parse_args()
+
+    from src.models.initialize_models import initialize_yolo_model
+
+    model = initialize_yolo_model(args.model)
+    report = run_report(model, _list_clips(args.videos), args.strides, args.min_prob)
+
+    for stride, summary in report["strides"].items():
+        speedup = summary["speedup"]
+        error = summary["error_px_mean"]
+        coverage = summary["coverage"]
+        print(
+            f"stride {stride}: speedup {speedup:.2f}x, "
+            + (
+                f"mean error {error:.1f} px, coverage {coverage:.1%}"
+                if error is not None
+                else "no interpolated keypoints to compare"
+            )
+        )
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
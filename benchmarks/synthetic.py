@@ -0,0 +1,118 @@
+"""The module provides synthetic videos and pose results for benchmarks."""
+import pathlib
+from typing import List, Union
+
+import cv2
+import numpy as np
+
+NUM_KEYPOINTS = 17
+
+
+class SyntheticKeypoints:
+    """Mimics `ultralytics.engine.results.Keypoints`: `data` is a tensor of shape (persons, 17, 3)."""
+
+    def __init__(self, data):
+        self.data = data
+
+
+class SyntheticResult:
+    """Mimics `ultralytics.engine.results.Results` with only the attributes the pipeline uses."""
+
+    def __init__(self, keypoints_data, orig_img=None):
+        self.keypoints = SyntheticKeypoints(keypoints_data)
+        self.orig_img = orig_img
+
+
+def synthetic_keypoints(
+    num_persons: int, width: int = 1280, height: int = 720, seed: int = 0
+) -> np.ndarray:
+    """Random keypoints of shape (persons, 17, 3) inside a frame of the given size."""
+    rng = np.random.default_rng(seed)
+    keypoints = np.empty((num_persons, NUM_KEYPOINTS, 3), dtype=np.float32)
+    keypoints[..., 0] = rng.uniform(0, width - 1, (num_persons, NUM_KEYPOINTS))
+    keypoints[..., 1] = rng.uniform(0, height - 1, (num_persons, NUM_KEYPOINTS))
+    keypoints[..., 2] = rng.uniform(0, 1, (num_persons, NUM_KEYPOINTS))
+    return keypoints
+
+
+def synthetic_results(
+    num_frames: int,
+    num_persons: int,
+    width: int = 1280,
+    height: int = 720,
+    seed: int = 0,
+    empty_every: int = 0,
+) -> List[SyntheticResult]:
+    """Synthetic `Results`-like objects with torch keypoint tensors, one per frame.
+    With `empty_every` > 0, every `empty_every`-th frame has no persons.
+    """
+    import torch
+
+    return [
+        SyntheticResult(
+            torch.from_numpy(
+                synthetic_keypoints(
+                    0 if empty_every and i % empty_every == 0 else num_persons,
+                    width,
+                    height,
+                    seed + i,
+                )
+            )
+        )
+        for i in range(num_frames)
+    ]
+
+
+def write_synthetic_video(
+    path_out: Union[str, pathlib.Path],
+    num_frames: int,
+    width: int = 1280,
+    height: int = 720,
+    fps: int = 25,
+    num_persons: int = 4,
+    seed: int = 0,
+) -> pathlib.Path:
+    """Write an MJPG AVI with moving person-like blobs over a textured background."""
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(
+        rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 5
+    )
+    positions = rng.uniform((0, 0), (width, height), (num_persons, 2))
+    velocities = rng.uniform(-4, 4, (num_persons, 2))
+    box = np.array([max(width // 40, 4), max(height // 8, 8)])
+
+    writer = cv2.VideoWriter(
+        str(path_out), cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height)
+    )
+    for _ in range(num_frames):
+        frame = background.copy()
+        positions = (positions + velocities) % (width, height)
+        for x, y in positions.astype(int):
+            cv2.rectangle(frame, (x, y), (x + box[0], y + box[1]), (40, 40, 200), -1)
+            cv2.circle(frame, (x + box[0] // 2, y - box[0] // 2), box[0] // 2, (180, 160, 140), -1)
+        writer.write(frame)
+    writer.release()
+    return pathlib.Path(path_out)
+
+
+def write_synthetic_bboxes(
+    path_out: Union[str, pathlib.Path],
+    num_frames: int,
+    num_persons: int,
+    width: int = 1280,
+    height: int = 720,
+    seed: int = 0,
+) -> pathlib.Path:
+    """Write a detections file in the `VideoBoundingBoxProcessor` format:
+    a "Frame N" line (1-based) followed by "x1,y1,x2,y2,score" lines.
+    """
+    rng = np.random.default_rng(seed)
+    with open(path_out, "w", encoding="utf-8") as file:
+        for frame_number in range(1, num_frames + 1):
+            file.write(f"Frame {frame_number}\n")
+            x1 = rng.uniform(0, width * 0.9, num_persons)
+            y1 = rng.uniform(0, height * 0.8, num_persons)
+            scores = rng.uniform(0, 1, num_persons)
+            for x, y, score in zip(x1, y1, scores):
+                file.write(f"{x},{y},{x + width / 20},{y + height / 6},{score}\n")
+    return pathlib.Path(path_out)
@@ -1,17 +1,28 @@
+"""The module exchanges data with S3.
+
+boto3 and python-dotenv are imported, and secrets and S3 clients are created, on first
+use and cached, so importing the module costs nothing for purely local runs.
+"""
 import json
 import os
 import pathlib
-from typing import Optional
-
-import boto3
-from botocore.exceptions import ClientError
-from dotenv import load_dotenv
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional
 
 from config import AutoLabelingMode, set_autolabeling_mode
+from src.data.completion_manifest import MANIFEST_NAME
 from src.utils.loggers import setup_logger
 
+# Connections of the shared S3 client, split between the files transferred at once
+MAX_POOL_CONNECTIONS = 64
+
 
 def get_local_secrets():
+    from dotenv import load_dotenv
+
     load_dotenv("./.env")
     return {
         "AWS_ACCESS_KEY_ID": os.getenv("AWS_ACCESS_KEY_ID"),
@@ -20,6 +31,9 @@ def get_local_secrets():
 
 
 def get_AWS_secrets(secret_name="AWS-keys", region_name="eu-north-1"):
+    import boto3
+    from botocore.exceptions import ClientError
+
     session = boto3.session.Session()
     client = session.client(service_name="secretsmanager", region_name=region_name)
 
@@ -32,26 +46,39 @@ def get_AWS_secrets(secret_name="AWS-keys", region_name="eu-north-1"):
     return json.loads(secret)
 
 
-# Determine which secrets to load based on run_env
-run_env = set_autolabeling_mode()
+@lru_cache(maxsize=None)
+def get_secrets() -> dict:
+    """Determine which secrets to load based on run_env, once per process."""
+    run_env = set_autolabeling_mode()
 
-if run_env == AutoLabelingMode.LOCAL or AutoLabelingMode.DEBUG:
-    secrets = get_local_secrets()
-elif run_env == AutoLabelingMode.AWS:
-    secrets = get_AWS_secrets()
-else:
+    if run_env in (AutoLabelingMode.LOCAL, AutoLabelingMode.DEBUG):
+        return get_local_secrets()
+    if run_env == AutoLabelingMode.AWS:
+        return get_AWS_secrets()
     raise ValueError(f"Unsupported run_env value: {run_env}")
 
 
+@lru_cache(maxsize=None)
 def create_s3_client():
+    """Create the S3 client on first use. boto3 clients are thread-safe, so it is shared.
+    Its connection pool serves all parts of all files in flight (see `_transfer_config`).
+    """
+    import boto3
+    from botocore.config import Config
+
+    secrets = get_secrets()
     return boto3.client(
         "s3",
         aws_access_key_id=secrets["AWS_ACCESS_KEY_ID"],
         aws_secret_access_key=secrets["AWS_SECRET_ACCESS_KEY"],
+        config=Config(max_pool_connections=MAX_POOL_CONNECTIONS),
     )
 
 
 def create_s3_resource():
+    import boto3
+
+    secrets = get_secrets()
     return boto3.resource(
         "s3",
         aws_access_key_id=secrets["AWS_ACCESS_KEY_ID"],
@@ -59,15 +86,84 @@ def create_s3_resource():
     )
 
 
+DOWNLOAD_MANIFEST = ".s3_download_manifest.json"
+UPLOAD_MANIFEST = ".s3_upload_manifest.json"
+# Bookkeeping files of the local runs, never uploaded
+_NOT_UPLOADED = (UPLOAD_MANIFEST, DOWNLOAD_MANIFEST, MANIFEST_NAME)
+
+
+@lru_cache(maxsize=None)
+def _transfer_config(max_workers: int = 8):
+    """Multipart settings for the large video files: 16 MB parts, with the connections
+    of the client split between the `max_workers` files in flight (8 parts each for 8 files).
+    """
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=16 * 1024 * 1024,
+        multipart_chunksize=16 * 1024 * 1024,
+        max_concurrency=max(1, MAX_POOL_CONNECTIONS // max_workers),
+        use_threads=True,
+    )
+
+
+@dataclass
+class TransferSummary:
+    """Counts, volume and duration of an S3 transfer."""
+
+    num_transferred: int = 0
+    num_skipped: int = 0
+    num_failed: int = 0
+    total_bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput_mb_s(self) -> float:
+        return self.total_bytes / (1024 * 1024) / self.seconds if self.seconds else 0.0
+
+
+def _load_manifest(path_to_manifest: pathlib.Path) -> Dict[str, dict]:
+    """Loads a transfer manifest {S3 key: {"size": ..., "etag": ...}}."""
+    try:
+        with open(path_to_manifest, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_manifest(path_to_manifest: pathlib.Path, manifest: Dict[str, dict]) -> None:
+    """Saves a transfer manifest atomically."""
+    path_to_manifest.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path_to_manifest.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, path_to_manifest)
+
+
+def _list_objects(s3, bucket_name: str, prefix: str) -> Dict[str, dict]:
+    """Lists the objects under a prefix as {key: {"size": ..., "etag": ...}}."""
+    objects = {}
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            objects[obj["Key"]] = {"size": obj["Size"], "etag": obj["ETag"]}
+    return objects
+
+
 def download_data_from_S3(
     bucket_name: str,
     s3_folder: str,
     local_path: pathlib.Path,
     log_file: Optional[str] = None,
-) -> None:
+    max_workers: int = 8,
+    s3_client=None,
+) -> TransferSummary:
     """
     Downloads a S3 directory (and its subdirectories) to a local machine.
 
+    Objects are downloaded concurrently. An object is skipped if its size and ETag match
+    the manifest of the previous download and the local file is still there.
+
     Args:
         bucket_name (str): Name of the S3 bucket to upload to.
         s3_folder (str): Folder path in the S3 bucket.
@@ -75,37 +171,68 @@ def download_data_from_S3(
         log_file (Optional[str], optional): Path to the log file. If specified,
                                             logs will also be written to this file.
                                             Defaults to None.
+        max_workers (int, optional): Number of files downloaded at once. Defaults to 8.
+        s3_client (optional): S3 client to use. Defaults to `create_s3_client()`.
     Returns:
-        None
+        TransferSummary: Counts, volume and throughput of the download.
     """
     logger = setup_logger(name="S3_downloader", level="INFO", log_file=log_file)
 
-    s3 = create_s3_resource()
-    bucket = s3.Bucket(bucket_name)
-
-    num_files_downloaded = 0
-    total_size = 0
+    s3 = s3_client or create_s3_client()
+    path_to_manifest = pathlib.Path(local_path) / DOWNLOAD_MANIFEST
+    manifest = _load_manifest(path_to_manifest)
+    summary = TransferSummary()
+    start = time.perf_counter()
 
-    for obj in bucket.objects.filter(Prefix=s3_folder):
-        if obj.key.endswith("/"):
+    tasks = []
+    for key, obj in _list_objects(s3, bucket_name, s3_folder).items():
+        if key.endswith("/"):
             continue
 
-        _, *rest_of_key = obj.key.split("/")
-
+        _, *rest_of_key = key.split("/")
         local_file_path = os.path.join(local_path, *rest_of_key)
-        local_directory = os.path.dirname(local_file_path)
-        if not os.path.exists(local_directory):
-            os.makedirs(local_directory)
-
-        s3.meta.client.download_file(bucket_name, obj.key, local_file_path)
+        if (
+            manifest.get(key) == obj
+            and os.path.exists(local_file_path)
+            and os.path.getsize(local_file_path) == obj["size"]
+        ):
+            summary.num_skipped += 1
+            continue
+        tasks.append((key, obj, local_file_path))
+
+    def download(key: str, local_file_path: str) -> None:
+        os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+        s3.download_file(
+            bucket_name, key, local_file_path, Config=_transfer_config(max_workers)
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(download, key, local_file_path): (key, obj)
+            for key, obj, local_file_path in tasks
+        }
+        for future in as_completed(futures):
+            key, obj = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logger.info(f"Failed to download {key}. Reason: {e}")
+                summary.num_failed += 1
+                continue
+            manifest[key] = obj
+            summary.num_transferred += 1
+            summary.total_bytes += obj["size"]
 
-        num_files_downloaded += 1
-        total_size += obj.size
+    _save_manifest(path_to_manifest, manifest)
+    summary.seconds = time.perf_counter() - start
 
-    total_size_mb = total_size / (1024 * 1024)
+    total_size_mb = summary.total_bytes / (1024 * 1024)
     logger.info(
-        f"Downloaded {num_files_downloaded} files with a total size of {total_size_mb:.2f} MB in the folder {local_path}"
+        f"Downloaded {summary.num_transferred} files with a total size of {total_size_mb:.2f} MB "
+        f"in the folder {local_path} ({summary.throughput_mb_s:.2f} MB/s), "
+        f"skipped {summary.num_skipped} up-to-date files, {summary.num_failed} failed"
     )
+    return summary
 
 
 def upload_data_to_s3(
@@ -113,10 +240,17 @@ def upload_data_to_s3(
     bucket_name: str,
     s3_folder: Optional[str] = None,
     log_file: Optional[str] = None,
-) -> None:
+    max_workers: int = 8,
+    s3_client=None,
+) -> TransferSummary:
     """
     Uploads a local directory (and its subdirectories) to an S3 bucket.
 
+    Files are uploaded concurrently. A file is skipped if its size and modification time
+    did not change since the previous upload and the object in the bucket still has the
+    size and ETag recorded in the manifest. The manifests of the runs and leftover
+    *.tmp files are not uploaded.
+
     Args:
         local_path (str): Local directory path to upload.
         bucket_name (str): Name of the S3 bucket to upload to.
@@ -126,18 +260,27 @@ def upload_data_to_s3(
         log_file (Optional[str], optional):  Path to the log file. If specified,
                                              logs will also be written to this file.
                                              Defaults to None.
+        max_workers (int, optional): Number of files uploaded at once. Defaults to 8.
+        s3_client (optional): S3 client to use. Defaults to `create_s3_client()`.
 
     Returns:
-        None
+        TransferSummary: Counts, volume and throughput of the upload.
     """
     logger = setup_logger(name="S3_uploader", level="INFO", log_file=log_file)
 
-    s3 = create_s3_client()
-
-    num_files_uploaded = 0
+    s3 = s3_client or create_s3_client()
+    path_to_manifest = pathlib.Path(local_path) / UPLOAD_MANIFEST
+    manifest = _load_manifest(path_to_manifest)
+    remote_objects = _list_objects(s3, bucket_name, s3_folder or "")
+    summary = TransferSummary()
+    start = time.perf_counter()
 
+    tasks = []
     for subdir, _, files in os.walk(local_path):
         for file in files:
+            # Leftovers of atomic writes end with .tmp
+            if file in _NOT_UPLOADED or file.endswith(".tmp"):
+                continue
             full_path = os.path.join(subdir, file)
             relative_path = os.path.relpath(full_path, local_path)
 
@@ -146,10 +289,47 @@ def upload_data_to_s3(
                 os.path.join(s3_folder, relative_path) if s3_folder else relative_path
             )
 
+            stat = os.stat(full_path)
+            local_state = {"size": stat.st_size, "mtime": stat.st_mtime}
+            entry = manifest.get(s3_path, {})
+            if (
+                entry.get("local") == local_state
+                and remote_objects.get(s3_path) == entry.get("remote")
+            ):
+                summary.num_skipped += 1
+                continue
+            tasks.append((full_path, s3_path, local_state))
+
+    def upload(full_path: str, s3_path: str) -> dict:
+        s3.upload_file(
+            full_path, bucket_name, s3_path, Config=_transfer_config(max_workers)
+        )
+        head = s3.head_object(Bucket=bucket_name, Key=s3_path)
+        return {"size": head["ContentLength"], "etag": head["ETag"]}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(upload, full_path, s3_path): (full_path, s3_path, state)
+            for full_path, s3_path, state in tasks
+        }
+        for future in as_completed(futures):
+            full_path, s3_path, local_state = futures[future]
             try:
-                s3.upload_file(full_path, bucket_name, s3_path)
-                logger.info(f"Uploaded {full_path} to {bucket_name}/{s3_path}")
-                num_files_uploaded += 1
+                remote_state = future.result()
             except Exception as e:
                 logger.info(f"Failed to upload {full_path}. Reason: {e}")
-    logger.info(f"Uploaded {num_files_uploaded} files to S3:{bucket_name}/{s3_folder}")
+                summary.num_failed += 1
+                continue
+            logger.info(f"Uploaded {full_path} to {bucket_name}/{s3_path}")
+            manifest[s3_path] = {"local": local_state, "remote": remote_state}
+            summary.num_transferred += 1
+            summary.total_bytes += local_state["size"]
+
+    _save_manifest(path_to_manifest, manifest)
+    summary.seconds = time.perf_counter() - start
+    logger.info(
+        f"Uploaded {summary.num_transferred} files to S3:{bucket_name}/{s3_folder} "
+        f"({summary.throughput_mb_s:.2f} MB/s), skipped {summary.num_skipped} "
+        f"up-to-date files, {summary.num_failed} failed"
+    )
+    return summary
@@ -0,0 +1,132 @@
+"""The module picks the inference resolution (`imgsz`) of every video from a cheap probe.
+
+The model runs at its default resolution on a few frames spread over the first seconds
+of the video, and the heights of the persons found there set the resolution: the
+smallest one at which the small persons (the `PERSON_QUANTILE` of the heights) are
+still `target_height` pixels tall at the model input. Close-ups run at a low resolution,
+wide shots with small players at a high one. The preference trades speed for accuracy
+by the target height.
+"""
+import time
+from itertools import islice
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.data.video_handler import _read_video_frames_with_stride
+from src.utils.loggers import setup_logger
+
+# Height (in pixels at the model input) the small persons of a video should keep
+PREFERENCES = {"speed": 48, "balanced": 64, "accuracy": 96}
+# Resolutions to choose from, multiples of the model stride (32)
+IMGSZ_CHOICES = (320, 416, 512, 640, 800, 960, 1280)
+# The resolution of the probe, the default of the YOLO models
+PROBE_IMGSZ = 640
+# Share of the persons allowed below the target height
+PERSON_QUANTILE = 25
+
+
+def choose_imgsz(
+    person_heights: np.ndarray,
+    frame_size: Tuple[int, int],
+    target_height: float,
+    choices: Sequence[int] = IMGSZ_CHOICES,
+) -> int:
+    """Returns the smallest resolution at which the small persons keep the target height.
+
+    Args:
+        person_heights (np.ndarray): Heights of the probed persons in frame pixels.
+        frame_size (Tuple[int, int]): Width and height of the frames.
+        target_height (float): Height of the small persons at the model input.
+        choices (Sequence[int], optional): Resolutions, sorted. Defaults to IMGSZ_CHOICES.
+
+    Returns:
+        int: The resolution, or PROBE_IMGSZ if no person was found.
+    """
+    if not len(person_heights):
+        return PROBE_IMGSZ
+    small_height = max(float(np.percentile(person_heights, PERSON_QUANTILE)), 1.0)
+    # The longer frame side is resized to imgsz
+    needed = max(frame_size) * target_height / small_height
+    for imgsz in choices:
+        if imgsz >= needed:
+            return imgsz
+    return choices[-1]
+
+
+class AdaptiveResolution:
+    """Chooses `imgsz` per video from the person box sizes on its first frames.
+
+    Attributes:
+        preference (str): 'speed', 'balanced' or 'accuracy' (see PREFERENCES).
+        probe_frames (int): Number of probed frames.
+        probe_stride (int): Probe every `probe_stride`-th frame from the start.
+        conf (float): Confidence threshold of the probe.
+    """
+
+    def __init__(
+        self,
+        preference: str = "balanced",
+        probe_frames: int = 4,
+        probe_stride: int = 10,
+        conf: float = 0.30,
+        log_file: Optional[str] = "loggs/adaptive_resolution.log",
+    ):
+        if preference not in PREFERENCES:
+            raise ValueError(
+                f"Unknown preference '{preference}', expected one of {list(PREFERENCES)}"
+            )
+        self.preference = preference
+        self.probe_frames = probe_frames
+        self.probe_stride = probe_stride
+        self.conf = conf
+        self.logger = setup_logger(
+            f"{__name__}.{self.__class__.__name__}", "INFO", log_file
+        )
+
+    def probe(self, model, path_to_video_file_in) -> Tuple[np.ndarray, Tuple[int, int], float]:
+        """Runs the model on the first frames of a video.
+
+        Returns:
+            Tuple[np.ndarray, Tuple[int, int], float]: Heights of the persons found,
+                the frame size (width, height) and the median inference milliseconds.
+        """
+        frames = _read_video_frames_with_stride(path_to_video_file_in, self.probe_stride)
+        heights, inference_ms, frame_size = [], [], (0, 0)
+        for _, frame in islice(frames, self.probe_frames):
+            frame_size = (frame.shape[1], frame.shape[0])
+            result = model(frame, imgsz=PROBE_IMGSZ, conf=self.conf, verbose=False)[0]
+            boxes = result.boxes.xyxy.cpu().numpy()
+            heights.append(boxes[:, 3] - boxes[:, 1])
+            inference_ms.append(result.speed.get("inference") or 0.0)
+        frames.close()
+        heights = np.concatenate(heights) if heights else np.empty(0)
+        return heights, frame_size, float(np.median(inference_ms)) if inference_ms else 0.0
+
+    def select(self, model, path_to_video_file_in) -> Tuple[int, float]:
+        """Chooses the resolution of a video.
+
+        Returns:
+            Tuple[int, float]: The resolution and the median inference milliseconds
+                per frame of the probe at PROBE_IMGSZ, to compare against.
+        """
+        start = time.perf_counter()
+        heights, frame_size, probe_ms = self.probe(model, path_to_video_file_in)
+        imgsz = choose_imgsz(heights, frame_size, PREFERENCES[self.preference])
+        self.logger.info(
+            f"{path_to_video_file_in}: imgsz {imgsz} for {len(heights)} persons "
+            f"(median height {np.median(heights) if len(heights) else 0:.0f} px "
+            f"in {frame_size[0]}x{frame_size[1]}), probed in "
+            f"{time.perf_counter() - start:.2f} s"
+        )
+        return imgsz, probe_ms
+
+    def log_speedup(
+        self, path_to_video_file_in, imgsz: int, probe_ms: float, inference_ms: float
+    ) -> None:
+        """Logs the inference speedup of the chosen resolution against the probe one."""
+        if probe_ms and inference_ms:
+            self.logger.info(
+                f"{path_to_video_file_in}: imgsz {imgsz} ran at {inference_ms:.1f} ms "
+                f"per frame, {probe_ms / inference_ms:.2f}x against {PROBE_IMGSZ}"
+            )
@@ -1,8 +1,126 @@
 import os
+from itertools import islice
+from typing import Optional, Tuple
 
 import cv2
+import numpy as np
 
+from src.data.video_encoders import VideoEncoderSettings
 from src.data.video_handler import _get_video_params, _video_writer
+from src.data.video_pipeline import run_video_pipeline
+
+FRAME_PREFIX = "Frame "
+# Boxes with a score not above this are not drawn
+MIN_SCORE = 0.5
+
+
+class FrameBoxes:
+    """Bounding boxes of a video as numpy arrays with a frame-offset index.
+
+    The boxes of frame `frames[i]` are the rows `starts[i]:starts[i] + counts[i]`.
+
+    Attributes:
+        frames (np.ndarray): Frame numbers with boxes, sorted, shape (frames,).
+        starts (np.ndarray): First row of every frame, shape (frames,).
+        counts (np.ndarray): Number of boxes of every frame, shape (frames,).
+        boxes (np.ndarray): x1, y1, x2, y2 of every box, float64, shape (rows, 4).
+        scores (np.ndarray): Score of every box, float64, shape (rows,).
+    """
+
+    def __init__(self, box_frames: np.ndarray, boxes: np.ndarray, scores: np.ndarray):
+        order = np.argsort(box_frames, kind="stable")
+        self.boxes = boxes[order]
+        self.scores = scores[order]
+        self.frames, self.starts, self.counts = np.unique(
+            box_frames[order], return_index=True, return_counts=True
+        )
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __contains__(self, frame_number: int) -> bool:
+        return self._position(frame_number) >= 0
+
+    def _position(self, frame_number: int) -> int:
+        position = int(np.searchsorted(self.frames, frame_number))
+        if position < len(self.frames) and self.frames[position] == frame_number:
+            return position
+        return -1
+
+    def get_frame(self, frame_number: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the boxes of shape (boxes, 4) and the scores of a frame."""
+        position = self._position(frame_number)
+        if position < 0:
+            return self.boxes[:0], self.scores[:0]
+        rows = slice(self.starts[position], self.starts[position] + self.counts[position])
+        return self.boxes[rows], self.scores[rows]
+
+    def filter(self, min_score: float) -> "FrameBoxes":
+        """Return the boxes with a score above `min_score`, in one vectorized mask."""
+        keep = self.scores > min_score
+        box_frames = np.repeat(self.frames, self.counts)
+        return FrameBoxes(box_frames[keep], self.boxes[keep], self.scores[keep])
+
+
+def load_bounding_boxes(csv_path_in, chunk_lines: int = 1 << 16) -> FrameBoxes:
+    """Loads a detections file of "Frame N" lines, each followed by the
+    "x1,y1,x2,y2,score" lines of its boxes.
+
+    The file is streamed `chunk_lines` lines at a time, and the box lines of every
+    chunk are parsed in one vectorized call. Values are parsed as float64, like Python
+    floats, so the drawn scores and the MIN_SCORE cut are exactly those of `float`.
+
+    Args:
+        csv_path_in (str): The path to the detections file.
+        chunk_lines (int, optional): Lines per chunk. Defaults to 65536.
+
+    Returns:
+        FrameBoxes: The boxes indexed by frame.
+    """
+    frame_chunks, box_chunks = [], []
+    current_frame: Optional[int] = None
+    with open(csv_path_in, "r", encoding="utf-8") as file:
+        while True:
+            lines = list(islice(file, chunk_lines))
+            if not lines:
+                break
+            is_header = np.fromiter(
+                (line.startswith(FRAME_PREFIX) for line in lines), bool, len(lines)
+            )
+            is_box = ~is_header & np.fromiter(
+                (bool(line.strip()) for line in lines), bool, len(lines)
+            )
+            header_frames = [
+                int(line[len(FRAME_PREFIX) :])
+                for line, header in zip(lines, is_header)
+                if header
+            ]
+            # Frame of every line: the last header before it, or the one of the last chunk
+            line_frames = np.array(
+                [-1 if current_frame is None else current_frame, *header_frames],
+                dtype=np.int64,
+            )[np.cumsum(is_header)]
+            if header_frames:
+                current_frame = header_frames[-1]
+
+            is_box &= line_frames >= 0  # Lines before the first frame
+            if not is_box.any():
+                continue
+            rows = np.loadtxt(
+                [line for line, box in zip(lines, is_box) if box],
+                delimiter=",",
+                dtype=np.float64,
+                ndmin=2,
+            )
+            frame_chunks.append(line_frames[is_box])
+            box_chunks.append(rows[:, :5])
+
+    if not box_chunks:
+        return FrameBoxes(
+            np.empty(0, np.int64), np.empty((0, 4), np.float64), np.empty(0, np.float64)
+        )
+    rows = np.concatenate(box_chunks)
+    return FrameBoxes(np.concatenate(frame_chunks), rows[:, :4], rows[:, 4])
 
 
 class VideoBoundingBoxProcessor:
@@ -15,13 +133,21 @@ class VideoBoundingBoxProcessor:
         video_path_out (str): The path where the processed video will be saved.
         cap (cv2.VideoCapture): A cv2 VideoCapture object.
         out (cv2.VideoWriter): A cv2 VideoWriter object.
-        frames_data (dict): A dictionary containing bounding box data per frame.
+        frames_data (FrameBoxes): Bounding boxes with a score above MIN_SCORE per frame.
+        encoder (VideoEncoderSettings): The encoder of the processed video.
     """
 
-    def __init__(self, video_path_in, csv_path_in, video_path_out):
+    def __init__(
+        self,
+        video_path_in,
+        csv_path_in,
+        video_path_out,
+        encoder: Optional[VideoEncoderSettings] = None,
+    ):
         self.video_path_in = video_path_in
         self.csv_path_in = csv_path_in
         self.video_path_out = video_path_out
+        self.encoder = encoder or VideoEncoderSettings()
         self.cap = None
         self.frames_data = None
 
@@ -32,55 +158,38 @@ class VideoBoundingBoxProcessor:
             raise FileNotFoundError(f"Failed to find video: {self.video_path_in}")
 
     def load_csv_data(self):
-        """Loads bounding box data from the CSV file."""
-        with open(self.csv_path_in, "r", encoding="utf-8") as file:
-            csv_data = file.read()
-
-        frames_data = csv_data.split("Frame ")[1:]
-        self.frames_data = {
-            int(frame.split("\n")[0]): frame.split("\n")[1:-1] for frame in frames_data
-        }
+        """Loads bounding box data from the CSV file, parsed and filtered once."""
+        self.frames_data = load_bounding_boxes(self.csv_path_in).filter(MIN_SCORE)
+
+    def draw_bounding_boxes(self, frame_index, frame):
+        """Draws the bounding boxes of a frame (CSV frames are numbered from 1)."""
+        boxes, scores = self.frames_data.get_frame(frame_index + 1)
+        for (x1, y1, x2, y2), score in zip(boxes.astype(np.int64).tolist(), scores):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(
+                frame,
+                f"{score:.2f}",
+                (x1, y1 - 10),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.5,
+                (255, 0, 0),
+                1,
+            )
+        return frame
 
     def process_frames(self):
-        """Processes each frame, drawing bounding boxes where specified."""
+        """Processes each frame, drawing bounding boxes where specified.
+        Decoding, drawing and encoding run in a threaded pipeline (see `src.data.video_pipeline`).
+        """
 
         output_dir = os.path.dirname(self.video_path_out)
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
         fps, width, height = _get_video_params(self.video_path_in)
-        avi_writer = _video_writer(self.video_path_out, fps, width, height)
-
-        frame_number = 0
-        while self.cap.isOpened():
-            ret, frame = self.cap.read()
-            if not ret:
-                break
+        avi_writer = _video_writer(self.video_path_out, fps, width, height, self.encoder)
 
-            frame_number += 1
-
-            if frame_number in self.frames_data:
-                for bbox_line in self.frames_data[frame_number]:
-                    x1, y1, x2, y2, score = map(float, bbox_line.split(","))
-                    if score > 0.5:
-                        cv2.rectangle(
-                            frame,
-                            (int(x1), int(y1)),
-                            (int(x2), int(y2)),
-                            (0, 255, 0),
-                            2,
-                        )
-                        cv2.putText(
-                            frame,
-                            f"{score:.2f}",
-                            (int(x1), int(y1) - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            0.5,
-                            (255, 0, 0),
-                            1,
-                        )
-
-            avi_writer.write(frame)
+        run_video_pipeline(self.cap, self.draw_bounding_boxes, avi_writer)
         avi_writer.release()
 
     def release_resources(self):
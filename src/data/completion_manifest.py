@@ -0,0 +1,147 @@
+"""The module provides a manifest of the videos whose keypoints were already extracted.
+
+The manifest lets an interrupted or repeated auto-labeling run skip the videos that are
+up to date and process only new, changed or failed ones. Videos and outputs are recorded
+by their paths relative to the folder of the manifest, so a run from another working
+directory, with absolute paths or on a moved data root finds the same entries.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import time
+from typing import Dict, Optional, Union
+
+from src.utils.paths import relative_key
+MANIFEST_NAME = ".completion_manifest.json"
+
+PathLike = Union[str, pathlib.Path]
+
+
+def _file_sha1(path: PathLike, chunk_size: int = 1024 * 1024) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class CompletionManifest:
+    """A JSON file with an entry per processed video, keyed by the video path relative
+    to the folder of the manifest.
+
+    An entry records the source size and mtime (or SHA-1 with `use_hash`), the model,
+    the confidence threshold, the frame stride, the motion threshold, the output path,
+    the rendered video (of a fused run) and whether the video succeeded.
+    The file is rewritten atomically after every update, so it survives a crash.
+    """
+
+    def __init__(self, path_to_manifest: PathLike, use_hash: bool = False):
+        self.path_to_manifest = pathlib.Path(path_to_manifest)
+        self.use_hash = use_hash
+        self.entries: Dict[str, dict] = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path_to_manifest, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self) -> None:
+        self.path_to_manifest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path_to_manifest.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path_to_manifest)
+
+    def _key(self, path: PathLike) -> str:
+        """The path of a video or an output relative to the folder of the manifest."""
+        return relative_key(path, self.path_to_manifest.parent)
+
+    def _source(self, path_to_video_file_in: PathLike) -> dict:
+        stat = os.stat(path_to_video_file_in)
+        source = {"size": stat.st_size}
+        if self.use_hash:
+            source["sha1"] = _file_sha1(path_to_video_file_in)
+        else:
+            source["mtime"] = stat.st_mtime
+        return source
+
+    def is_up_to_date(
+        self,
+        path_to_video_file_in: PathLike,
+        path_to_keypoints_out: PathLike,
+        path_to_model: str,
+        conf: float,
+        stride: int = 1,
+        motion_threshold: float = 0.0,
+        resolution: Optional[str] = None,
+        path_to_video_file_out: Optional[PathLike] = None,
+    ) -> bool:
+        """Checks whether the video was processed successfully with the same source,
+        model, confidence, stride, motion threshold and resolution preference,
+        and its output is still there. With `path_to_video_file_out`, the video with
+        keypoints must have been rendered there too.
+        """
+        entry = self.entries.get(self._key(path_to_video_file_in))
+        if entry is None or entry["status"] != "done":
+            return False
+        return (
+            entry["model"] == str(path_to_model)
+            and entry["conf"] == conf
+            and entry.get("stride", 1) == stride
+            and entry.get("motion_threshold", 0.0) == motion_threshold
+            and entry.get("resolution") == resolution
+            and entry["output"] == self._key(path_to_keypoints_out)
+            and (not entry["has_output"] or os.path.exists(path_to_keypoints_out))
+            and (
+                path_to_video_file_out is None
+                or entry.get("video_output") == self._key(path_to_video_file_out)
+                and os.path.exists(path_to_video_file_out)
+            )
+            and entry["source"] == self._source(path_to_video_file_in)
+        )
+
+    def mark_done(
+        self,
+        path_to_video_file_in: PathLike,
+        path_to_keypoints_out: PathLike,
+        path_to_model: str,
+        conf: float,
+        stride: int = 1,
+        motion_threshold: float = 0.0,
+        resolution: Optional[str] = None,
+        path_to_video_file_out: Optional[PathLike] = None,
+    ) -> None:
+        """Records a successfully processed video, and its video with keypoints if rendered."""
+        self.entries[self._key(path_to_video_file_in)] = {
+            "status": "done",
+            "source": self._source(path_to_video_file_in),
+            "model": str(path_to_model),
+            "conf": conf,
+            "stride": stride,
+            "motion_threshold": motion_threshold,
+            "resolution": resolution,
+            "output": self._key(path_to_keypoints_out),
+            # No output is written for a video without keypoints
+            "has_output": os.path.exists(path_to_keypoints_out),
+            "video_output": (
+                None
+                if path_to_video_file_out is None
+                else self._key(path_to_video_file_out)
+            ),
+            "finished_at": time.time(),
+        }
+        self._save()
+
+    def mark_failed(
+        self, path_to_video_file_in: PathLike, error: Optional[str] = None
+    ) -> None:
+        """Records a failed video, so the next run processes it again."""
+        self.entries[self._key(path_to_video_file_in)] = {
+            "status": "failed",
+            "error": error,
+            "finished_at": time.time(),
+        }
+        self._save()
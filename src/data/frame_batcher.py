@@ -0,0 +1,209 @@
+"""The module provides batched keypoints inference over frames of several videos at once."""
+import os
+import pathlib
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.data.keypoints_handler import result_to_keypoints
+from src.data.keypoints_store import open_keypoints_appender
+from src.data.person_tracker import PersonTracker
+from src.data.video_handler import _read_video_frames
+from src.utils.loggers import setup_logger
+from src.utils.timing import StageTimer, get_timer
+
+
+@dataclass(eq=False)
+class _VideoStream:
+    """Frames of a video that are being batched and the output of its keypoints."""
+
+    path_to_video_file_in: pathlib.Path
+    path_to_keypoints_out: pathlib.Path
+    frames: Iterator[Tuple[int, np.ndarray]] = field(init=False)
+    appender: Optional[object] = None
+    exhausted: bool = False
+    pending_frames: int = 0
+    opened_at: float = field(default_factory=time.perf_counter)
+    tracker: PersonTracker = field(default_factory=PersonTracker)
+    error: Optional[str] = None
+
+    def __post_init__(self):
+        self.frames = _read_video_frames(self.path_to_video_file_in)
+
+
+class CrossVideoFrameBatcher:
+    """Runs a pose model on fixed-size batches of frames pulled from several videos at once.
+
+    Up to `max_open_videos` videos are read round-robin, so short clips fill the batches
+    together, and every result is routed back to the keypoints output of its video
+    with its frame number. Persons are tracked per video, so "Person" is a track ID.
+    A video that fails (its output cannot be written, or the model fails on its frames)
+    is closed and reported, the other videos go on.
+    With a `timer`, the frame latency is the time of its batch split evenly between
+    the frames of the batch.
+    """
+
+    def __init__(
+        self,
+        model,
+        batch_size: int = 16,
+        max_open_videos: int = 4,
+        conf: float = 0.30,
+        log_file: Optional[str] = "loggs/frame_batcher.log",
+        timer: Optional[StageTimer] = None,
+    ):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_open_videos = max_open_videos
+        self.conf = conf
+        self.timer = get_timer(timer)
+        self.logger = setup_logger(
+            f"{__name__}.{self.__class__.__name__}", "INFO", log_file
+        )
+
+    def run(
+        self,
+        tasks: List[Tuple[pathlib.Path, pathlib.Path]],
+        on_video_done: Optional[Callable[[pathlib.Path, pathlib.Path], None]] = None,
+        on_video_failed: Optional[Callable[[pathlib.Path, str], None]] = None,
+    ) -> int:
+        """Extracts keypoints from the videos.
+
+        Args:
+            tasks (List[Tuple[pathlib.Path, pathlib.Path]]): (input video, keypoints output)
+                pairs. The output is a CSV file or a keypoints store, by its suffix.
+            on_video_done (Optional[Callable[[pathlib.Path, pathlib.Path], None]], optional):
+                Called with the task of every video once its keypoints are written.
+            on_video_failed (Optional[Callable[[pathlib.Path, str], None]], optional):
+                Called with the input video and the error of every failed video.
+
+        Returns:
+            int: The number of processed frames.
+        """
+        waiting = deque(tasks)
+        active: List[_VideoStream] = []
+        batch: List[Tuple[_VideoStream, int, np.ndarray]] = []
+        num_frames = 0
+        batch_start = time.perf_counter()
+
+        while waiting or active:
+            while waiting and len(active) < self.max_open_videos:
+                active.append(_VideoStream(*waiting.popleft()))
+
+            # Round-robin over the open videos until the batch is full
+            for stream in active:
+                if len(batch) >= self.batch_size:
+                    break
+                with self.timer.stage("decode"):
+                    next_frame = next(stream.frames, None)
+                if next_frame is None:
+                    stream.exhausted = True
+                    continue
+                frame_number, frame = next_frame
+                batch.append((stream, frame_number, frame))
+                stream.pending_frames += 1
+
+            all_exhausted = all(stream.exhausted for stream in active)
+            if len(batch) >= self.batch_size or (all_exhausted and batch):
+                num_frames += self._run_batch(batch)
+                self.timer.record_frames(time.perf_counter() - batch_start, len(batch))
+                batch = []
+                batch_start = time.perf_counter()
+
+            for stream in [s for s in active if s.error is not None]:
+                self._fail_stream(stream)
+                active.remove(stream)
+                batch = [item for item in batch if item[0] is not stream]
+                if on_video_failed is not None:
+                    on_video_failed(stream.path_to_video_file_in, stream.error)
+
+            for stream in [s for s in active if s.exhausted and not s.pending_frames]:
+                self._close_stream(stream)
+                active.remove(stream)
+                self.timer.add_video(
+                    stream.path_to_video_file_in, time.perf_counter() - stream.opened_at
+                )
+                if on_video_done is not None:
+                    on_video_done(
+                        stream.path_to_video_file_in, stream.path_to_keypoints_out
+                    )
+
+        return num_frames
+
+    def _infer(self, batch: List[Tuple[_VideoStream, int, np.ndarray]]) -> list:
+        """Runs the model on a batch. If it fails, runs it on the frames of every video
+        of the batch separately, so only the videos whose frames fail get an error.
+
+        Returns:
+            list: The result of every frame of the batch, None for the failed videos.
+        """
+        frames = [frame for _, _, frame in batch]
+        try:
+            return list(self.model(frames, conf=self.conf, verbose=False))
+        except Exception as exc:  # pylint: disable=broad-except
+            streams = {stream for stream, _, _ in batch}
+            if len(streams) == 1:
+                next(iter(streams)).error = f"{type(exc).__name__}: {exc}"
+                return [None] * len(batch)
+        results = [None] * len(batch)
+        for stream in streams:
+            positions = [i for i, item in enumerate(batch) if item[0] is stream]
+            stream_results = self._infer([batch[i] for i in positions])
+            for position, result in zip(positions, stream_results):
+                results[position] = result
+        return results
+
+    def _run_batch(self, batch: List[Tuple[_VideoStream, int, np.ndarray]]) -> int:
+        """Runs the model on a batch and appends the keypoints to the outputs of the videos."""
+        results = self._infer(batch)
+        for (stream, frame_number, _), frame_data in zip(batch, results):
+            stream.pending_frames -= 1
+            if stream.error is not None:
+                continue
+            try:
+                self._append_result(stream, frame_number, frame_data)
+            except Exception as exc:  # pylint: disable=broad-except
+                stream.error = f"{type(exc).__name__}: {exc}"
+        with self.timer.stage("write"):
+            for stream in {stream for stream, _, _ in batch}:
+                if stream.appender is not None and stream.error is None:
+                    stream.appender.flush()
+        return len(batch)
+
+    def _append_result(self, stream: _VideoStream, frame_number: int, frame_data) -> None:
+        """Appends the keypoints of a frame result to the output of its video."""
+        self.timer.add_model_speed(frame_data)
+        with self.timer.stage("keypoint_extraction"):
+            frame_keypoints = result_to_keypoints(frame_number, frame_data)
+        if not len(frame_keypoints):
+            return
+        with self.timer.stage("tracking"):
+            person_ids = stream.tracker.update(frame_number, frame_keypoints)
+        with self.timer.stage("write"):
+            if stream.appender is None:
+                stream.appender = open_keypoints_appender(stream.path_to_keypoints_out)
+            stream.appender.append(frame_number, frame_keypoints, person_ids=person_ids)
+
+    def _fail_stream(self, stream: _VideoStream) -> None:
+        """Closes the output of a failed video as incomplete and logs the error."""
+        if stream.appender is not None:
+            try:
+                stream.appender.close(complete=False)
+            except OSError:
+                pass
+        stream.frames.close()
+        self.logger.error(
+            f"Failed to process {stream.path_to_video_file_in}: {stream.error}"
+        )
+
+    def _close_stream(self, stream: _VideoStream) -> None:
+        if stream.appender is None:
+            video_file, _ = os.path.splitext(stream.path_to_keypoints_out)
+            self.logger.warning(f"No keypoints extracted from '{video_file}'")
+        else:
+            with self.timer.stage("write"):
+                stream.appender.close()
+            self.logger.info(f"Success for the file {stream.path_to_keypoints_out}")
@@ -0,0 +1,19 @@
+"""The module converts keypoints CSV files to columnar keypoints stores."""
+
+from pathlib import Path
+
+from src.data.keypoints_factories import convert_csv_keypoints_factory
+from src.load_config import load_config
+
+
+def main():
+    config = load_config()
+    path_to_data_root = Path(config["data"]["root"])
+    path_to_csv_keypoits_folder = path_to_data_root / config["data"]["auto_labeling"]
+    classes = config["classes"]
+
+    convert_csv_keypoints_factory(path_to_csv_keypoits_folder, classes)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,209 @@
-"""The module provides the functions to extract key points from videos and write them to CSV and AVI files."""
+"""The module provides the functions to extract key points from videos and write them to CSV, keypoints store and video files."""
 
 import glob
 import pathlib
 from pathlib import Path
-from typing import Dict, List
-
-from ultralytics.utils.torch_utils import select_device
+from typing import Dict, List, Optional, Tuple
 
+from src.data.adaptive_resolution import AdaptiveResolution
+from src.data.completion_manifest import MANIFEST_NAME, CompletionManifest
+from src.data.frame_batcher import CrossVideoFrameBatcher
 from src.data.keypoints_handler import (
     KeyPointsCSVWriter,
+    KeyPointsFusedWriter,
     KeyPointsOnlyVideoWriter,
+    KeyPointsStoreWriter,
     KeyPointsVideoWriter,
 )
+from src.data.keypoints_interpolation import StridedKeyPointsExtractor
+from src.data.keypoints_store import STORE_SUFFIX, convert_csv_to_store
+from src.data.two_stage_pose import TwoStagePoseEstimator
+from src.data.video_encoders import VideoEncoderSettings
+from src.data.video_metadata import build_video_metadata_index
+from src.models.devices import to_device
+from src.utils.timing import StageTimer, get_timer
+
+OUTPUT_SUFFIXES = {"csv": ".csv", "store": STORE_SUFFIX}
+CONF = 0.30
+
+
+def _list_videos(path_to_video_folder: pathlib.Path, class_: str) -> List[str]:
+    """Lists the MP4 and AVI videos of a class folder."""
+    mp4_videos = glob.glob("*.mp4", root_dir=path_to_video_folder / class_)
+    avi_videos = glob.glob("*.avi", root_dir=path_to_video_folder / class_)
+    return mp4_videos + avi_videos
+
+
+def _keypoints_path_out(
+    path_to_csv_keypoits_folder: pathlib.Path,
+    class_: str,
+    video: str,
+    output_format: str,
+) -> pathlib.Path:
+    """Returns the path of the keypoints output of a video for the output format."""
+    if output_format not in OUTPUT_SUFFIXES:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    file_name = Path(video).stem + OUTPUT_SUFFIXES[output_format]
+    return path_to_csv_keypoits_folder / class_ / file_name
+
+
+def list_video_tasks(
+    path_to_video_folder: pathlib.Path,
+    path_to_csv_keypoits_folder: pathlib.Path,
+    classes: Dict[str, str],
+    output_format: str = "csv",
+) -> List[Tuple[pathlib.Path, pathlib.Path]]:
+    """Lists (input video, keypoints output) paths for all videos of all classes."""
+    return [
+        (
+            path_to_video_folder / class_ / video,
+            _keypoints_path_out(
+                path_to_csv_keypoits_folder, class_, video, output_format
+            ),
+        )
+        for class_ in classes.values()
+        for video in _list_videos(path_to_video_folder, class_)
+    ]
+
+
+def _to_device(model, device: str):
+    """Moves the model to the compute device, an exported model stays as it is
+    (see `src.models.devices`). ultralytics is imported on first use.
+    """
+    from ultralytics.utils.torch_utils import select_device
+
+    return to_device(model, select_device(device))
+
+
+def open_completion_manifest(
+    path_to_csv_keypoits_folder: pathlib.Path, resume: bool = True
+) -> Optional[CompletionManifest]:
+    """Opens the completion manifest of the output folder, or returns None if `resume` is off."""
+    if not resume:
+        return None
+    return CompletionManifest(path_to_csv_keypoits_folder / MANIFEST_NAME)
+
+
+def model_path(model) -> str:
+    """Returns the weights path a YOLO model was loaded from."""
+    return str(getattr(model, "ckpt_path", None) or getattr(model, "cfg", None) or model)
+
+
+def pending_video_tasks(
+    tasks: List[Tuple[pathlib.Path, pathlib.Path]],
+    manifest: Optional[CompletionManifest],
+    path_to_model: str,
+    conf: float = CONF,
+    stride: int = 1,
+    motion_threshold: float = 0.0,
+    resolution: Optional[str] = None,
+    video_suffix: Optional[str] = None,
+) -> List[Tuple[pathlib.Path, pathlib.Path]]:
+    """Drops the tasks whose keypoints are up to date according to the manifest.
+    With `video_suffix`, the video with keypoints next to the keypoints output
+    (of a fused run) must be up to date too.
+    """
+    if manifest is None:
+        return tasks
+    return [
+        (path_in, path_out)
+        for path_in, path_out in tasks
+        if not manifest.is_up_to_date(
+            path_in,
+            path_out,
+            path_to_model,
+            conf,
+            stride,
+            motion_threshold,
+            resolution,
+            path_out.with_suffix(video_suffix) if video_suffix else None,
+        )
+    ]
+
+
+def extract_keypoints_from_video(
+    model,
+    path_to_video_file_in: pathlib.Path,
+    path_to_keypoints_out: pathlib.Path,
+    conf: float = CONF,
+    timer: Optional[StageTimer] = None,
+    stride: int = 1,
+    motion_threshold: float = 0.0,
+    imgsz: Optional[int] = None,
+) -> None:
+    """Extract keypoins from a video and write them to a CSV file or a keypoints store
+    (by the suffix of the output path). The stages are timed with the `timer`, if any.
+    `imgsz` overrides the inference resolution of the model.
+    With `stride` > 1, the model runs on every `stride`-th frame only and the keypoints
+    of the other frames are interpolated (see `src.data.keypoints_interpolation`).
+    With `motion_threshold` > 0, near-static frames reuse the keypoints of the last
+    inferred frame (see `src.data.motion_gate`). These options and a two-stage model
+    (see `src.data.two_stage_pose`) need frames decoded one by one, not a model stream.
+    """
+    timer = get_timer(timer)
+    with timer.video(path_to_video_file_in):
+        if (
+            stride > 1
+            or motion_threshold > 0
+            or isinstance(model, TwoStagePoseEstimator)
+        ):
+            extractor = StridedKeyPointsExtractor(
+                model,
+                stride,
+                conf,
+                timer=timer,
+                motion_threshold=motion_threshold,
+                imgsz=imgsz,
+            )
+            extractor.write_keypoints(path_to_video_file_in, path_to_keypoints_out)
+            return
+        model_kwargs = {} if imgsz is None else {"imgsz": imgsz}
+        results = model(
+            source=path_to_video_file_in, conf=conf, show=False, stream=True, **model_kwargs
+        )
+        if path_to_keypoints_out.suffix == STORE_SUFFIX:
+            kp_store_writer = KeyPointsStoreWriter(results, timer=timer)
+            kp_store_writer.write_keypoints_to_store(path_to_keypoints_out)
+        else:
+            kp_csv_writer = KeyPointsCSVWriter(results, timer=timer)
+            kp_csv_writer.write_keypoints_to_csv(path_to_keypoints_out)
+
+
+def extract_keypoints_at_adaptive_resolution(
+    model,
+    adaptive_resolution: AdaptiveResolution,
+    path_to_video_file_in: pathlib.Path,
+    path_to_keypoints_out: pathlib.Path,
+    timer: Optional[StageTimer] = None,
+    **kwargs,
+) -> int:
+    """Extract keypoints from a video at the resolution chosen by a probe of its first
+    frames (see `src.data.adaptive_resolution`) and log the speedup of the resolution.
+    Other keyword arguments go to `extract_keypoints_from_video`.
+
+    Returns:
+        int: The chosen resolution.
+    """
+    imgsz, probe_ms = adaptive_resolution.select(model, path_to_video_file_in)
+    # A timer of its own measures the inference time of this video only
+    video_timer = StageTimer()
+    extract_keypoints_from_video(
+        model,
+        path_to_video_file_in,
+        path_to_keypoints_out,
+        timer=video_timer,
+        imgsz=imgsz,
+        **kwargs,
+    )
+    get_timer(timer).merge(video_timer)
+    if video_timer.num_frames:
+        adaptive_resolution.log_speedup(
+            path_to_video_file_in,
+            imgsz,
+            probe_ms,
+            video_timer.totals["inference"] * 1000 / video_timer.num_frames,
+        )
+    return imgsz
 
 
 def csv_keypoints_factory(
@@ -20,8 +212,15 @@ def csv_keypoints_factory(
     path_to_csv_keypoits_folder: pathlib.Path,
     classes: Dict[str, str],
     device: str = "cpu",
+    output_format: str = "csv",
+    resume: bool = True,
+    timer: Optional[StageTimer] = None,
+    stride: int = 1,
+    motion_threshold: float = 0.0,
+    resolution: Optional[str] = None,
 ) -> None:
-    """Exctarct keypoins from videos and write them to CSV files.
+    """Exctarct keypoins from videos and write them to CSV files or keypoints stores.
+    With `resume`, videos that are up to date in the completion manifest are skipped.
 
     Args:
         model (ultralytics.models.yolo.model.YOLO): A model for keypoints extraction.
@@ -33,24 +232,220 @@ def csv_keypoints_factory(
             The classes (ex. "crossing", defence", "shot", and etc.)
             to correctly iterate over video folders.
         device (str): Compute device ('cpu' or 'cuda'). Default is 'cpu'.
+        output_format (str): 'csv' or 'store' (columnar keypoints store). Default is 'csv'.
+        resume (bool): Skip the videos that are up to date in the completion manifest.
+            Default is True.
+        timer (Optional[StageTimer]): Times the stages of every video. Default is None.
+        stride (int): Run the model on every `stride`-th frame and interpolate
+            the keypoints of the frames in between, flagged as interpolated. Default is 1.
+        motion_threshold (float): Skip the model on frames whose downscaled mean absolute
+            difference to the last inferred frame is at most this (in gray levels) and
+            reuse its keypoints, flagged as interpolated. Default is 0.0 (off).
+        resolution (Optional[str]): 'speed', 'balanced' or 'accuracy' to choose the
+            inference resolution of every video from a probe of its first frames
+            (not with a two-stage model). Default is None (the model resolution).
     """
-    device = select_device(device)
-    model = model.to(device)
+    model = _to_device(model, device)
+    if isinstance(model, TwoStagePoseEstimator):
+        resolution = None  # The crops have a resolution of their own
+    adaptive_resolution = (
+        AdaptiveResolution(resolution, conf=CONF) if resolution is not None else None
+    )
+    path_to_model = model_path(model)
+    manifest = open_completion_manifest(path_to_csv_keypoits_folder, resume)
+    tasks = list_video_tasks(
+        path_to_video_folder, path_to_csv_keypoits_folder, classes, output_format
+    )
 
-    for class_ in classes.values():
-        mp4_videos = glob.glob("*.mp4", root_dir=path_to_video_folder / class_)
-        avi_videos = glob.glob("*.avi", root_dir=path_to_video_folder / class_)
-        videos = mp4_videos + avi_videos
-        for video in videos:
-            path_to_video_file_in = path_to_video_folder / class_ / video
-            csv_file_name = Path(video).stem + ".csv"
-            path_to_csv_file_out = path_to_csv_keypoits_folder / class_ / csv_file_name
-
-            results = model(
-                source=path_to_video_file_in, conf=0.30, show=False, stream=True
+    for path_to_video_file_in, path_to_keypoints_out in pending_video_tasks(
+        tasks,
+        manifest,
+        path_to_model,
+        stride=stride,
+        motion_threshold=motion_threshold,
+        resolution=resolution,
+    ):
+        try:
+            if adaptive_resolution is not None:
+                extract_keypoints_at_adaptive_resolution(
+                    model,
+                    adaptive_resolution,
+                    path_to_video_file_in,
+                    path_to_keypoints_out,
+                    timer=timer,
+                    stride=stride,
+                    motion_threshold=motion_threshold,
+                )
+            else:
+                extract_keypoints_from_video(
+                    model,
+                    path_to_video_file_in,
+                    path_to_keypoints_out,
+                    timer=timer,
+                    stride=stride,
+                    motion_threshold=motion_threshold,
+                )
+        except Exception as exc:
+            if manifest is not None:
+                manifest.mark_failed(path_to_video_file_in, str(exc))
+            raise
+        if manifest is not None:
+            manifest.mark_done(
+                path_to_video_file_in,
+                path_to_keypoints_out,
+                path_to_model,
+                CONF,
+                stride,
+                motion_threshold,
+                resolution,
+            )
+
+
+def batched_keypoints_factory(
+    model,
+    path_to_video_folder: pathlib.Path,
+    path_to_csv_keypoits_folder: pathlib.Path,
+    classes: Dict[str, str],
+    batch_size: int = 16,
+    max_open_videos: int = 4,
+    device: str = "cpu",
+    output_format: str = "csv",
+    resume: bool = True,
+    timer: Optional[StageTimer] = None,
+) -> None:
+    """Exctarct keypoins from videos with frames of several videos batched together
+    and write them to CSV files or keypoints stores.
+    With `resume`, videos that are up to date in the completion manifest are skipped.
+    A failing video is marked failed in the manifest and does not stop the other videos.
+
+    Args:
+        model (ultralytics.models.yolo.model.YOLO): A model for keypoints extraction.
+        path_to_video_folder (pathlib.Path):
+            Path to the folder with video files.
+        path_to_csv_keypoits_folder (pathlib.Path):
+            Path to the folder where the CSV files will be stored after video processing.
+        classes (Dict[str, str]):
+            The classes (ex. "crossing", defence", "shot", and etc.)
+            to correctly iterate over video folders.
+        batch_size (int): Number of frames per inference batch. Default is 16.
+        max_open_videos (int): Number of videos read at once. Default is 4.
+        device (str): Compute device ('cpu' or 'cuda'). Default is 'cpu'.
+        output_format (str): 'csv' or 'store' (columnar keypoints store). Default is 'csv'.
+        resume (bool): Skip the videos that are up to date in the completion manifest.
+            Default is True.
+        timer (Optional[StageTimer]): Times the stages of the batches. Default is None.
+    """
+    model = _to_device(model, device)
+    path_to_model = model_path(model)
+    manifest = open_completion_manifest(path_to_csv_keypoits_folder, resume)
+    tasks = list_video_tasks(
+        path_to_video_folder, path_to_csv_keypoits_folder, classes, output_format
+    )
+
+    def on_video_done(path_to_video_file_in, path_to_keypoints_out):
+        if manifest is not None:
+            manifest.mark_done(
+                path_to_video_file_in, path_to_keypoints_out, path_to_model, CONF
+            )
+
+    def on_video_failed(path_to_video_file_in, error):
+        if manifest is not None:
+            manifest.mark_failed(path_to_video_file_in, error)
+
+    batcher = CrossVideoFrameBatcher(
+        model, batch_size, max_open_videos, CONF, timer=timer
+    )
+    batcher.run(
+        pending_video_tasks(tasks, manifest, path_to_model),
+        on_video_done,
+        on_video_failed,
+    )
+
+
+def fused_keypoints_factory(
+    model,
+    path_to_video_folder: pathlib.Path,
+    path_to_csv_keypoits_folder: pathlib.Path,
+    classes: Dict[str, str],
+    keypoints_pairs: List[List[int]],
+    auto_labeling: bool = False,
+    device: str = "cpu",
+    output_format: str = "csv",
+    encoder: Optional[VideoEncoderSettings] = None,
+    resume: bool = True,
+    timer: Optional[StageTimer] = None,
+) -> None:
+    """Extract keypoints from videos and write them to CSV files or keypoints stores
+    together with the videos with keypoints in a single pass, decoding every video only once.
+    Video parameters come from the metadata index of the video folder (see `src.data.video_metadata`).
+    With `resume`, videos that are up to date in the completion manifest are skipped.
+
+    Args:
+        model (ultralytics.models.yolo.model.YOLO): A model for keypoints extraction.
+        path_to_video_folder (pathlib.Path):
+            Path to the folder (with subfolders as classes) with video files.
+        path_to_csv_keypoits_folder (pathlib.Path):
+            Path to the folder where the keypoints and video files will be stored.
+        classes (Dict[str, str]):
+            The classes (ex. "crossing", "defence", "shot", and etc.)
+            to correctly iterate over video folders.
+        keypoints_pairs (List[List[int]]):
+            The COCO keypoint classes ("nose", "left_eye", "right_eye", and etc.)
+        auto_labeling (bool): Write only the frames with keypoints. Default is False.
+        device (str): Compute device ('cpu' or 'cuda'). Default is 'cpu'.
+        output_format (str): 'csv' or 'store' (columnar keypoints store). Default is 'csv'.
+        encoder (Optional[VideoEncoderSettings]): The encoder of the videos, it sets
+            their suffix too. Default is None (MJPG AVI).
+        resume (bool): Skip the videos that are up to date in the completion manifest.
+            Default is True.
+        timer (Optional[StageTimer]): Times the stages of every video. Default is None.
+    """
+    model = _to_device(model, device)
+    encoder = encoder or VideoEncoderSettings()
+    metadata_index = build_video_metadata_index(path_to_video_folder)
+    path_to_model = model_path(model)
+    manifest = open_completion_manifest(path_to_csv_keypoits_folder, resume)
+    tasks = list_video_tasks(
+        path_to_video_folder, path_to_csv_keypoits_folder, classes, output_format
+    )
+
+    for path_to_video_file_in, path_to_keypoints_out in pending_video_tasks(
+        tasks, manifest, path_to_model, video_suffix=encoder.suffix
+    ):
+        path_to_video_file_out = path_to_keypoints_out.with_suffix(encoder.suffix)
+        # The video encoders do not create missing folders
+        path_to_video_file_out.parent.mkdir(parents=True, exist_ok=True)
+        if auto_labeling:
+            kp_video_writer = KeyPointsOnlyVideoWriter(keypoints_pairs, encoder=encoder)
+        else:
+            kp_video_writer = KeyPointsVideoWriter(keypoints_pairs, encoder=encoder)
+
+        try:
+            with get_timer(timer).video(path_to_video_file_in):
+                results = model(
+                    source=path_to_video_file_in, conf=CONF, show=False, stream=True
+                )
+                kp_fused_writer = KeyPointsFusedWriter(
+                    results, kp_video_writer, timer=timer
+                )
+                kp_fused_writer.write_keypoints_and_video(
+                    path_to_keypoints_out,
+                    path_to_video_file_in,
+                    path_to_video_file_out,
+                    metadata_index.get(path_to_video_file_in),
+                )
+        except Exception as exc:
+            if manifest is not None:
+                manifest.mark_failed(path_to_video_file_in, str(exc))
+            raise
+        if manifest is not None:
+            manifest.mark_done(
+                path_to_video_file_in,
+                path_to_keypoints_out,
+                path_to_model,
+                CONF,
+                path_to_video_file_out=path_to_video_file_out,
             )
-            kp_csv_writer = KeyPointsCSVWriter(results)
-            kp_csv_writer.write_keypoints_to_csv(path_to_csv_file_out)
 
 
 def video_keypoints_factory(
@@ -59,25 +454,41 @@ def video_keypoints_factory(
     classes: Dict[str, str],
     keypoints_pairs: List[List[int]],
     auto_labeling: bool = False,
+    encoder: Optional[VideoEncoderSettings] = None,
 ) -> None:
-    """Writes key points from CSV to AVI files.
+    """Writes key points from CSV files or keypoints stores to video files.
+    Video parameters come from the metadata index of the video folder (see `src.data.video_metadata`).
 
     Args:
         path_to_video_folder (pathlib.Path):
             Path to the folder (with subfolders as classes) with video files
             (e.g. 'data/raw/scenes')
         path_to_csv_keypoits_folder (pathlib.Path):
-            Path to the folder (with subfolders as classes) with CSV files.
+            Path to the folder (with subfolders as classes) with CSV files
+            or keypoints stores. A store is preferred over a CSV file with the same name.
             (e.g. 'data/processed/scenes')
         classes (Dict[str, str]):
             The classes (ex. "crossing", "defence", "shot", and etc.)
             to correctly iterate over video folders.
         keypoints_pairs (List[List[int]]):
             The COCO keypoint classes ("nose", "left_eye", "right_eye", and etc.)
+        auto_labeling (bool): Write only the frames with keypoints. Default is False.
+        encoder (Optional[VideoEncoderSettings]): The encoder of the videos, it sets
+            their suffix too. Default is None (MJPG AVI).
     """
+    encoder = encoder or VideoEncoderSettings()
+    metadata_index = build_video_metadata_index(path_to_video_folder)
     for class_ in classes.values():
-        csvs = glob.glob("*.csv", root_dir=path_to_csv_keypoits_folder / class_)
-        for csv in csvs:
+        stores = glob.glob(
+            "*" + STORE_SUFFIX, root_dir=path_to_csv_keypoits_folder / class_
+        )
+        stored_stems = {Path(store).stem for store in stores}
+        csvs = [
+            csv
+            for csv in glob.glob("*.csv", root_dir=path_to_csv_keypoits_folder / class_)
+            if Path(csv).stem not in stored_stems
+        ]
+        for csv in stores + csvs:
             path_to_csv_file = path_to_csv_keypoits_folder / class_ / csv
 
             # Try .mp4 extension first
@@ -91,15 +502,37 @@ def video_keypoints_factory(
                 )
 
             path_to_video_file_out = (
-                path_to_csv_keypoits_folder / class_ / (Path(csv).stem + ".avi")
+                path_to_csv_keypoits_folder / class_ / (Path(csv).stem + encoder.suffix)
             )
 
             if auto_labeling:
-                kp_video_writer = KeyPointsOnlyVideoWriter(keypoints_pairs)
+                kp_video_writer = KeyPointsOnlyVideoWriter(
+                    keypoints_pairs, encoder=encoder
+                )
             else:
-                kp_video_writer = KeyPointsVideoWriter(keypoints_pairs)
+                kp_video_writer = KeyPointsVideoWriter(keypoints_pairs, encoder=encoder)
             kp_video_writer.write_video_with_keypoints(
                 path_to_video_file_in,
                 path_to_video_file_out,
                 path_to_csv_file,
+                metadata_index.get(path_to_video_file_in),
             )
+
+
+def convert_csv_keypoints_factory(
+    path_to_csv_keypoits_folder: pathlib.Path,
+    classes: Dict[str, str],
+) -> None:
+    """Converts existing keypoints CSV files to keypoints stores next to them.
+
+    Args:
+        path_to_csv_keypoits_folder (pathlib.Path):
+            Path to the folder (with subfolders as classes) with CSV files.
+        classes (Dict[str, str]):
+            The classes (ex. "crossing", "defence", "shot", and etc.)
+            to correctly iterate over CSV folders.
+    """
+    for class_ in classes.values():
+        csvs = glob.glob("*.csv", root_dir=path_to_csv_keypoits_folder / class_)
+        for csv in csvs:
+            convert_csv_to_store(path_to_csv_keypoits_folder / class_ / csv)
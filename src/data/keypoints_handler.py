@@ -1,20 +1,73 @@
 """The module provides the classes to handle persons' keypoints."""
-import csv
 import logging
 import os
+from typing import Iterator, List, Optional, Tuple
 
 import cv2
 import numpy as np
 
+from src.data.keypoints_store import (
+    NUM_KEYPOINTS,
+    KeyPointsCSVAppender,
+    KeyPointsStore,
+    KeyPointsStoreAppender,
+    is_keypoints_store,
+    open_keypoints_appender,
+)
+from src.data.person_tracker import PersonTracker
+from src.data.video_encoders import VideoEncoderSettings
 from src.data.video_handler import _get_video_params, _video_writer
+from src.data.video_metadata import VideoMetadata
+from src.data.video_pipeline import run_video_pipeline
 from src.utils.loggers import setup_logger
+from src.utils.timing import StageTimer, get_timer
 
 
-class KeyPointsCSVWriter:
-    """Writes keypoints coordinates to a CSV file in the following order: "Frame", "Person", "Keypoint", "X", "Y", "Prob"."""
+def result_to_keypoints(frame_number: int, frame_data) -> np.ndarray:
+    """Converts the keypoints of a model result to a float32 array of shape (persons, 17, 3)
+    with X, Y, Prob per keypoint, using one device-to-host transfer per frame.
+    """
+    # Ensure that frame_data has the 'keypoints' attribute and that it is not None
+    if not hasattr(frame_data, "keypoints") or frame_data.keypoints is None:
+        raise AttributeError(
+            f"Frame data at index {frame_number} lacks keypoints attribute or it is None."
+        )
+    # Return no persons if no keypoints are present in the current frame
+    if not frame_data.keypoints.data.numel():
+        return np.empty((0, NUM_KEYPOINTS, 3), dtype=np.float32)
+
+    frame_keypoints = frame_data.keypoints.data.cpu().numpy()
+    if (
+        frame_keypoints.ndim != 3
+        or frame_keypoints.shape[-1] < 3
+        or not np.isfinite(frame_keypoints[..., :3]).all()
+    ):
+        raise ValueError(f"Error processing keypoints at frame {frame_number}")
+
+    return frame_keypoints[..., :3].astype(np.float32, copy=False)
 
-    def __init__(self, results: str):
+
+class KeyPointsCSVWriter:
+    """Writes keypoints coordinates to a CSV file in the following order: "Frame", "Person", "Keypoint", "X", "Y", "Prob".
+
+    Keypoints are streamed from the results and flushed to the output every `chunk_size`
+    frames, so memory does not grow with the video length and a partial output survives a crash.
+    With `track_persons`, "Person" is the ID of the person's track across the frames of the
+    video (see `src.data.person_tracker.PersonTracker`) rather than its position in the frame.
+    With a `timer`, decoding, model stages, keypoint extraction, tracking and writing are timed.
+    """
+
+    def __init__(
+        self,
+        results: str,
+        chunk_size: int = 100,
+        timer: Optional[StageTimer] = None,
+        track_persons: bool = True,
+    ):
         self.results = results
+        self.chunk_size = chunk_size
+        self.timer = get_timer(timer)
+        self.tracker = PersonTracker() if track_persons else None
         self.warning_logger, self.info_logger = self._configure_logger()
 
     def _configure_logger(self) -> tuple[logging.Logger, logging.Logger]:
@@ -30,149 +83,187 @@ class KeyPointsCSVWriter:
         )
         return warning_logger, info_logger
 
+    def _frame_keypoints(self, frame_number: int, frame_data) -> np.ndarray:
+        """Converts the keypoints of a frame to a float32 array of shape (persons, 17, 3)."""
+        try:
+            return result_to_keypoints(frame_number, frame_data)
+        except ValueError as err:
+            self.warning_logger.warning(str(err))
+            raise
+
+    def _person_ids(
+        self, frame_number: int, frame_keypoints: np.ndarray
+    ) -> Optional[np.ndarray]:
+        """Returns the track IDs of the persons of a frame, None without tracking."""
+        if self.tracker is None:
+            return None
+        with self.timer.stage("tracking"):
+            return self.tracker.update(frame_number, frame_keypoints)
+
+    def iter_keypoints_from_frames(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yields keypoints of each frame as soon as the results produce it.
+        Frames without keypoints are skipped.
+
+        Yields:
+            Tuple[int, np.ndarray]: The frame number and a float32 array of shape
+                                    (persons, 17, 3) with X, Y, Prob per keypoint.
+        """
+        for frame_number, frame_data in enumerate(self.timer.iter_results(self.results)):
+            with self.timer.stage("keypoint_extraction"):
+                frame_keypoints = self._frame_keypoints(frame_number, frame_data)
+            self.timer.end_frame()
+            if len(frame_keypoints):
+                yield frame_number, frame_keypoints
+
     def extract_keypoints_from_frames(self) -> list:
-        """Extracts keypoints from a frame for each person detected."""
-        keypoints_list = []
-        for frame_number, frame_data in enumerate(self.results):
-            # Ensure that frame_data has the 'keypoints' attribute and that it is not None
-            if not hasattr(frame_data, "keypoints") or frame_data.keypoints is None:
-                raise AttributeError(
-                    f"Frame data at index {frame_number} lacks keypoints attribute or it is None."
-                )
-            # Continue to next iteration if no keypoints are present in the current frame
-            if not frame_data.keypoints.data.numel():
-                continue
-
-            frame_keypoints = []  # List to hold all person keypoints for this frame
-            for person in frame_data.keypoints.data:
-                if person.shape[0] == 0:
-                    continue  # Skip empty person data
-
-                person_keypoints = []  # List to hold this person's keypoints
-                for point in person:
-                    try:
-                        x, y = map(int, point[:2])
-                        prob = float(point[2])
-                    except ValueError as err:
-                        error_message = (
-                            f"Error processing keypoints at frame {frame_number}"
-                        )
-                        self.warning_logger.warning(error_message)
-                        raise ValueError(
-                            f"Error processing keypoints at frame {frame_number}"
-                        ) from err
+        """Extracts keypoints from a frame for each person detected.
 
-                    person_keypoints.append((x, y, prob))
-                frame_keypoints.append((person_keypoints))
-            keypoints_list.append((frame_number, frame_keypoints))
-        return keypoints_list
+        Returns:
+            list: (frame_number, keypoints) tuples, where keypoints is a float32 array
+                  of shape (persons, 17, 3) with X, Y, Prob per keypoint.
+        """
+        return list(self.iter_keypoints_from_frames())
+
+    def iter_keypoints_chunks(self) -> Iterator[List[Tuple[int, np.ndarray]]]:
+        """Yields the keypoints of at most `chunk_size` frames at a time."""
+        chunk = []
+        for frame_keypoints in self.iter_keypoints_from_frames():
+            chunk.append(frame_keypoints)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _write_keypoints(self, path_out, appender_class) -> None:
+        """Streams keypoints to the output chunk by chunk.
+        The output is created on the first frame with keypoints.
+        """
+        appender = None
+        complete = False
+        try:
+            for chunk in self.iter_keypoints_chunks():
+                person_ids = [
+                    self._person_ids(frame_number, frame_keypoints)
+                    for frame_number, frame_keypoints in chunk
+                ]
+                with self.timer.stage("write"):
+                    if appender is None:
+                        appender = appender_class(path_out)
+                    for (frame_number, frame_keypoints), ids in zip(chunk, person_ids):
+                        appender.append(frame_number, frame_keypoints, person_ids=ids)
+                    appender.flush()
+            complete = True
+        except IOError as err:
+            raise IOError(f"Error writing to {path_out}: {err}") from err
+        finally:
+            if appender is not None:
+                with self.timer.stage("write"):
+                    appender.close(complete=complete)
 
-    def write_keypoints_to_csv(self, csv_path_out) -> None:
-        """Writes keypoints to a CSV file."""
-        keypoints_list = self.extract_keypoints_from_frames()
-        if not keypoints_list:
-            video_file, _ = os.path.splitext(csv_path_out)
+        if appender is None:
+            video_file, _ = os.path.splitext(path_out)
             warning_message = f"No keypoints extracted from the'{video_file}'"
             self.warning_logger.warning(warning_message)
         else:
-            try:
-                with open(csv_path_out, mode="w", newline="", encoding="utf-8") as file:
-                    csv_writer = csv.writer(file)
-                    csv_writer.writerow(
-                        ["Frame", "Person", "Keypoint", "X", "Y", "Prob"]
-                    )
-                    for frame_number, person_keypoints_list in keypoints_list:
-                        for person_index, person_keypoints in enumerate(
-                            person_keypoints_list
-                        ):
-                            for keypoint_index, keypoint in enumerate(person_keypoints):
-                                csv_writer.writerow(
-                                    [
-                                        frame_number,
-                                        person_index,
-                                        keypoint_index,
-                                        *keypoint,
-                                    ]
-                                )
-                success_message = f"Succsess for the file {csv_path_out}"
-                self.info_logger.info(success_message)
-            except IOError as err:
-                raise IOError(f"Error writing to {csv_path_out}: {err}") from err
+            success_message = f"Succsess for the file {path_out}"
+            self.info_logger.info(success_message)
 
+    def write_keypoints_to_csv(self, csv_path_out) -> None:
+        """Writes keypoints to a CSV file chunk by chunk."""
+        self._write_keypoints(csv_path_out, KeyPointsCSVAppender)
+
+
+class KeyPointsStoreWriter(KeyPointsCSVWriter):
+    """Writes keypoints coordinates to a columnar keypoints store (see `src.data.keypoints_store`)."""
+
+    def write_keypoints_to_store(self, store_path_out) -> None:
+        """Writes keypoints to a keypoints store chunk by chunk."""
+        self._write_keypoints(store_path_out, KeyPointsStoreAppender)
 
-class KeyPointsVideoWriter:
-    """Apply keypoints to a video. The video were processed before, keypoints were extracted stored in a CSV file."""
 
-    def __init__(self, keypoints_pairs):
+class KeyPointsVideoWriter:
+    """Apply keypoints to a video. The video were processed before, keypoints were extracted stored in a CSV file.
+
+    The pairs of keypoints to connect are validated once. Every frame is drawn with two
+    `cv2.polylines` calls, one for the joints and one for the limbs of all persons,
+    over the joints with a probability of at least `min_prob`.
+    Videos are written with the `encoder` (MJPG AVI by default).
+    """
+
+    JOINT_COLOR = (0, 0, 255)
+    JOINT_RADIUS = 3
+    LIMB_COLOR = (0, 255, 0)
+    LIMB_THICKNESS = 2
+
+    def __init__(
+        self,
+        keypoints_pairs,
+        min_prob: float = 0.5,
+        encoder: Optional[VideoEncoderSettings] = None,
+    ):
         self.keypoints_pairs = keypoints_pairs
+        self.min_prob = min_prob
+        self.encoder = encoder or VideoEncoderSettings()
         self.logger = self._configure_logger()
+        self.pairs = self._validate_pairs(keypoints_pairs)
+
+    def _validate_pairs(self, keypoints_pairs) -> np.ndarray:
+        """Returns the pairs of keypoint indices within bounds as an array of shape (pairs, 2)."""
+        pairs = np.asarray(keypoints_pairs, dtype=np.int64).reshape(-1, 2)
+        in_bounds = ((pairs >= 0) & (pairs < NUM_KEYPOINTS)).all(axis=1)
+        if not in_bounds.all():
+            error_message = (
+                f"Skipping lines for out-of-bounds indices: {pairs[~in_bounds].tolist()}"
+            )
+            self.logger.error(error_message)
+        return pairs[in_bounds]
 
     def _configure_logger(self) -> logging.Logger:
         logger = setup_logger(f"{__name__}.{self.__class__.__name__}")
         return logger
 
-    def read_keypoints_from_csv(self, csv_path_in) -> dict:
-        """Read the keypoints from a CSV file.
+    def read_keypoints_from_csv(self, csv_path_in) -> KeyPointsStore:
+        """Read the keypoints from a CSV file or a keypoints store.
         The CSV file must have the fillowing structure: "Frame", "Person", "Keypoint", "X", "Y", "Prob".
+        A CSV file is loaded in one vectorized pass, a keypoints store is opened memory-mapped.
+
+        Returns:
+            KeyPointsStore: Keypoints as contiguous arrays with a frame index.
         """
-        keypoints_dict = {}
-        try:
-            with open(csv_path_in, mode="r", newline="", encoding="utf-8") as csvfile:
-                csv_reader = csv.reader(csvfile)
-                next(csv_reader)  # skip header
-                for row in csv_reader:
-                    try:
-                        frame_index, person_index, keypoint_index, x, y, prob = list(
-                            map(int, row[:5])
-                        ) + [float(row[-1])]
-                    except ValueError as err:
-                        raise ValueError(
-                            f"Error processing row {row} in CSV: {err}"
-                        ) from err
-
-                    frame_keypoints = keypoints_dict.get(frame_index, {})
-                    person_keypoints = frame_keypoints.get(person_index, [])
-                    person_keypoints.append((keypoint_index, x, y, prob))
-                    frame_keypoints[person_index] = person_keypoints
-                    keypoints_dict[frame_index] = frame_keypoints
-
-        except FileNotFoundError as err:
-            raise FileNotFoundError(
-                f"The specified CSV file {csv_path_in} was not found."
-            ) from err
-        return keypoints_dict
+        if not is_keypoints_store(csv_path_in):
+            return KeyPointsStore.from_csv(csv_path_in)
+
+        keypoints_store = KeyPointsStore.open(csv_path_in)
+        if not keypoints_store.complete:
+            warning_message = f"The keypoints store {csv_path_in} is incomplete"
+            self.logger.warning(warning_message)
+        return keypoints_store
 
     def write_keypoints_on_frame(self, frame, frame_keypoints) -> np.ndarray:
         """Overlay keypoints onto a video frame.
 
         Args:
             frame (np.ndarray): Video frame on which keypoints are to be drawn.
-            frame_keypoints (dict): Dictionary containing the keypoints for the frame.
+            frame_keypoints (np.ndarray): Keypoints of the frame, shape (persons, 17, 3).
 
         Returns:
             np.ndarray: The frame with keypoints drawn on it.
         """
-        for person_keypoints in frame_keypoints.values():
-            # Draw points
-            for _, x, y, _ in person_keypoints:
-                cv2.circle(frame, (x, y), 3, (0, 0, 255), -1)
-
-            for i, j in self.keypoints_pairs:
-                # Ensure the indices are within bounds
-                if i < len(person_keypoints) and j < len(person_keypoints):
-                    _, x1, y1, _ = person_keypoints[i]
-                    _, x2, y2, _ = person_keypoints[j]
-                    cv2.line(
-                        frame,
-                        (x1, y1),
-                        (x2, y2),
-                        (0, 255, 0),
-                        2,
-                    )
-
-                else:
-                    error_message = f"Skipping line for out-of-bounds indices: {i}, {j}"
-                    self.logger.error(error_message)
+        points = frame_keypoints[..., :2].astype(np.int32)
+        visible = frame_keypoints[..., 2] >= self.min_prob
+
+        # A zero-length line as thick as the joint diameter draws the filled joint circle
+        joints = np.repeat(points[visible][:, None], 2, axis=1)
+        if len(joints):
+            cv2.polylines(
+                frame, joints, False, self.JOINT_COLOR, 2 * self.JOINT_RADIUS
+            )
+
+        # Limbs of all persons as (limbs, 2, 2) segments between visible joints
+        limbs = points[:, self.pairs][visible[:, self.pairs].all(axis=-1)]
+        if len(limbs):
+            cv2.polylines(frame, limbs, False, self.LIMB_COLOR, self.LIMB_THICKNESS)
         return frame
 
     def should_write_frame(self, frame_keypoints) -> bool:
@@ -180,47 +271,71 @@ class KeyPointsVideoWriter:
         This base method always returns True, meaning all frames are written.
 
         Args:
-            frame (np.ndarray): Video frame being processed.
-            frame_keypoints (dict): Dictionary containing the keypoints for the frame.
+            frame_keypoints (np.ndarray): Keypoints of the frame, shape (persons, 17, 3).
 
         Returns:
             bool: True if the frame should be written, False otherwise.
         """
         return True
 
+    def plan_frame_ranges(self, keypoints_store: KeyPointsStore) -> Optional[np.ndarray]:
+        """Plan the frame ranges that can contain written frames, the frames outside of
+        them are skipped without being retrieved. This base method returns None, all frames.
+
+        Args:
+            keypoints_store (KeyPointsStore): Keypoints of the video.
+
+        Returns:
+            Optional[np.ndarray]: Half-open [start, stop) frame ranges of shape (ranges, 2),
+                                  or None to process every frame.
+        """
+        return None
+
+    def process_frame(self, frame_index, frame, keypoints_store) -> Optional[np.ndarray]:
+        """Draw the keypoints of a frame, or return None if the frame should not be written."""
+        frame_keypoints = keypoints_store.get_frame(frame_index)
+        if not self.should_write_frame(frame_keypoints):
+            return None
+        return self.write_keypoints_on_frame(frame, frame_keypoints)
+
     def write_video_with_keypoints(
-        self, video_path_in, video_path_out, csv_path_in
+        self,
+        video_path_in,
+        video_path_out,
+        csv_path_in,
+        metadata: Optional[VideoMetadata] = None,
     ) -> None:
-        """Writes frames with pose estimations to an AVI video file."""
+        """Writes frames with pose estimations to a video file.
+        Decoding, drawing and encoding run in a threaded pipeline (see `src.data.video_pipeline`),
+        which only decodes the frame ranges planned by `plan_frame_ranges`.
+        The indexed `metadata` of the input video, if any, saves probing it again.
+        """
+        avi_writer, cap = None, None
         try:
-            keypoints_dict = self.read_keypoints_from_csv(csv_path_in)
-            fps, width, height = _get_video_params(video_path_in)
-            avi_writer = _video_writer(video_path_out, fps, width, height)
+            keypoints_store = self.read_keypoints_from_csv(csv_path_in)
+            fps, width, height = _get_video_params(video_path_in, metadata)
+            avi_writer = _video_writer(video_path_out, fps, width, height, self.encoder)
             cap = cv2.VideoCapture(str(video_path_in))
-            frame_index = 0
-
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break  # Break the loop if we reach the end of the video
-
-                frame_keypoints = keypoints_dict.get(frame_index, {})
-                if self.should_write_frame(frame_keypoints):
-                    frame_with_keypoints = self.write_keypoints_on_frame(
-                        frame, frame_keypoints
-                    )
-                    avi_writer.write(frame_with_keypoints)
-                frame_index += 1
+            run_video_pipeline(
+                cap,
+                lambda frame_index, frame: self.process_frame(
+                    frame_index, frame, keypoints_store
+                ),
+                avi_writer,
+                frame_ranges=self.plan_frame_ranges(keypoints_store),
+            )
 
         except Exception as exc:
             error_message = f"Error processing video {video_path_in}: {exc}"
             self.logger.error(error_message)
         finally:
             cv2.destroyAllWindows()
-            avi_writer.release()
-            cap.release()
+            if cap is not None:
+                cap.release()
+            if avi_writer is not None:
+                avi_writer.release()
 
-        if os.path.getsize(video_path_out) == 0:
+        if not os.path.exists(video_path_out) or os.path.getsize(video_path_out) == 0:
             error_message = f"The output video file {video_path_out} is empty"
             self.logger.error(error_message)
         else:
@@ -229,13 +344,101 @@ class KeyPointsVideoWriter:
 
 
 class KeyPointsOnlyVideoWriter(KeyPointsVideoWriter):
-    """Writes only the video frames containing keypoints to an AVI video file."""
+    """Writes only the video frames containing keypoints to a video file."""
 
     def should_write_frame(self, frame_keypoints):
         """
         Args:
-            frame_keypoints (dict): Dictionary containing the keypoints for the frame.
+            frame_keypoints (np.ndarray): Keypoints of the frame, shape (persons, 17, 3).
         Returns:
             bool: True if the frame contains keypoints and should be written, False otherwise.
         """
-        return any(frame_keypoints.values())
+        return len(frame_keypoints) > 0
+
+    def plan_frame_ranges(self, keypoints_store: KeyPointsStore) -> np.ndarray:
+        """
+        Args:
+            keypoints_store (KeyPointsStore): Keypoints of the video.
+        Returns:
+            np.ndarray: The runs of consecutive frames with keypoints, shape (ranges, 2).
+        """
+        return keypoints_store.frame_runs()
+
+
+class KeyPointsFusedWriter(KeyPointsCSVWriter):
+    """Writes keypoints and the video with keypoints in a single pass.
+
+    Frames are taken from `Results.orig_img`, so every video is decoded only once, by the
+    model, and keypoints go straight from the results to the rendering without a CSV round trip.
+    """
+
+    def __init__(
+        self,
+        results: str,
+        kp_video_writer: KeyPointsVideoWriter,
+        chunk_size: int = 100,
+        track_persons: bool = True,
+        timer: Optional[StageTimer] = None,
+    ):
+        super().__init__(results, chunk_size, timer, track_persons)
+        self.kp_video_writer = kp_video_writer
+
+    def write_keypoints_and_video(
+        self,
+        keypoints_path_out,
+        video_path_in,
+        video_path_out,
+        metadata: Optional[VideoMetadata] = None,
+    ) -> None:
+        """Writes keypoints to a CSV file or a keypoints store (by the path suffix)
+        and frames with pose estimations to a video file.
+        The indexed `metadata` of the input video, if any, saves probing it again.
+        """
+        fps, width, height = _get_video_params(video_path_in, metadata)
+        avi_writer = _video_writer(
+            video_path_out, fps, width, height, self.kp_video_writer.encoder
+        )
+        appender = None
+        complete = False
+        try:
+            for frame_number, frame_data in enumerate(
+                self.timer.iter_results(self.results)
+            ):
+                with self.timer.stage("keypoint_extraction"):
+                    frame_keypoints = self._frame_keypoints(frame_number, frame_data)
+                if len(frame_keypoints):
+                    person_ids = self._person_ids(frame_number, frame_keypoints)
+                    with self.timer.stage("write"):
+                        if appender is None:
+                            appender = open_keypoints_appender(keypoints_path_out)
+                        appender.append(
+                            frame_number, frame_keypoints, person_ids=person_ids
+                        )
+                        if appender.num_frames % self.chunk_size == 0:
+                            appender.flush()
+
+                if self.kp_video_writer.should_write_frame(frame_keypoints):
+                    with self.timer.stage("render"):
+                        avi_writer.write(
+                            self.kp_video_writer.write_keypoints_on_frame(
+                                frame_data.orig_img, frame_keypoints
+                            )
+                        )
+                self.timer.end_frame()
+            complete = True
+        except IOError as err:
+            raise IOError(f"Error writing to {keypoints_path_out}: {err}") from err
+        finally:
+            if appender is not None:
+                appender.close(complete=complete)
+            avi_writer.release()
+
+        if appender is None:
+            video_file, _ = os.path.splitext(keypoints_path_out)
+            warning_message = f"No keypoints extracted from '{video_file}'"
+            self.warning_logger.warning(warning_message)
+        else:
+            success_message = (
+                f"Success for the files {keypoints_path_out} and {video_path_out}"
+            )
+            self.info_logger.info(success_message)
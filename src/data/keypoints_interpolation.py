@@ -0,0 +1,178 @@
+"""The module provides keypoints inference on every N-th frame of a video.
+
+The keypoints of the skipped frames are linearly interpolated between the persons with the
+same track ID in the two surrounding inferred frames, and are flagged as interpolated
+in the output.
+Frames that a motion gate finds near-static reuse the keypoints of the last inferred frame
+and are flagged the same way.
+"""
+import os
+import pathlib
+import time
+from typing import Optional
+
+import numpy as np
+
+from src.data.keypoints_handler import result_to_keypoints
+from src.data.keypoints_store import open_keypoints_appender
+from src.data.motion_gate import MotionGate
+from src.data.person_tracker import PersonTracker
+from src.data.two_stage_pose import TwoStagePoseEstimator
+from src.data.video_handler import _read_video_frames_with_stride
+from src.utils.loggers import setup_logger
+from src.utils.timing import StageTimer, get_timer
+
+
+def interpolate_keypoints(
+    keypoints_a: np.ndarray, keypoints_b: np.ndarray, num_steps: int
+) -> np.ndarray:
+    """Linearly interpolates X, Y and Prob of matched persons for the frames between two frames.
+
+    Args:
+        keypoints_a (np.ndarray): Keypoints of the matched persons in the first frame,
+                                  shape (persons, 17, 3).
+        keypoints_b (np.ndarray): Keypoints of the same persons in the second frame.
+        num_steps (int): Number of frames between the two frames.
+
+    Returns:
+        np.ndarray: Keypoints of shape (num_steps, persons, 17, 3).
+    """
+    weights = (np.arange(1, num_steps + 1, dtype=np.float32) / (num_steps + 1))[
+        :, None, None, None
+    ]
+    return ((1 - weights) * keypoints_a[None] + weights * keypoints_b[None]).astype(
+        np.float32
+    )
+
+
+class StridedKeyPointsExtractor:
+    """Runs a pose model on every `stride`-th frame (and the last one) of a video and
+    interpolates the keypoints of the frames in between.
+
+    Persons are tracked across the inferred frames (see `src.data.person_tracker`), and
+    a person is interpolated only if its track is found in both surrounding inferred frames.
+    With `motion_threshold` > 0, the model is skipped on the frames that changed less than
+    the threshold since the last inferred frame (see `src.data.motion_gate.MotionGate`).
+    """
+
+    def __init__(
+        self,
+        model,
+        stride: int,
+        conf: float = 0.30,
+        chunk_size: int = 100,
+        timer: Optional[StageTimer] = None,
+        log_file: Optional[str] = "loggs/strided_extractor.log",
+        motion_threshold: float = 0.0,
+        imgsz: Optional[int] = None,
+    ):
+        if stride < 1:
+            raise ValueError(f"The stride must be positive, got {stride}")
+        self.model = model
+        self.stride = stride
+        self.conf = conf
+        self.motion_threshold = motion_threshold
+        # None keeps the resolution of the model
+        self.model_kwargs = {} if imgsz is None else {"imgsz": imgsz}
+        self.chunk_size = chunk_size
+        self.timer = get_timer(timer)
+        self.logger = setup_logger(
+            f"{__name__}.{self.__class__.__name__}", "INFO", log_file
+        )
+
+    def _infer(self, frame_number: int, frame: np.ndarray) -> np.ndarray:
+        start = time.perf_counter()
+        frame_data = self.model(
+            frame, conf=self.conf, verbose=False, **self.model_kwargs
+        )[0]
+        self.timer.add_model_speed(frame_data)
+        with self.timer.stage("keypoint_extraction"):
+            frame_keypoints = result_to_keypoints(frame_number, frame_data)
+        self.timer.record_frames(time.perf_counter() - start)
+        return frame_keypoints
+
+    def write_keypoints(
+        self, path_to_video_file_in: pathlib.Path, path_to_keypoints_out: pathlib.Path
+    ) -> None:
+        """Writes the inferred and interpolated keypoints of a video to a CSV file
+        (with the "Interpolated" column) or a keypoints store, by the suffix of the output path.
+        """
+        appender = None
+        complete = False
+        num_inferred, num_interpolated = 0, 0
+        previous_frame_number, previous_keypoints, previous_ids = None, None, None
+        # Tracks must survive the frames between two inferred frames
+        tracker = PersonTracker(max_gap=max(PersonTracker().max_gap, 2 * self.stride))
+        frames = _read_video_frames_with_stride(path_to_video_file_in, self.stride)
+        motion_gate = MotionGate(self.motion_threshold) if self.motion_threshold > 0 else None
+        if isinstance(self.model, TwoStagePoseEstimator):
+            self.model.reset()
+        try:
+            while True:
+                with self.timer.stage("decode"):
+                    next_frame = next(frames, None)
+                if next_frame is None:
+                    break
+                frame_number, frame = next_frame
+                with self.timer.stage("motion_gate"):
+                    reuse = motion_gate is not None and not motion_gate.should_infer(frame)
+                if reuse and previous_keypoints is not None:
+                    frame_keypoints, person_ids = previous_keypoints, previous_ids
+                    # The reused persons are still there, so their tracks stay alive
+                    tracker.keep_alive(frame_number, person_ids)
+                else:
+                    reuse = False
+                    frame_keypoints = self._infer(frame_number, frame)
+                    num_inferred += 1
+                    with self.timer.stage("tracking"):
+                        person_ids = tracker.update(frame_number, frame_keypoints)
+
+                to_append = []
+                gap = frame_number - (previous_frame_number or 0)
+                if previous_frame_number is not None and gap > 1:
+                    common_ids, matched_a, matched_b = np.intersect1d(
+                        previous_ids, person_ids, return_indices=True
+                    )
+                    interpolated = interpolate_keypoints(
+                        previous_keypoints[matched_a], frame_keypoints[matched_b], gap - 1
+                    )
+                    to_append.extend(
+                        (previous_frame_number + step + 1, keypoints, True, common_ids)
+                        for step, keypoints in enumerate(interpolated)
+                        if len(keypoints)
+                    )
+                if len(frame_keypoints):
+                    to_append.append((frame_number, frame_keypoints, reuse, person_ids))
+
+                with self.timer.stage("write"):
+                    for append_args in to_append:
+                        if appender is None:
+                            appender = open_keypoints_appender(
+                                path_to_keypoints_out, flag_interpolated=True
+                            )
+                        appender.append(*append_args)
+                        if appender.num_frames % self.chunk_size == 0:
+                            appender.flush()
+                num_interpolated += sum(args[2] for args in to_append)
+                previous_frame_number = frame_number
+                previous_keypoints, previous_ids = frame_keypoints, person_ids
+            complete = True
+        finally:
+            if appender is not None:
+                with self.timer.stage("write"):
+                    appender.close(complete=complete)
+
+        if motion_gate is not None:
+            self.logger.info(
+                f"Motion gate skipped {motion_gate.num_skipped} of {motion_gate.num_frames} "
+                f"frames of {path_to_video_file_in} "
+                f"(threshold {self.motion_threshold}, stride {self.stride})"
+            )
+        if appender is None:
+            video_file, _ = os.path.splitext(path_to_keypoints_out)
+            self.logger.warning(f"No keypoints extracted from '{video_file}'")
+        else:
+            self.logger.info(
+                f"Success for the file {path_to_keypoints_out}: inferred {num_inferred} "
+                f"frames, interpolated {num_interpolated} frames (stride {self.stride})"
+            )
@@ -1,8 +1,13 @@
-"""The module provides the pipeline to extract keypoints from videos and write them to CSV and AVI files."""
+"""The module provides the pipeline to extract keypoints from videos and write them to CSV and video files."""
 
 from pathlib import Path
 
-from src.data.keypoints_factories import csv_keypoints_factory, video_keypoints_factory
+from src.data.keypoints_factories import (
+    csv_keypoints_factory,
+    fused_keypoints_factory,
+    video_keypoints_factory,
+)
+from src.data.video_encoders import VideoEncoderSettings
 from src.load_config import load_config
 from src.models.initialize_models import initialize_yolo_model
 
@@ -18,19 +23,38 @@ def main():
     path_to_csv_keypoits_folder = path_to_data_root / config["data"]["auto_labeling"]
     classes = config["classes"]
     keypoints_pairs = config["keypoints"]["coco_pairs"]
+    output_format = config["keypoints"]["output_format"]
+    encoder = VideoEncoderSettings(**config["video"])
 
     model = initialize_yolo_model(path_to_model)
 
-    csv_keypoints_factory(
-        model, path_to_video_folder, path_to_csv_keypoits_folder, classes
-    )
-    video_keypoints_factory(
-        path_to_video_folder,
-        path_to_csv_keypoits_folder,
-        classes,
-        keypoints_pairs,
-        auto_labeling=True,
-    )
+    if config["keypoints"]["fused"]:
+        fused_keypoints_factory(
+            model,
+            path_to_video_folder,
+            path_to_csv_keypoits_folder,
+            classes,
+            keypoints_pairs,
+            auto_labeling=True,
+            output_format=output_format,
+            encoder=encoder,
+        )
+    else:
+        csv_keypoints_factory(
+            model,
+            path_to_video_folder,
+            path_to_csv_keypoits_folder,
+            classes,
+            output_format=output_format,
+        )
+        video_keypoints_factory(
+            path_to_video_folder,
+            path_to_csv_keypoits_folder,
+            classes,
+            keypoints_pairs,
+            auto_labeling=True,
+            encoder=encoder,
+        )
 
 
 if __name__ == "__main__":
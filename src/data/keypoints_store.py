@@ -0,0 +1,516 @@
+"""The module provides a columnar, memory-mapped storage format for persons' keypoints.
+
+A keypoints store is a directory with the ".kpts" suffix that holds:
+    - "keypoints.bin": float32 array of shape (rows, 17, 3) with X, Y, Prob per keypoint,
+      one row per detected person;
+    - "index.bin": int64 array of shape (frames, 3) with Frame, first row, number of persons;
+    - "flags.bin": uint8 array of shape (frames,), 1 for frames whose keypoints were
+      interpolated rather than inferred (absent in stores written before it was added);
+    - "persons.bin": int64 array of shape (rows,) with the track ID of every person, rows
+      of a frame are ordered by it (absent in older stores, where the ID is the position
+      of the person in its frame);
+    - "meta.json": format version, the number of keypoints per person and whether
+      the store was completely written.
+Both binary files are opened with numpy.memmap, so nothing is parsed when a store is read.
+Files are append-only, so a store left by an interrupted run is readable up to the last
+flushed frame.
+"""
+import csv
+import json
+import os
+import pathlib
+import warnings
+from typing import Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+STORE_SUFFIX = ".kpts"
+STORE_VERSION = 1
+NUM_KEYPOINTS = 17
+
+KEYPOINTS_FILE = "keypoints.bin"
+INDEX_FILE = "index.bin"
+FLAGS_FILE = "flags.bin"
+PERSONS_FILE = "persons.bin"
+META_FILE = "meta.json"
+
+KEYPOINTS_DTYPE = np.float32
+INDEX_DTYPE = np.int64
+FLAGS_DTYPE = np.uint8
+
+CSV_HEADER = ["Frame", "Person", "Keypoint", "X", "Y", "Prob"]
+# Optional last CSV column, 1 for the rows of interpolated frames
+INTERPOLATED_COLUMN = "Interpolated"
+
+PathLike = Union[str, pathlib.Path]
+
+
+def is_keypoints_store(path: PathLike) -> bool:
+    """Check whether the path points to a keypoints store."""
+    return pathlib.Path(path).suffix == STORE_SUFFIX
+
+
+def frame_keypoints_to_rows(
+    frame_number: int,
+    frame_keypoints: np.ndarray,
+    interpolated: Optional[bool] = None,
+    person_ids: Optional[np.ndarray] = None,
+) -> list:
+    """Convert the keypoints of a frame to CSV rows in bulk.
+
+    Args:
+        frame_number (int): Index of the frame in the video.
+        frame_keypoints (np.ndarray): Array of shape (persons, num_keypoints, 3).
+        interpolated (Optional[bool], optional): If given, an "Interpolated" value
+            (0 or 1) is added to every row. Defaults to None.
+        person_ids (Optional[np.ndarray], optional): "Person" of every person, shape
+            (persons,). Defaults to the position of the person in the frame.
+
+    Returns:
+        list: Rows "Frame", "Person", "Keypoint", "X", "Y", "Prob" with integer
+              (truncated) coordinates.
+    """
+    num_persons, num_keypoints, _ = frame_keypoints.shape
+    num_rows = num_persons * num_keypoints
+    flat_keypoints = frame_keypoints.reshape(num_rows, 3)
+    if person_ids is None:
+        person_ids = np.arange(num_persons)
+    columns = [
+        [int(frame_number)] * num_rows,
+        np.repeat(np.asarray(person_ids, dtype=np.int64), num_keypoints).tolist(),
+        np.tile(np.arange(num_keypoints), num_persons).tolist(),
+        flat_keypoints[:, 0].astype(np.int64).tolist(),
+        flat_keypoints[:, 1].astype(np.int64).tolist(),
+        flat_keypoints[:, 2].tolist(),
+    ]
+    if interpolated is not None:
+        columns.append([int(interpolated)] * num_rows)
+    return list(zip(*columns))
+
+
+def _order_by_person(
+    frame_keypoints: np.ndarray, person_ids: Optional[np.ndarray]
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Orders the persons of a frame by their IDs, the way a CSV file is read back."""
+    if person_ids is None:
+        return frame_keypoints, None
+    person_ids = np.asarray(person_ids, dtype=INDEX_DTYPE)
+    order = np.argsort(person_ids, kind="stable")
+    return frame_keypoints[order], person_ids[order]
+
+
+class KeyPointsStoreAppender:
+    """Appends per-frame keypoints to a keypoints store on disk."""
+
+    def __init__(self, store_path: PathLike, num_keypoints: int = NUM_KEYPOINTS):
+        self.store_path = pathlib.Path(store_path)
+        self.num_keypoints = num_keypoints
+        self.num_rows = 0
+        self.num_frames = 0
+
+        self.store_path.mkdir(parents=True, exist_ok=True)
+        self._write_meta(complete=False)
+        self._keypoints_file = open(self.store_path / KEYPOINTS_FILE, "wb")
+        self._index_file = open(self.store_path / INDEX_FILE, "wb")
+        self._flags_file = open(self.store_path / FLAGS_FILE, "wb")
+        self._persons_file = open(self.store_path / PERSONS_FILE, "wb")
+
+    def append(
+        self,
+        frame_number: int,
+        frame_keypoints: np.ndarray,
+        interpolated: bool = False,
+        person_ids: Optional[np.ndarray] = None,
+    ) -> None:
+        """Append the keypoints of a frame.
+
+        Args:
+            frame_number (int): Index of the frame in the video.
+            frame_keypoints (np.ndarray): Array of shape (persons, num_keypoints, 3).
+            interpolated (bool, optional): Whether the keypoints were interpolated
+                                           rather than inferred. Defaults to False.
+            person_ids (Optional[np.ndarray], optional): Track ID of every person.
+                Defaults to the position of the person in the frame.
+        """
+        frame_keypoints, person_ids = _order_by_person(frame_keypoints, person_ids)
+        frame_keypoints = np.ascontiguousarray(frame_keypoints, dtype=KEYPOINTS_DTYPE)
+        if frame_keypoints.ndim != 3 or frame_keypoints.shape[1:] != (
+            self.num_keypoints,
+            3,
+        ):
+            raise ValueError(
+                f"Expected keypoints of shape (persons, {self.num_keypoints}, 3), "
+                f"got {frame_keypoints.shape} at frame {frame_number}"
+            )
+
+        num_persons = frame_keypoints.shape[0]
+        if person_ids is None:
+            person_ids = np.arange(num_persons, dtype=INDEX_DTYPE)
+        self._persons_file.write(person_ids.tobytes())
+        self._keypoints_file.write(frame_keypoints.tobytes())
+        self._index_file.write(
+            np.array(
+                [frame_number, self.num_rows, num_persons], dtype=INDEX_DTYPE
+            ).tobytes()
+        )
+        self._flags_file.write(bytes([int(interpolated)]))
+        self.num_rows += num_persons
+        self.num_frames += 1
+
+    def flush(self) -> None:
+        """Flush the appended frames to disk, keypoints before the index referencing them."""
+        self._keypoints_file.flush()
+        self._index_file.flush()
+        self._flags_file.flush()
+        self._persons_file.flush()
+
+    def close(self, complete: bool = True) -> None:
+        """Close the binary files and write the metadata.
+
+        Args:
+            complete (bool, optional): Whether all frames of the video were appended.
+                                       Defaults to True.
+        """
+        self.flush()
+        self._keypoints_file.close()
+        self._index_file.close()
+        self._flags_file.close()
+        self._persons_file.close()
+        self._write_meta(complete=complete)
+
+    def _write_meta(self, complete: bool) -> None:
+        meta = {
+            "version": STORE_VERSION,
+            "num_keypoints": self.num_keypoints,
+            "num_frames": self.num_frames,
+            "num_rows": self.num_rows,
+            "complete": complete,
+        }
+        with open(self.store_path / META_FILE, "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+
+    def __enter__(self) -> "KeyPointsStoreAppender":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close(complete=exc_type is None)
+
+
+class KeyPointsCSVAppender:
+    """Appends per-frame keypoints to a CSV file with the structure "Frame", "Person", "Keypoint", "X", "Y", "Prob".
+    With `flag_interpolated`, an "Interpolated" column is added as the last one.
+    """
+
+    def __init__(self, csv_path: PathLike, flag_interpolated: bool = False):
+        self.csv_path = pathlib.Path(csv_path)
+        self.flag_interpolated = flag_interpolated
+        self.num_frames = 0
+        self._file = open(self.csv_path, mode="w", newline="", encoding="utf-8")
+        self._csv_writer = csv.writer(self._file)
+        self._csv_writer.writerow(
+            CSV_HEADER + [INTERPOLATED_COLUMN] if flag_interpolated else CSV_HEADER
+        )
+
+    def append(
+        self,
+        frame_number: int,
+        frame_keypoints: np.ndarray,
+        interpolated: bool = False,
+        person_ids: Optional[np.ndarray] = None,
+    ) -> None:
+        """Append the keypoints of a frame of shape (persons, num_keypoints, 3),
+        with the track ID of every person as "Person" if given.
+        """
+        frame_keypoints, person_ids = _order_by_person(frame_keypoints, person_ids)
+        self._csv_writer.writerows(
+            frame_keypoints_to_rows(
+                frame_number,
+                frame_keypoints,
+                interpolated if self.flag_interpolated else None,
+                person_ids,
+            )
+        )
+        self.num_frames += 1
+
+    def flush(self) -> None:
+        """Flush the appended frames to disk."""
+        self._file.flush()
+
+    def close(self, complete: bool = True) -> None:
+        """Close the CSV file. A CSV file has no completion marker, `complete` is ignored."""
+        self._file.close()
+
+    def __enter__(self) -> "KeyPointsCSVAppender":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close(complete=exc_type is None)
+
+
+def open_keypoints_appender(
+    path_out: PathLike, flag_interpolated: bool = False
+) -> Union[KeyPointsStoreAppender, KeyPointsCSVAppender]:
+    """Open a keypoints store or a CSV appender depending on the path suffix.
+    A store always records interpolated frames, a CSV file only with `flag_interpolated`.
+    """
+    if is_keypoints_store(path_out):
+        return KeyPointsStoreAppender(path_out)
+    return KeyPointsCSVAppender(path_out, flag_interpolated)
+
+
+class KeyPointsStore:
+    """Read-only view of the keypoints of a video.
+
+    Attributes:
+        frames (np.ndarray): Frame numbers that have keypoints, shape (frames,).
+        starts (np.ndarray): First row of each frame in `keypoints`, shape (frames,).
+        counts (np.ndarray): Number of persons in each frame, shape (frames,).
+        keypoints (np.ndarray): Keypoints of all persons, shape (rows, num_keypoints, 3).
+        interpolated (np.ndarray): Whether each frame was interpolated, shape (frames,).
+        person_ids (np.ndarray): Track ID of every person, shape (rows,).
+        complete (bool): False if the store was left by an interrupted run.
+    """
+
+    def __init__(
+        self,
+        frames: np.ndarray,
+        starts: np.ndarray,
+        counts: np.ndarray,
+        keypoints: np.ndarray,
+        complete: bool = True,
+        interpolated: Optional[np.ndarray] = None,
+        person_ids: Optional[np.ndarray] = None,
+    ):
+        self.frames = frames
+        self.starts = starts
+        self.counts = counts
+        self.keypoints = keypoints
+        self.complete = complete
+        if interpolated is None:
+            interpolated = np.zeros(len(frames), dtype=bool)
+        self.interpolated = interpolated
+        if person_ids is None:
+            # The position of every person in its frame
+            person_ids = np.arange(len(keypoints), dtype=INDEX_DTYPE) - np.repeat(
+                starts, counts
+            )
+        self.person_ids = person_ids
+        # Dense frame -> position lookup, -1 for frames without keypoints
+        self._positions = np.full(
+            int(frames.max()) + 1 if len(frames) else 0, -1, dtype=INDEX_DTYPE
+        )
+        self._positions[frames] = np.arange(len(frames), dtype=INDEX_DTYPE)
+
+    @classmethod
+    def open(cls, store_path: PathLike) -> "KeyPointsStore":
+        """Open a keypoints store memory-mapped."""
+        store_path = pathlib.Path(store_path)
+        try:
+            with open(store_path / META_FILE, "r", encoding="utf-8") as file:
+                meta = json.load(file)
+        except FileNotFoundError as err:
+            raise FileNotFoundError(
+                f"The specified keypoints store {store_path} was not found."
+            ) from err
+
+        num_keypoints = meta["num_keypoints"]
+        index = _memmap(store_path / INDEX_FILE, INDEX_DTYPE, (3,))
+        keypoints = _memmap(
+            store_path / KEYPOINTS_FILE, KEYPOINTS_DTYPE, (num_keypoints, 3)
+        )
+        # Drop the frames of an interrupted run whose keypoints did not reach the disk
+        valid_frames = int(np.sum(index[:, 1] + index[:, 2] <= len(keypoints)))
+        index = index[:valid_frames]
+        interpolated = np.zeros(valid_frames, dtype=bool)
+        if (store_path / FLAGS_FILE).exists():
+            flags = np.fromfile(store_path / FLAGS_FILE, dtype=FLAGS_DTYPE)[:valid_frames]
+            interpolated[: len(flags)] = flags.astype(bool)
+        person_ids = None
+        if (store_path / PERSONS_FILE).exists():
+            person_ids = _memmap(store_path / PERSONS_FILE, INDEX_DTYPE, ())
+            if len(person_ids) < len(keypoints):
+                person_ids = None  # Interrupted before the IDs reached the disk
+            else:
+                person_ids = person_ids[: len(keypoints)]
+        return cls(
+            index[:, 0],
+            index[:, 1],
+            index[:, 2],
+            keypoints,
+            complete=meta.get("complete", True),
+            interpolated=interpolated,
+            person_ids=person_ids,
+        )
+
+    @classmethod
+    def from_csv(cls, csv_path_in: PathLike) -> "KeyPointsStore":
+        """Load a keypoints CSV file with the structure "Frame", "Person", "Keypoint", "X", "Y", "Prob"
+        and an optional "Interpolated" column in one vectorized pass.
+        """
+        try:
+            with open(csv_path_in, "r", encoding="utf-8") as file:
+                header = file.readline().strip().split(",")
+            num_columns = len(CSV_HEADER) + (INTERPOLATED_COLUMN in header[6:7])
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)  # empty CSV file
+                rows = np.loadtxt(
+                    csv_path_in,
+                    delimiter=",",
+                    skiprows=1,
+                    usecols=range(num_columns),
+                    dtype=np.float64,
+                    ndmin=2,
+                )
+        except FileNotFoundError as err:
+            raise FileNotFoundError(
+                f"The specified CSV file {csv_path_in} was not found."
+            ) from err
+        except ValueError as err:
+            raise ValueError(f"Error processing CSV {csv_path_in}: {err}") from err
+
+        frame_column, person_column, keypoint_column = rows[:, :3].astype(INDEX_DTYPE).T
+        order = np.lexsort((keypoint_column, person_column, frame_column))
+        rows = rows[order]
+        if len(rows) % NUM_KEYPOINTS or np.any(
+            keypoint_column[order].reshape(-1, NUM_KEYPOINTS) != np.arange(NUM_KEYPOINTS)
+        ):
+            raise ValueError(
+                f"Error processing CSV {csv_path_in}: every person must have "
+                f"{NUM_KEYPOINTS} keypoints"
+            )
+
+        # X and Y are truncated to integers the same way they are written
+        keypoints = rows[:, 3:6].reshape(-1, NUM_KEYPOINTS, 3)
+        keypoints[..., :2] = np.trunc(keypoints[..., :2])
+        person_frames = frame_column[order][::NUM_KEYPOINTS]
+        frames, starts, counts = np.unique(
+            person_frames, return_index=True, return_counts=True
+        )
+        interpolated = None
+        if num_columns > len(CSV_HEADER):
+            interpolated = rows[::NUM_KEYPOINTS, 6][starts] > 0
+        return cls(
+            frames.astype(INDEX_DTYPE),
+            starts.astype(INDEX_DTYPE),
+            counts.astype(INDEX_DTYPE),
+            keypoints.astype(KEYPOINTS_DTYPE),
+            interpolated=interpolated,
+            person_ids=rows[::NUM_KEYPOINTS, 1].astype(INDEX_DTYPE),
+        )
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __contains__(self, frame_number: int) -> bool:
+        return self._position(frame_number) >= 0
+
+    def _position(self, frame_number: int) -> int:
+        if 0 <= frame_number < len(self._positions):
+            return int(self._positions[frame_number])
+        return -1
+
+    def is_interpolated(self, frame_number: int) -> bool:
+        """Check whether the keypoints of a frame were interpolated rather than inferred."""
+        position = self._position(frame_number)
+        return position >= 0 and bool(self.interpolated[position])
+
+    def get_frame(self, frame_number: int) -> np.ndarray:
+        """Return the keypoints of a frame as an array of shape (persons, num_keypoints, 3)."""
+        position = self._position(frame_number)
+        if position < 0:
+            return self.keypoints[:0]
+        start = self.starts[position]
+        return self.keypoints[start : start + self.counts[position]]
+
+    def get_frame_person_ids(self, frame_number: int) -> np.ndarray:
+        """Return the track IDs of the persons of a frame, shape (persons,)."""
+        position = self._position(frame_number)
+        if position < 0:
+            return self.person_ids[:0]
+        start = self.starts[position]
+        return self.person_ids[start : start + self.counts[position]]
+
+    def frame_runs(self) -> np.ndarray:
+        """Return the runs of consecutive frames with at least one person.
+
+        Returns:
+            np.ndarray: Half-open [start, stop) frame ranges of shape (runs, 2), sorted.
+        """
+        frames = np.sort(self.frames[self.counts > 0])
+        if not len(frames):
+            return np.empty((0, 2), dtype=INDEX_DTYPE)
+        breaks = np.flatnonzero(np.diff(frames) > 1) + 1
+        starts = frames[np.r_[0, breaks]]
+        stops = frames[np.r_[breaks - 1, len(frames) - 1]] + 1
+        return np.stack([starts, stops], axis=1).astype(INDEX_DTYPE)
+
+    def iter_tracks(self) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """Yields every track with its frames and keypoints in one pass over the rows.
+
+        Yields:
+            Tuple[int, np.ndarray, np.ndarray]: The track ID, the frame numbers of shape
+                (frames,) and the keypoints of shape (frames, num_keypoints, 3).
+        """
+        row_frames = np.repeat(self.frames, self.counts)
+        order = np.lexsort((row_frames, self.person_ids))
+        track_ids, track_starts = np.unique(self.person_ids[order], return_index=True)
+        for track_id, rows in zip(track_ids, np.split(order, track_starts[1:])):
+            yield int(track_id), row_frames[rows], self.keypoints[rows]
+
+    def write_to_store(self, store_path_out: PathLike) -> None:
+        """Write the keypoints to a keypoints store."""
+        with KeyPointsStoreAppender(store_path_out, self.keypoints.shape[1]) as appender:
+            for frame_number, interpolated in zip(self.frames, self.interpolated):
+                appender.append(
+                    int(frame_number),
+                    self.get_frame(int(frame_number)),
+                    interpolated,
+                    self.get_frame_person_ids(int(frame_number)),
+                )
+
+    def write_to_csv(self, csv_path_out: PathLike) -> None:
+        """Export the keypoints to a CSV file with the structure "Frame", "Person", "Keypoint", "X", "Y", "Prob".
+        The "Interpolated" column is added if any frame was interpolated.
+        """
+        try:
+            with KeyPointsCSVAppender(
+                csv_path_out, flag_interpolated=bool(self.interpolated.any())
+            ) as appender:
+                for frame_number, interpolated in zip(self.frames, self.interpolated):
+                    appender.append(
+                        int(frame_number),
+                        self.get_frame(int(frame_number)),
+                        interpolated,
+                        self.get_frame_person_ids(int(frame_number)),
+                    )
+        except IOError as err:
+            raise IOError(f"Error writing to {csv_path_out}: {err}") from err
+
+
+def _memmap(path: pathlib.Path, dtype, row_shape: Tuple[int, ...]) -> np.ndarray:
+    """Memory-map a binary file as an array of rows with the given shape."""
+    row_size = int(np.prod(row_shape)) * np.dtype(dtype).itemsize
+    num_rows = os.path.getsize(path) // row_size
+    if num_rows == 0:
+        return np.zeros((0, *row_shape), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(num_rows, *row_shape))
+
+
+def convert_csv_to_store(
+    csv_path_in: PathLike, store_path_out: Optional[PathLike] = None
+) -> pathlib.Path:
+    """Convert a keypoints CSV file to a keypoints store next to it.
+
+    Args:
+        csv_path_in (PathLike): Path to the CSV file with keypoints.
+        store_path_out (Optional[PathLike], optional): Path to the keypoints store.
+            Defaults to the CSV path with the ".kpts" suffix.
+
+    Returns:
+        pathlib.Path: Path to the keypoints store.
+    """
+    csv_path_in = pathlib.Path(csv_path_in)
+    if store_path_out is None:
+        store_path_out = csv_path_in.with_suffix(STORE_SUFFIX)
+    KeyPointsStore.from_csv(csv_path_in).write_to_store(store_path_out)
+    return pathlib.Path(store_path_out)
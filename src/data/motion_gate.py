@@ -0,0 +1,47 @@
+"""The module provides a cheap gate that skips pose inference on near-static frames."""
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Compares a downscaled grayscale copy of every frame with the one of the last frame
+    the model ran on. A frame whose mean absolute difference (in gray levels, 0-255) is
+    at most `threshold` is static, and the keypoints of the last inferred frame are reused.
+
+    Comparing with the last inferred frame rather than the previous one keeps a slow pan
+    from passing the gate forever; `max_skipped` bounds the run of skipped frames anyway.
+    """
+
+    def __init__(self, threshold: float, width: int = 64, max_skipped: int = 50):
+        self.threshold = threshold
+        self.width = width
+        self.max_skipped = max_skipped
+        self.num_frames = 0
+        self.num_skipped = 0
+        self._reference = None
+        self._skipped_in_row = 0
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        height = max(1, frame.shape[0] * self.width // frame.shape[1])
+        thumbnail = cv2.resize(
+            frame, (self.width, height), interpolation=cv2.INTER_AREA
+        )
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        return thumbnail.astype(np.int16)
+
+    def should_infer(self, frame: np.ndarray) -> bool:
+        """Checks whether the frame changed enough to run the model on it."""
+        self.num_frames += 1
+        thumbnail = self._thumbnail(frame)
+        if (
+            self._reference is None
+            or self._skipped_in_row >= self.max_skipped
+            or np.abs(thumbnail - self._reference).mean() > self.threshold
+        ):
+            self._reference = thumbnail
+            self._skipped_in_row = 0
+            return True
+        self._skipped_in_row += 1
+        self.num_skipped += 1
+        return False
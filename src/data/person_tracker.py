@@ -0,0 +1,191 @@
+"""The module provides a vectorized tracker that gives persons persistent IDs across frames.
+
+Detections are associated with the tracks by a similarity matrix computed in one numpy
+pass: the IoU of the keypoint boxes blended with the object keypoint similarity (OKS),
+both against the tracks moved by their constant-velocity prediction, so frame gaps
+(a stride, skipped frames) are tolerated. Pairs are accepted by rounds of mutual best
+matches, every round vectorized, so the per-frame cost stays flat in Python terms
+as the number of persons grows.
+"""
+from typing import Tuple
+
+import numpy as np
+
+from src.data.keypoints_store import NUM_KEYPOINTS
+from src.utils.boxes import box_iou
+
+# COCO keypoint sigmas of the OKS metric
+KEYPOINT_SIGMAS = np.array(
+    [
+        0.026, 0.025, 0.025, 0.035, 0.035, 0.079, 0.079, 0.072, 0.072,
+        0.062, 0.062, 0.107, 0.107, 0.087, 0.087, 0.089, 0.089,
+    ]
+)  # fmt: skip
+
+
+def keypoints_boxes(frame_keypoints: np.ndarray, min_conf: float = 0.3) -> np.ndarray:
+    """Returns the box (x1, y1, x2, y2) around the confident keypoints of every person,
+    or around all keypoints of a person without confident ones.
+
+    Args:
+        frame_keypoints (np.ndarray): Keypoints of a frame, shape (persons, 17, 3).
+        min_conf (float, optional): Minimum keypoint confidence. Defaults to 0.3.
+
+    Returns:
+        np.ndarray: Boxes of shape (persons, 4).
+    """
+    visible = frame_keypoints[..., 2] >= min_conf
+    visible[~visible.any(axis=1)] = True
+    xy = frame_keypoints[..., :2]
+    top_left = np.where(visible[..., None], xy, np.inf).min(axis=1)
+    bottom_right = np.where(visible[..., None], xy, -np.inf).max(axis=1)
+    return np.concatenate([top_left, bottom_right], axis=1)
+
+
+def associate(
+    similarity: np.ndarray, min_similarity: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Matches rows and columns of a similarity matrix by rounds of mutual best matches.
+
+    Args:
+        similarity (np.ndarray): Similarity of detections (rows) and tracks (columns).
+        min_similarity (float): Pairs less similar than this are not matched.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Indices of the matched rows and columns.
+    """
+    similarity = np.where(similarity >= min_similarity, similarity, -1.0)
+    rows, columns = [], []
+    while similarity.size and similarity.max() >= 0:
+        best_columns = similarity.argmax(axis=1)
+        best_rows = similarity.argmax(axis=0)
+        row_indices = np.arange(len(similarity))
+        mutual = (best_rows[best_columns] == row_indices) & (
+            similarity[row_indices, best_columns] >= 0
+        )
+        matched_rows, matched_columns = row_indices[mutual], best_columns[mutual]
+        rows.append(matched_rows)
+        columns.append(matched_columns)
+        similarity[matched_rows, :] = -1.0
+        similarity[:, matched_columns] = -1.0
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(rows), np.concatenate(columns)
+
+
+class PersonTracker:
+    """Assigns persistent IDs to the persons of consecutive frames of a video.
+
+    A track that is not matched for more than `max_gap` frames is dropped, and a person
+    that does not match any track starts a new one with the next free ID.
+
+    Attributes:
+        min_similarity (float): Minimum similarity of a detection and a track to match.
+        max_gap (int): Number of frames a track survives without a match.
+        iou_weight (float): Weight of the box IoU against the OKS in the similarity.
+        min_conf (float): Minimum confidence of the keypoints used for boxes and OKS.
+    """
+
+    def __init__(
+        self,
+        min_similarity: float = 0.2,
+        max_gap: int = 25,
+        iou_weight: float = 0.5,
+        min_conf: float = 0.3,
+    ):
+        self.min_similarity = min_similarity
+        self.max_gap = max_gap
+        self.iou_weight = iou_weight
+        self.min_conf = min_conf
+        self.reset()
+
+    def reset(self) -> None:
+        """Drops all tracks, before the frames of a new video."""
+        self._ids = np.empty(0, dtype=np.int64)
+        self._keypoints = np.empty((0, NUM_KEYPOINTS, 3), dtype=np.float32)
+        self._velocities = np.empty((0, 2), dtype=np.float32)
+        self._last_frames = np.empty(0, dtype=np.int64)
+        self._next_id = 0
+
+    def similarity(
+        self, frame_keypoints: np.ndarray, track_keypoints: np.ndarray
+    ) -> np.ndarray:
+        """Similarity of every person of a frame with every (predicted) track, shape (persons, tracks)."""
+        boxes = keypoints_boxes(frame_keypoints, self.min_conf)
+        track_boxes = keypoints_boxes(track_keypoints, self.min_conf)
+        iou = box_iou(boxes, track_boxes)
+
+        # Object keypoint similarity, scaled by the area of the track box
+        areas = np.prod(np.maximum(track_boxes[:, 2:] - track_boxes[:, :2], 1.0), axis=1)
+        squared_distances = np.sum(
+            (frame_keypoints[:, None, :, :2] - track_keypoints[None, :, :, :2]) ** 2,
+            axis=-1,
+        )
+        tolerances = 2 * areas[None, :, None] * (2 * KEYPOINT_SIGMAS) ** 2
+        visible = (frame_keypoints[:, None, :, 2] >= self.min_conf) & (
+            track_keypoints[None, :, :, 2] >= self.min_conf
+        )
+        oks = np.sum(np.exp(-squared_distances / tolerances) * visible, axis=-1) / (
+            np.maximum(visible.sum(axis=-1), 1)
+        )
+        return self.iou_weight * iou + (1 - self.iou_weight) * oks
+
+    def keep_alive(self, frame_number: int, ids: np.ndarray) -> None:
+        """Marks the tracks with the given IDs as seen in a frame without running
+        the association, for frames that reuse the persons of the previous one
+        (e.g. near-static frames skipped by a motion gate).
+        """
+        seen = np.isin(self._ids, ids)
+        self._last_frames[seen] = np.maximum(self._last_frames[seen], frame_number)
+
+    def update(self, frame_number: int, frame_keypoints: np.ndarray) -> np.ndarray:
+        """Associates the persons of a frame with the tracks.
+
+        Args:
+            frame_number (int): Index of the frame in the video, increasing between calls.
+            frame_keypoints (np.ndarray): Keypoints of the frame, shape (persons, 17, 3).
+
+        Returns:
+            np.ndarray: The track ID of every person, shape (persons,).
+        """
+        alive = frame_number - self._last_frames <= self.max_gap
+        self._ids = self._ids[alive]
+        self._keypoints = self._keypoints[alive]
+        self._velocities = self._velocities[alive]
+        self._last_frames = self._last_frames[alive]
+
+        frame_keypoints = np.asarray(frame_keypoints, dtype=np.float32)
+        gaps = (frame_number - self._last_frames).astype(np.float32)
+        predicted = self._keypoints.copy()
+        predicted[..., :2] += (self._velocities * gaps[:, None])[:, None, :]
+
+        matched, matched_tracks = associate(
+            self.similarity(frame_keypoints, predicted), self.min_similarity
+        )
+        ids = np.full(len(frame_keypoints), -1, dtype=np.int64)
+        ids[matched] = self._ids[matched_tracks]
+
+        # Update the matched tracks
+        centers = keypoints_boxes(frame_keypoints, self.min_conf)
+        centers = (centers[:, :2] + centers[:, 2:]) / 2
+        track_boxes = keypoints_boxes(self._keypoints[matched_tracks], self.min_conf)
+        track_centers = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2
+        self._velocities[matched_tracks] = (centers[matched] - track_centers) / gaps[
+            matched_tracks, None
+        ]
+        self._keypoints[matched_tracks] = frame_keypoints[matched]
+        self._last_frames[matched_tracks] = frame_number
+
+        # Start new tracks
+        new = ids < 0
+        ids[new] = np.arange(self._next_id, self._next_id + new.sum())
+        self._next_id += int(new.sum())
+        self._ids = np.concatenate([self._ids, ids[new]])
+        self._keypoints = np.concatenate([self._keypoints, frame_keypoints[new]])
+        self._velocities = np.concatenate(
+            [self._velocities, np.zeros((new.sum(), 2), dtype=np.float32)]
+        )
+        self._last_frames = np.concatenate(
+            [self._last_frames, np.full(new.sum(), frame_number, dtype=np.int64)]
+        )
+        return ids
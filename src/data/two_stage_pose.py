@@ -0,0 +1,225 @@
+"""The module provides a two-stage pose estimator: a person detector on the full frame,
+then the pose model on batched person crops at reduced resolution.
+
+On high-resolution footage with small players, the pose model sees every player at
+`crop_size` instead of the whole frame downscaled to the model input, which cuts compute
+and improves recall. Keypoints are restored to full-frame coordinates.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.models.devices import to_device
+from src.utils.boxes import box_iou
+
+# COCO class of persons in the detection model
+PERSON_CLASS = 0
+
+
+def _non_max_suppression(boxes: np.ndarray, scores: np.ndarray, iou: float) -> np.ndarray:
+    """Indices of the boxes kept by greedy NMS, by descending score."""
+    order = np.argsort(-scores)
+    overlaps = box_iou(boxes[order], boxes[order]) > iou
+    keep = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if keep[i]:
+            keep[i + 1 :] &= ~overlaps[i, i + 1 :]
+    return order[keep]
+
+
+class TwoStagePoseEstimator:
+    """Detects persons with a detection model and runs a pose model on their crops.
+
+    The estimator is called like a YOLO model and returns `ultralytics` `Results` with
+    full-frame boxes and keypoints, so it can replace the pose model wherever frames are
+    passed to the model one by one or in batches.
+
+    Called with a single frame, the estimator tracks the persons of a video: the detector
+    runs every `detect_every` frames and in between the crops follow the person boxes
+    the pose model found in the previous frame. Call `reset` before a new video.
+    Called with a batch of frames, that may come from different videos, the detector
+    runs on every frame.
+
+    Attributes:
+        detector (ultralytics.models.yolo.model.YOLO): A person detection model.
+        pose_model (ultralytics.models.yolo.model.YOLO): A pose model.
+        crop_size (int): Input size of the pose model for the crops.
+        detect_every (int): Run the detector on every `detect_every`-th single frame.
+        padding (float): Crops are padded by this share of the box size on every side.
+        det_conf (float): Confidence threshold of the detector.
+    """
+
+    def __init__(
+        self,
+        detector,
+        pose_model,
+        crop_size: int = 256,
+        detect_every: int = 1,
+        padding: float = 0.2,
+        det_conf: float = 0.25,
+        nms_iou: float = 0.7,
+    ):
+        self.detector = detector
+        self.pose_model = pose_model
+        self.crop_size = crop_size
+        self.detect_every = detect_every
+        self.padding = padding
+        self.det_conf = det_conf
+        self.nms_iou = nms_iou
+        self.reset()
+
+    @property
+    def ckpt_path(self) -> str:
+        """Identifies the models and the crop size, e.g. for the completion manifest."""
+        return (
+            f"{getattr(self.detector, 'ckpt_path', self.detector)}"
+            f"+{getattr(self.pose_model, 'ckpt_path', self.pose_model)}@{self.crop_size}"
+        )
+
+    def to(self, device) -> "TwoStagePoseEstimator":
+        self.detector = to_device(self.detector, device)
+        self.pose_model = to_device(self.pose_model, device)
+        return self
+
+    def reset(self) -> None:
+        """Forgets the tracked persons, before the frames of a new video."""
+        self._tracked_boxes: Optional[np.ndarray] = None
+        self._frames_since_detection = 0
+
+    def __call__(self, source, conf: float = 0.30, verbose: bool = False, **kwargs):
+        """Estimates the poses on a frame or a list of frames (BGR arrays).
+
+        Returns:
+            List[ultralytics.engine.results.Results]: A result per frame.
+        """
+        if isinstance(source, np.ndarray):
+            return [self._track_frame(source, conf)]
+
+        detections = self.detector(
+            list(source), classes=[PERSON_CLASS], conf=self.det_conf, verbose=False
+        )
+        return self._estimate(
+            list(source),
+            [detection.boxes.xyxy.cpu().numpy() for detection in detections],
+            [detection.speed for detection in detections],
+            conf,
+        )
+
+    def _track_frame(self, frame: np.ndarray, conf: float):
+        detection_speed = {}
+        if (
+            self._tracked_boxes is None
+            or not len(self._tracked_boxes)
+            or self._frames_since_detection + 1 >= self.detect_every
+        ):
+            detection = self.detector(
+                frame, classes=[PERSON_CLASS], conf=self.det_conf, verbose=False
+            )[0]
+            boxes = detection.boxes.xyxy.cpu().numpy()
+            detection_speed = detection.speed
+            self._frames_since_detection = 0
+        else:
+            boxes = self._tracked_boxes
+            self._frames_since_detection += 1
+
+        result = self._estimate([frame], [boxes], [detection_speed], conf)[0]
+        self._tracked_boxes = result.boxes.xyxy.cpu().numpy()
+        return result
+
+    def _crop_regions(self, boxes: np.ndarray, frame_shape) -> np.ndarray:
+        """Pads the boxes and clips them to the frame, as integer (x1, y1, x2, y2)."""
+        height, width = frame_shape[:2]
+        sizes = boxes[:, 2:] - boxes[:, :2]
+        regions = np.concatenate(
+            [boxes[:, :2] - sizes * self.padding, boxes[:, 2:] + sizes * self.padding],
+            axis=1,
+        )
+        return np.clip(regions, 0, [width, height, width, height]).astype(np.int64)
+
+    def _estimate(
+        self,
+        frames: List[np.ndarray],
+        frame_boxes: List[np.ndarray],
+        detection_speeds: List[dict],
+        conf: float,
+    ):
+        """Runs the pose model on all crops of all frames in one batch."""
+        import torch
+        from ultralytics.engine.results import Results
+
+        crops: List[np.ndarray] = []
+        crop_owners: List[Tuple[int, np.ndarray, np.ndarray]] = []
+        for frame_index, (frame, boxes) in enumerate(zip(frames, frame_boxes)):
+            for region, box in zip(self._crop_regions(boxes, frame.shape), boxes):
+                x1, y1, x2, y2 = region
+                if min(x2 - x1, y2 - y1) < 8:
+                    continue  # Too small to estimate a pose
+                crops.append(frame[y1:y2, x1:x2])
+                crop_owners.append((frame_index, region, box))
+
+        crop_results = (
+            self.pose_model(crops, imgsz=self.crop_size, conf=conf, verbose=False)
+            if crops
+            else []
+        )
+
+        frame_keypoints = [[] for _ in frames]
+        frame_person_boxes = [[] for _ in frames]
+        pose_speeds = [[] for _ in frames]
+        for (frame_index, region, box), crop_result in zip(crop_owners, crop_results):
+            pose_speeds[frame_index].append(crop_result.speed)
+            if crop_result.keypoints is None or not len(crop_result.boxes):
+                continue
+            offset = region[:2].astype(np.float32)
+            # A crop may show neighbours too: take the person that fits the detected box
+            person_boxes = crop_result.boxes.xyxy.cpu().numpy() + np.tile(offset, 2)
+            person = int(np.argmax(box_iou(box[None], person_boxes)[0]))
+            keypoints = crop_result.keypoints.data[person].cpu().numpy().copy()
+            keypoints[:, :2] += offset
+            frame_keypoints[frame_index].append(keypoints)
+            frame_person_boxes[frame_index].append(
+                np.append(
+                    person_boxes[person],
+                    [float(crop_result.boxes.conf[person]), PERSON_CLASS],
+                )
+            )
+
+        results = []
+        keypoints_shape = self._keypoints_shape()
+        for frame_index, frame in enumerate(frames):
+            boxes = np.array(frame_person_boxes[frame_index], dtype=np.float32)
+            boxes = boxes.reshape(-1, 6)
+            keypoints = np.array(frame_keypoints[frame_index], dtype=np.float32)
+            keypoints = keypoints.reshape(-1, *keypoints_shape)
+            # Crops of persons close to each other may have found the same person
+            keep = np.sort(
+                _non_max_suppression(boxes[:, :4], boxes[:, 4], self.nms_iou)
+            )
+            result = Results(
+                frame,
+                path="",
+                names=self.pose_model.names,
+                boxes=torch.from_numpy(boxes[keep]),
+                keypoints=torch.from_numpy(keypoints[keep]),
+            )
+            result.speed = self._speed(
+                detection_speeds[frame_index], pose_speeds[frame_index]
+            )
+            results.append(result)
+        return results
+
+    def _keypoints_shape(self) -> Tuple[int, int]:
+        kpt_shape = getattr(self.pose_model.model, "kpt_shape", None) or (17, 3)
+        return tuple(kpt_shape)
+
+    @staticmethod
+    def _speed(detection_speed: dict, pose_speeds: List[dict]) -> dict:
+        """Adds the milliseconds of the detection and of the pose model on every crop."""
+        speed = {}
+        for name in ("preprocess", "inference", "postprocess"):
+            milliseconds = [
+                stage_speed.get(name) or 0.0
+                for stage_speed in [detection_speed, *pose_speeds]
+            ]
+            speed[name] = float(sum(milliseconds))
+        return speed
@@ -0,0 +1,170 @@
+"""The module provides the video encoders the processed videos are written with.
+
+    mjpg    Motion JPEG in AVI through OpenCV: fast, large files
+    mp4v    MPEG-4 Part 2 in MP4 through OpenCV
+    x264    H.264 in MP4 through a local ffmpeg executable, fed raw frames over a pipe:
+            the smallest files; falls back to mp4v if ffmpeg is not found
+
+Every encoder has the `write` / `release` interface of `cv2.VideoWriter`.
+"""
+import shutil
+import subprocess
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from src.utils.loggers import setup_logger
+
+ENCODERS = ("mjpg", "mp4v", "x264")
+_OPENCV_FOURCCS = {"mjpg": "MJPG", "mp4v": "mp4v"}
+_SUFFIXES = {"mjpg": ".avi", "mp4v": ".mp4", "x264": ".mp4"}
+
+logger = setup_logger(__name__)
+
+
+@dataclass
+class VideoEncoderSettings:
+    """The encoder of the processed videos and its quality settings.
+
+    Attributes:
+        encoder (str): 'mjpg', 'mp4v' or 'x264'.
+        quality (Optional[int]): JPEG quality of 'mjpg', 0-100. It is applied by the
+            built-in MJPEG encoder of OpenCV, whose files are larger than those of the
+            FFmpeg backend used with None (2.6-3x at 75-90 in `benchmarks.bench_encoders`).
+            It trades size for fidelity; 'mp4v' and 'x264' are the ones for small files.
+        crf (int): Constant rate factor of 'x264', 0-51, lower is better.
+        bitrate (Optional[str]): Target bitrate of 'x264' (e.g. "2M"), overrides `crf`.
+        preset (str): Speed preset of 'x264', from 'ultrafast' to 'veryslow'.
+        ffmpeg (Optional[str]): Path to the ffmpeg executable. Defaults to the one on PATH.
+    """
+
+    encoder: str = "mjpg"
+    quality: Optional[int] = None
+    crf: int = 23
+    bitrate: Optional[str] = None
+    preset: str = "veryfast"
+    ffmpeg: Optional[str] = None
+
+    def __post_init__(self):
+        if self.encoder not in ENCODERS:
+            raise ValueError(
+                f"Unknown video encoder '{self.encoder}', expected one of {ENCODERS}"
+            )
+
+    @property
+    def suffix(self) -> str:
+        """The file suffix of the container of the encoder."""
+        return _SUFFIXES[self.encoder]
+
+    def ffmpeg_path(self) -> Optional[str]:
+        return shutil.which(self.ffmpeg or "ffmpeg")
+
+    def open(self, video_path_out, fps: int, width: int, height: int):
+        """Opens an encoder writing to `video_path_out`."""
+        if self.encoder == "x264":
+            ffmpeg = self.ffmpeg_path()
+            if ffmpeg is not None:
+                return FFmpegVideoWriter(
+                    video_path_out, fps, width, height, self, ffmpeg
+                )
+            logger.warning("ffmpeg is not found, encoding with mp4v instead of x264")
+            fourcc = _OPENCV_FOURCCS["mp4v"]
+        else:
+            fourcc = _OPENCV_FOURCCS[self.encoder]
+
+        if self.encoder == "mjpg" and self.quality is not None:
+            writer = cv2.VideoWriter(
+                str(video_path_out),
+                cv2.CAP_OPENCV_MJPEG,
+                cv2.VideoWriter_fourcc(*fourcc),
+                fps,
+                (width, height),
+            )
+            writer.set(cv2.VIDEOWRITER_PROP_QUALITY, self.quality)
+            return writer
+        return cv2.VideoWriter(
+            str(video_path_out), cv2.VideoWriter_fourcc(*fourcc), fps, (width, height)
+        )
+
+
+class FFmpegVideoWriter:
+    """Encodes BGR frames with libx264 in an ffmpeg process fed over its stdin."""
+
+    def __init__(
+        self,
+        video_path_out,
+        fps: int,
+        width: int,
+        height: int,
+        settings: VideoEncoderSettings,
+        ffmpeg: str,
+    ):
+        self.video_path_out = str(video_path_out)
+        self.frame_size = (height, width, 3)
+        rate_control = (
+            ["-b:v", settings.bitrate]
+            if settings.bitrate
+            else ["-crf", str(settings.crf)]
+        )
+        command = [
+            ffmpeg,
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "bgr24",
+            "-s",
+            f"{width}x{height}",
+            "-r",
+            str(fps or 25),
+            "-i",
+            "-",
+            "-c:v",
+            "libx264",
+            "-preset",
+            settings.preset,
+            *rate_control,
+            # yuv420p is what players expect, it needs even frame sizes
+            "-vf",
+            "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-pix_fmt",
+            "yuv420p",
+            self.video_path_out,
+        ]
+        self._process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+    def isOpened(self) -> bool:  # pylint: disable=invalid-name
+        return self._process.poll() is None
+
+    def write(self, frame: np.ndarray) -> None:
+        if frame.shape != self.frame_size:
+            # cv2.VideoWriter skips frames of another size, so does this writer
+            return
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError as err:
+            raise IOError(
+                f"ffmpeg stopped encoding {self.video_path_out}: {self._stderr()}"
+            ) from err
+
+    def release(self) -> None:
+        """Finishes the video. Like `cv2.VideoWriter.release`, it does not raise, since it
+        is called from `finally` blocks; a failure of ffmpeg is logged.
+        """
+        if self._process.stdin.closed:
+            return
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self._process.wait() != 0:
+            logger.error(f"ffmpeg failed to encode {self.video_path_out}: {self._stderr()}")
+
+    def _stderr(self) -> str:
+        return self._process.stderr.read().decode(errors="replace").strip()
@@ -1,7 +1,20 @@
+from typing import Iterator, Optional, Tuple
+
 import cv2
+import numpy as np
+
+from src.data.video_encoders import VideoEncoderSettings
+from src.data.video_metadata import VideoMetadata
 
 
-def _get_video_params(video_path_in) -> tuple[int, int, int]:
+def _get_video_params(
+    video_path_in, metadata: Optional[VideoMetadata] = None
+) -> tuple[int, int, int]:
+    """Returns fps, width and height of a video, from its indexed metadata if given
+    (see `src.data.video_metadata`), otherwise from the opened video.
+    """
+    if metadata is not None:
+        return int(metadata.fps), metadata.width, metadata.height
     cap = cv2.VideoCapture(str(video_path_in))
     fps = int(cap.get(cv2.CAP_PROP_FPS))
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -11,7 +24,49 @@ def _get_video_params(video_path_in) -> tuple[int, int, int]:
     return fps, width, height
 
 
-def _video_writer(video_path_out, fps: int, width: int, height: int) -> cv2.VideoWriter:
-    fourcc = cv2.VideoWriter_fourcc(*"MJPG")
-    writer = cv2.VideoWriter(str(video_path_out), fourcc, fps, (width, height))
-    return writer
+def _video_writer(
+    video_path_out,
+    fps: int,
+    width: int,
+    height: int,
+    encoder: Optional[VideoEncoderSettings] = None,
+):
+    """Opens the encoder (MJPG AVI by default) of a processed video, see `src.data.video_encoders`."""
+    return (encoder or VideoEncoderSettings()).open(video_path_out, fps, width, height)
+
+
+def _read_video_frames(video_path_in) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yields (frame_number, frame) for every frame of a video, starting from 0."""
+    cap = cv2.VideoCapture(str(video_path_in))
+    try:
+        frame_number = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame_number, frame
+            frame_number += 1
+    finally:
+        cap.release()
+
+
+def _read_video_frames_with_stride(
+    video_path_in, stride: int
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yields (frame_number, frame) for every `stride`-th frame of a video, starting from 0,
+    and for its last frame. The other frames are only grabbed, not retrieved.
+    The last frame is taken from the frame count of the container.
+    """
+    cap = cv2.VideoCapture(str(video_path_in))
+    try:
+        last_frame_number = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) - 1
+        frame_number = 0
+        while cap.grab():
+            if frame_number % stride == 0 or frame_number == last_frame_number:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                yield frame_number, frame
+            frame_number += 1
+    finally:
+        cap.release()
@@ -0,0 +1,238 @@
+"""The module provides an on-disk index of the metadata of videos, probed once per video.
+
+Opening a video with OpenCV only to read its fps and frame size parses its container
+every time. The index keeps fps, resolution, frame count, duration, codec, size and
+mtime of every video under a folder in a JSON file in that folder, keyed by the path
+of the video relative to that folder, so the index stays valid when the folder is moved
+or reached by another path. A refresh probes, in parallel threads, only the videos that
+are new or whose size or mtime changed, and drops the deleted ones. The frame counts
+also plan the auto-labeling work and its ETA. In a read-only folder the index is only
+kept in memory.
+
+Usage (indexes the video folders of the config):
+    python -m src.data.video_metadata
+"""
+import json
+import os
+import pathlib
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional, Union
+
+import cv2
+
+from src.utils.loggers import setup_logger
+from src.utils.paths import relative_key
+
+INDEX_NAME = ".video_metadata.json"
+VIDEO_SUFFIXES = (".mp4", ".avi")
+
+PathLike = Union[str, pathlib.Path]
+
+logger = setup_logger(__name__)
+
+
+@dataclass
+class VideoMetadata:
+    """The metadata of a video file.
+
+    Attributes:
+        fps (float): Frames per second, 0 if unknown.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        frame_count (int): Number of frames as stated by the container.
+        duration (float): Duration in seconds, 0 if the fps is unknown.
+        codec (str): FourCC of the video stream (e.g. "avc1", "MJPG").
+        size (int): File size in bytes.
+        mtime (float): File modification time.
+    """
+
+    fps: float
+    width: int
+    height: int
+    frame_count: int
+    duration: float
+    codec: str
+    size: int
+    mtime: float
+
+
+def probe_video(path_to_video: PathLike) -> VideoMetadata:
+    """Reads the metadata of a video from its file and container.
+
+    Raises:
+        IOError: If the video cannot be opened.
+    """
+    stat = os.stat(path_to_video)
+    cap = cv2.VideoCapture(str(path_to_video))
+    try:
+        if not cap.isOpened():
+            raise IOError(f"Failed to open video: {path_to_video}")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        frame_count = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    finally:
+        cap.release()
+    codec = fourcc.to_bytes(4, "little").decode("ascii", errors="replace").strip("\x00 ")
+    return VideoMetadata(
+        fps=fps,
+        width=width,
+        height=height,
+        frame_count=frame_count,
+        duration=frame_count / fps if fps > 0 else 0.0,
+        codec=codec,
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+    )
+
+
+def list_videos(path_to_video_folder: PathLike) -> List[pathlib.Path]:
+    """Lists the MP4 and AVI videos under a folder and its subfolders, sorted."""
+    return sorted(
+        path
+        for path in pathlib.Path(path_to_video_folder).rglob("*")
+        if path.suffix.lower() in VIDEO_SUFFIXES and path.is_file()
+    )
+
+
+class VideoMetadataIndex:
+    """A JSON file with the metadata of every indexed video, keyed by the path of the
+    video relative to the folder of the index.
+
+    An entry is up to date while the size and mtime of its video are unchanged.
+    The file is rewritten atomically by `save`, unless its folder is not writable.
+    """
+
+    def __init__(self, path_to_index: PathLike):
+        self.path_to_index = pathlib.Path(path_to_index)
+        self.entries: Dict[str, dict] = self._load()
+
+    def _key(self, path_to_video: PathLike) -> str:
+        """The key of a video: its resolved path relative to the folder of the index."""
+        return relative_key(path_to_video, self.path_to_index.parent)
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path_to_index, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def save(self) -> None:
+        """Writes the index, or logs and keeps it in memory if its folder is not writable."""
+        tmp_path = self.path_to_index.with_suffix(".tmp")
+        try:
+            self.path_to_index.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(self.entries, file, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path_to_index)
+        except OSError as err:
+            logger.info(
+                f"Cannot write {self.path_to_index}, the index is kept in memory: {err}"
+            )
+
+    def _is_up_to_date(self, path_to_video: PathLike) -> bool:
+        entry = self.entries.get(self._key(path_to_video))
+        if entry is None:
+            return False
+        try:
+            stat = os.stat(path_to_video)
+        except OSError:
+            return False
+        return entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+
+    def get(self, path_to_video: PathLike) -> Optional[VideoMetadata]:
+        """Returns the metadata of a video, probing it if its entry is missing or stale.
+        A probed entry is kept in memory until the next `save`.
+
+        Returns:
+            Optional[VideoMetadata]: The metadata, or None if the video cannot be opened.
+        """
+        key = self._key(path_to_video)
+        if not self._is_up_to_date(path_to_video):
+            try:
+                self.entries[key] = asdict(probe_video(path_to_video))
+            except (IOError, OSError):
+                self.entries.pop(key, None)
+                return None
+        return VideoMetadata(**self.entries[key])
+
+    def refresh(
+        self,
+        paths_to_videos: Iterable[PathLike],
+        max_workers: int = 8,
+        prune: bool = False,
+    ) -> int:
+        """Probes the new and changed videos in parallel threads and saves the index.
+
+        Args:
+            paths_to_videos (Iterable[PathLike]): The videos to index.
+            max_workers (int, optional): Number of videos probed at once. Defaults to 8.
+            prune (bool, optional): Drop the entries of the videos not in
+                `paths_to_videos`. Defaults to False.
+
+        Returns:
+            int: The number of probed videos.
+        """
+        paths_to_videos = list(paths_to_videos)
+        stale = [path for path in paths_to_videos if not self._is_up_to_date(path)]
+        num_entries = len(self.entries)
+        if prune:
+            indexed = {self._key(path) for path in paths_to_videos}
+            self.entries = {
+                key: entry for key, entry in self.entries.items() if key in indexed
+            }
+        if not stale and len(self.entries) == num_entries:
+            return 0
+
+        start = time.perf_counter()
+        # OpenCV releases the GIL while it opens a video, so threads probe in parallel
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(probe_video, path): path for path in stale}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    self.entries[self._key(path)] = asdict(future.result())
+                except (IOError, OSError) as err:
+                    logger.warning(f"Failed to probe {path}: {err}")
+                    self.entries.pop(self._key(path), None)
+        self.save()
+        if stale:
+            logger.info(
+                f"Probed {len(stale)} of {len(paths_to_videos)} videos "
+                f"in {time.perf_counter() - start:.2f} s"
+            )
+        return len(stale)
+
+
+def build_video_metadata_index(
+    path_to_video_folder: PathLike, max_workers: int = 8
+) -> VideoMetadataIndex:
+    """Opens the index of a video folder and brings it up to date with the videos
+    under the folder and its subfolders.
+    """
+    index = VideoMetadataIndex(pathlib.Path(path_to_video_folder) / INDEX_NAME)
+    index.refresh(list_videos(path_to_video_folder), max_workers, prune=True)
+    return index
+
+
+def main():
+    from src.load_config import load_config
+
+    config = load_config()
+    path_to_data_root = pathlib.Path(config["data"]["root"])
+    for folder in ("actions", "scenes"):
+        path_to_video_folder = path_to_data_root / config["data"][folder]
+        if path_to_video_folder.is_dir():
+            index = build_video_metadata_index(path_to_video_folder)
+            hours = sum(entry["duration"] for entry in index.entries.values()) / 3600
+            logger.info(
+                f"{path_to_video_folder}: {len(index.entries)} videos, {hours:.2f} h"
+            )
+
+
+if __name__ == "__main__":
+    main()
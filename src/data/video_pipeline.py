@@ -0,0 +1,193 @@
+"""The module provides a threaded decode / process / encode pipeline for videos.
+
+OpenCV releases the GIL while decoding, drawing and encoding, so running the stages in
+their own threads keeps the CPU busy while the decoder or the encoder blocks. Every stage
+is a single thread connected by bounded FIFO queues, so frames keep their order and the
+output is the same as a sequential loop.
+
+With frame ranges, only the frames inside them are decoded and processed: short gaps
+between the ranges are grabbed without being retrieved, long ones are seeked over.
+"""
+import queue
+import threading
+from typing import Callable, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Marks the end of the frames in a queue
+_END = object()
+# Gaps between frame ranges from this many frames on are seeked over rather than grabbed
+SEEK_MIN_FRAMES = 50
+
+
+class VideoPipeline:
+    """Runs decoding and encoding of a video in background threads around a processing stage.
+
+    Attributes:
+        cap (cv2.VideoCapture): An opened video capture to decode frames from.
+        process_frame (Callable[[int, np.ndarray], Optional[np.ndarray]]):
+            Gets the 0-based frame index and the frame and returns the frame to write,
+            or None to drop it.
+        video_writer (cv2.VideoWriter): A writer the processed frames are encoded with.
+        queue_size (int): Maximum number of frames waiting between two stages.
+        frame_ranges (Optional[np.ndarray]): Sorted half-open [start, stop) ranges of
+            shape (ranges, 2) of the frames to process, None for all frames.
+        seek_min_frames (int): Gaps of at least this many frames are seeked over.
+    """
+
+    def __init__(
+        self,
+        cap: cv2.VideoCapture,
+        process_frame: Callable[[int, np.ndarray], Optional[np.ndarray]],
+        video_writer: cv2.VideoWriter,
+        queue_size: int = 8,
+        frame_ranges: Optional[np.ndarray] = None,
+        seek_min_frames: int = SEEK_MIN_FRAMES,
+    ):
+        self.cap = cap
+        self.process_frame = process_frame
+        self.video_writer = video_writer
+        self.frame_ranges = frame_ranges
+        self.seek_min_frames = seek_min_frames
+        self._decoded = queue.Queue(maxsize=queue_size)
+        self._processed = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._errors = []
+
+    def _put(self, target: queue.Queue, item) -> bool:
+        """Puts an item into a queue unless the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _ranges(self) -> Iterator[Tuple[int, Optional[int]]]:
+        if self.frame_ranges is None:
+            yield 0, None
+            return
+        for start, stop in self.frame_ranges:
+            yield int(start), int(stop)
+
+    def _skip_to(self, frame_index: int, target: int) -> bool:
+        """Moves the capture from `frame_index` to `target` without retrieving the frames
+        in between. Returns False if the video ends before `target`.
+        """
+        if target - frame_index >= self.seek_min_frames and self.cap.set(
+            cv2.CAP_PROP_POS_FRAMES, target
+        ):
+            return True
+        for _ in range(target - frame_index):
+            if not self.cap.grab():
+                return False
+        return True
+
+    def _decode(self) -> None:
+        try:
+            frame_index = 0
+            for start, stop in self._ranges():
+                start = max(start, frame_index)
+                if not self._skip_to(frame_index, start):
+                    break
+                frame_index = start
+                while stop is None or frame_index < stop:
+                    if self._stop.is_set():
+                        return
+                    ret, frame = self.cap.read()
+                    if not ret:
+                        return  # Return if we reach the end of the video
+                    if not self._put(self._decoded, (frame_index, frame)):
+                        return
+                    frame_index += 1
+        except Exception as exc:  # pylint: disable=broad-except
+            self._errors.append(exc)
+            self._stop.set()
+        finally:
+            self._put(self._decoded, _END)
+
+    def _encode(self) -> None:
+        try:
+            while True:
+                frame = self._processed.get()
+                if frame is _END:
+                    break
+                self.video_writer.write(frame)
+        except Exception as exc:  # pylint: disable=broad-except
+            self._errors.append(exc)
+            self._stop.set()
+
+    def run(self) -> int:
+        """Processes the frames of the video, or of its frame ranges.
+
+        Returns:
+            int: The number of processed frames.
+        """
+        decoder = threading.Thread(target=self._decode, name="decoder", daemon=True)
+        encoder = threading.Thread(target=self._encode, name="encoder", daemon=True)
+        decoder.start()
+        encoder.start()
+
+        num_frames = 0
+        try:
+            while not self._stop.is_set():
+                try:
+                    item = self._decoded.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    break
+                frame_index, frame = item
+                processed_frame = self.process_frame(frame_index, frame)
+                num_frames += 1
+                if processed_frame is not None:
+                    self._put(self._processed, processed_frame)
+        except Exception:
+            self._stop.set()
+            raise
+        finally:
+            # The encoder drains the frames processed so far before stopping
+            while encoder.is_alive():
+                try:
+                    self._processed.put(_END, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            encoder.join()
+            self._stop.set()
+            decoder.join()
+
+        if self._errors:
+            raise self._errors[0]
+        return num_frames
+
+
+def run_video_pipeline(
+    cap: cv2.VideoCapture,
+    process_frame: Callable[[int, np.ndarray], Optional[np.ndarray]],
+    video_writer: cv2.VideoWriter,
+    queue_size: int = 8,
+    frame_ranges: Optional[np.ndarray] = None,
+) -> int:
+    """Decodes, processes and encodes a video in a threaded pipeline.
+
+    Args:
+        cap (cv2.VideoCapture): An opened video capture to decode frames from.
+        process_frame (Callable[[int, np.ndarray], Optional[np.ndarray]]):
+            Gets the 0-based frame index and the frame and returns the frame to write,
+            or None to drop it.
+        video_writer (cv2.VideoWriter): A writer the processed frames are encoded with.
+        queue_size (int, optional): Maximum number of frames waiting between two stages.
+                                    Defaults to 8.
+        frame_ranges (Optional[np.ndarray], optional): Sorted half-open [start, stop)
+            frame ranges of shape (ranges, 2) to process, the other frames are skipped
+            without being retrieved. Defaults to None, all frames.
+
+    Returns:
+        int: The number of processed frames.
+    """
+    return VideoPipeline(
+        cap, process_frame, video_writer, queue_size, frame_ranges
+    ).run()
@@ -1,18 +1,22 @@
 """The module provides the pipeline to extract keypoints from videos and write them to CSV files."""
 import pathlib
+import time
 from typing import Dict, Optional
 
-import mlflow
-
 from config import AutoLabelingMode, set_autolabeling_mode
 from src.aws.data_exchange import download_data_from_S3, upload_data_to_s3
-from src.data.keypoints_factories import csv_keypoints_factory
-from src.models.initialize_models import initialize_yolo_model
+from src.data.keypoints_factories import (
+    batched_keypoints_factory,
+    csv_keypoints_factory,
+)
+from src.labeling.parallel_executor import parallel_keypoints_factory
+from src.models.initialize_models import initialize_pose_model
 from src.utils.get_config_params import (
     get_config_params_for_autolabeling_debug_mode,
     get_config_params_for_autolabeling_locally,
     get_config_params_for_autolabeling_on_AWS,
 )
+from src.utils.timing import StageTimer
 
 
 def process_video(
@@ -24,31 +28,111 @@ def process_video(
     bucket_path_to_download: Optional[str] = None,
     bucket_path_to_upload: Optional[str] = None,
     artifact_location: Optional[str] = None,
+    output_format: str = "csv",
+    num_workers: int = 1,
+    threads_per_worker: int = 1,
+    batch_size: int = 1,
+    max_open_videos: int = 4,
+    stride: int = 1,
+    motion_threshold: float = 0.0,
+    path_to_detection_model: Optional[str] = None,
+    crop_size: int = 256,
+    detect_every: int = 1,
+    backend: str = "torch",
+    resolution: Optional[str] = None,
 ) -> None:
+    # Stage totals and frame latency percentiles are logged to the MLflow run
+    timer = StageTimer()
+    start = time.perf_counter()
+
     if bucket_path_to_download and bucket_name:
-        download_data_from_S3(
-            bucket_name,
-            bucket_path_to_download,
-            path_to_local_video_folder,
-            "loggs/S3.log",
-        )
+        with timer.stage("s3_download"):
+            download_data_from_S3(
+                bucket_name,
+                bucket_path_to_download,
+                path_to_local_video_folder,
+                "loggs/S3.log",
+            )
+
+    # mlflow is imported here, not at module level, to keep startup fast
+    import mlflow
 
     experiment_id = mlflow.create_experiment(
         "Atolabeling on AWS", artifact_location=artifact_location
     )
     with mlflow.start_run(experiment_id=experiment_id):
-        model = initialize_yolo_model(path_to_model)
-        csv_keypoints_factory(
-            model, path_to_local_video_folder, path_to_local_csv_folder, classes
-        )
+        # With a detection model, the pose model runs on person crops (two-stage mode)
+        if num_workers > 1 and path_to_detection_model is None:
+            summary = parallel_keypoints_factory(
+                path_to_model,
+                path_to_local_video_folder,
+                path_to_local_csv_folder,
+                classes,
+                num_workers,
+                threads_per_worker,
+                output_format=output_format,
+                log_file="loggs/parallel_executor.log",
+                timer=timer,
+                stride=stride,
+                motion_threshold=motion_threshold,
+                backend=backend,
+                resolution=resolution,
+            )
+            mlflow.log_metric("videos_succeeded", summary.num_succeeded)
+            mlflow.log_metric("videos_failed", summary.num_failed)
+        elif (
+            batch_size > 1 and stride == 1 and not motion_threshold and resolution is None
+        ):
+            model = initialize_pose_model(
+                path_to_model, path_to_detection_model, crop_size, detect_every, backend
+            )
+            batched_keypoints_factory(
+                model,
+                path_to_local_video_folder,
+                path_to_local_csv_folder,
+                classes,
+                batch_size=batch_size,
+                max_open_videos=max_open_videos,
+                output_format=output_format,
+                timer=timer,
+            )
+        else:
+            model = initialize_pose_model(
+                path_to_model, path_to_detection_model, crop_size, detect_every, backend
+            )
+            csv_keypoints_factory(
+                model,
+                path_to_local_video_folder,
+                path_to_local_csv_folder,
+                classes,
+                output_format=output_format,
+                timer=timer,
+                stride=stride,
+                motion_threshold=motion_threshold,
+                resolution=resolution,
+            )
+
+        if bucket_path_to_upload and bucket_name:
+            with timer.stage("s3_upload"):
+                upload_data_to_s3(
+                    path_to_local_csv_folder,
+                    bucket_name,
+                    bucket_path_to_upload,
+                    "loggs/S3.log",
+                )
+
+        mlflow.log_metrics(timer.metrics(time.perf_counter() - start))
+        for step, video_metrics in enumerate(timer.video_metrics()):
+            mlflow.log_metrics(video_metrics, step=step)
         mlflow.set_tag("model", path_to_model)
+        mlflow.set_tag("num_workers", num_workers)
+        mlflow.set_tag("stride", stride)
+        mlflow.set_tag("motion_threshold", motion_threshold)
+        mlflow.set_tag("detection_model", path_to_detection_model)
+        mlflow.set_tag("backend", backend)
+        mlflow.set_tag("resolution", resolution)
         mlflow.log_artifacts("loggs")
 
-    if bucket_path_to_upload and bucket_name:
-        upload_data_to_s3(
-            path_to_local_csv_folder, bucket_name, bucket_path_to_upload, "loggs/S3.log"
-        )
-
 
 def main():
     run_env = set_autolabeling_mode()
@@ -69,6 +153,22 @@ def main():
         bucket_path_to_download=config_params["bucket_path_to_download"],
         bucket_path_to_upload=config_params["bucket_path_to_upload"],
         artifact_location=config_params["artifact_location"],
+        output_format=config_params["output_format"],
+        num_workers=config_params["num_workers"],
+        threads_per_worker=config_params["threads_per_worker"],
+        batch_size=config_params["batch_size"],
+        max_open_videos=config_params["max_open_videos"],
+        stride=config_params["stride"],
+        motion_threshold=config_params["motion_threshold"],
+        path_to_detection_model=(
+            config_params["path_to_detection_model"]
+            if config_params["two_stage"]
+            else None
+        ),
+        crop_size=config_params["crop_size"],
+        detect_every=config_params["detect_every"],
+        backend=config_params["backend"],
+        resolution=config_params["resolution"],
     )
 
 
@@ -0,0 +1,354 @@
+"""The module provides a pool of model instances, each pinned to its own set of CPU cores.
+
+One model spread over all cores by torch threading scales poorly, and unbounded worker
+processes oversubscribe the cores. The pool splits the cores of the process into K
+disjoint sets and runs one warmed-up, fused model per set with as many intra-op threads
+as the set has cores. Frames and videos submitted to the pool go to the next free instance.
+
+The pool is a library API for callers that serve frames or videos, and
+`benchmarks/bench_model_pool.py` finds its throughput-optimal K. The auto-labeling
+pipeline runs videos with `src.labeling.parallel_executor` instead.
+"""
+import multiprocessing
+import os
+import pathlib
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from itertools import count
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.data.keypoints_factories import extract_keypoints_from_video
+from src.data.keypoints_handler import result_to_keypoints
+from src.labeling.workers import prepare_workers
+from src.models.initialize_models import initialize_yolo_model
+from src.utils.loggers import setup_logger
+from src.utils.timing import StageTimer
+
+# The model of the current pool process, loaded once by `_pool_worker`
+_instance_model = None
+# How often the liveness of the instances is checked while waiting for their results
+_POLL_SECONDS = 0.5
+
+
+def available_cores() -> List[int]:
+    """Returns the CPU cores the current process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def partition_cores(cores: Sequence[int], num_instances: int) -> List[List[int]]:
+    """Splits the cores into `num_instances` disjoint sets of (almost) equal size."""
+    if not 1 <= num_instances <= len(cores):
+        raise ValueError(
+            f"Cannot split {len(cores)} cores between {num_instances} model instances"
+        )
+    return [part.tolist() for part in np.array_split(np.asarray(cores), num_instances)]
+
+
+def _infer_frames(frames: List[np.ndarray], conf: float) -> List[np.ndarray]:
+    results = _instance_model(frames, conf=conf, verbose=False)
+    return [
+        result_to_keypoints(frame_number, frame_data)
+        for frame_number, frame_data in enumerate(results)
+    ]
+
+
+def _extract_video(
+    path_to_video_file_in: pathlib.Path, path_to_keypoints_out: pathlib.Path, **kwargs
+) -> StageTimer:
+    timer = StageTimer()
+    extract_keypoints_from_video(
+        _instance_model,
+        path_to_video_file_in,
+        path_to_keypoints_out,
+        timer=timer,
+        **kwargs,
+    )
+    return timer
+
+
+_TASKS = {"frames": _infer_frames, "video": _extract_video}
+
+
+def _pool_worker(
+    path_to_model: str,
+    backend: str,
+    cores: List[int],
+    warmup_frames: int,
+    imgsz: int,
+    tasks: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+) -> None:
+    """Pins the process to its cores, loads, fuses and warms up the model, then runs
+    tasks from the shared queue until it gets None.
+    """
+    global _instance_model
+
+    try:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        import torch
+
+        torch.set_num_threads(len(cores))
+        _instance_model = initialize_yolo_model(path_to_model, backend)
+        # The first call sets up the predictor, which fuses Conv and BatchNorm layers
+        blank_frame = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+        for _ in range(warmup_frames):
+            _instance_model(blank_frame, verbose=False)
+    except Exception as exc:  # pylint: disable=broad-except
+        results.put((None, None, f"{type(exc).__name__}: {exc}"))
+        return
+    results.put((None, None, None))
+
+    for task_id, kind, args, kwargs in iter(tasks.get, None):
+        try:
+            results.put((task_id, _TASKS[kind](*args, **kwargs), None))
+        except Exception as exc:  # pylint: disable=broad-except
+            results.put((task_id, None, f"{type(exc).__name__}: {exc}"))
+
+
+class ModelPool:
+    """Runs `num_instances` model processes, each pinned to its own share of the cores.
+
+    Use as a context manager, or call `close` when done:
+
+        with ModelPool("models/yolov8n-pose.pt", num_instances=4) as pool:
+            keypoints = pool.submit_frames(frames).result()
+
+    If an instance dies (e.g. killed for lack of memory), the pool is broken: the pending
+    futures fail with RuntimeError, and so does every later submit.
+
+    Attributes:
+        path_to_model (str): Path to the YOLO pose model.
+        num_instances (int): Number of model instances (processes).
+        core_sets (List[List[int]]): The cores of every instance.
+        backend (str): 'torch', 'onnx' or 'openvino' (see `initialize_yolo_model`).
+    """
+
+    def __init__(
+        self,
+        path_to_model: str,
+        num_instances: int = 1,
+        cores: Optional[Sequence[int]] = None,
+        backend: str = "torch",
+        conf: float = 0.30,
+        warmup_frames: int = 2,
+        imgsz: int = 640,
+        log_file: Optional[str] = "loggs/model_pool.log",
+    ):
+        path_to_model, context = prepare_workers(path_to_model, backend)
+        self.path_to_model = path_to_model
+        self.num_instances = num_instances
+        self.core_sets = partition_cores(
+            available_cores() if cores is None else cores, num_instances
+        )
+        self.backend = backend
+        self.conf = conf
+        self.logger = setup_logger(
+            f"{__name__}.{self.__class__.__name__}", "INFO", log_file
+        )
+
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._futures: Dict[int, Future] = {}
+        self._futures_lock = threading.Lock()
+        self._task_ids = count()
+        self._collector: Optional[threading.Thread] = None
+        self._closed = False
+        self._broken: Optional[RuntimeError] = None
+        self._processes = [
+            context.Process(
+                target=_pool_worker,
+                args=(
+                    path_to_model,
+                    backend,
+                    core_set,
+                    warmup_frames,
+                    imgsz,
+                    self._tasks,
+                    self._results,
+                ),
+                daemon=True,
+            )
+            for core_set in self.core_sets
+        ]
+        start = time.perf_counter()
+        for process in self._processes:
+            process.start()
+        try:
+            errors = [error for _, _, error in (self._get_result() for _ in self._processes)]
+        except RuntimeError as exc:
+            errors = [str(exc)]
+        if any(errors):
+            self.close()
+            raise RuntimeError(f"Failed to start the model pool: {errors}")
+        self.logger.info(
+            f"Started {num_instances} model instances on cores {self.core_sets} "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+
+        self._collector = threading.Thread(target=self._collect_results, daemon=True)
+        self._collector.start()
+
+    def _get_result(self):
+        """Waits for the next message of the instances.
+
+        Raises:
+            RuntimeError: If an instance exited before the pool was closed.
+        """
+        while True:
+            try:
+                return self._results.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                if self._closed:
+                    continue
+                for process in self._processes:
+                    if process.exitcode is not None:
+                        raise RuntimeError(
+                            f"A model instance exited with code {process.exitcode}"
+                        )
+
+    def _collect_results(self) -> None:
+        while True:
+            try:
+                message = self._get_result()
+            except RuntimeError as exc:
+                self._fail_pending(exc)
+                return
+            if message is None:
+                return
+            task_id, result, error = message
+            with self._futures_lock:
+                future = self._futures.pop(task_id)
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def _fail_pending(self, exc: RuntimeError) -> None:
+        """Breaks the pool and fails the futures of all unfinished tasks."""
+        self.logger.error(f"The model pool is broken: {exc}")
+        with self._futures_lock:
+            self._broken = exc
+            futures, self._futures = list(self._futures.values()), {}
+        for future in futures:
+            future.set_exception(exc)
+
+    def _submit(self, kind: str, *args, **kwargs) -> Future:
+        with self._futures_lock:
+            if self._broken is not None:
+                raise self._broken
+            task_id = next(self._task_ids)
+            future = Future()
+            self._futures[task_id] = future
+        self._tasks.put((task_id, kind, args, kwargs))
+        return future
+
+    def submit_frames(self, frames: List[np.ndarray]) -> Future:
+        """Submits a batch of frames (BGR arrays) to the next free instance.
+
+        Returns:
+            Future: Resolves to the keypoints of every frame, float32 arrays of shape
+                    (persons, 17, 3) with X, Y, Prob per keypoint.
+        """
+        return self._submit("frames", list(frames), self.conf)
+
+    def submit_video(
+        self,
+        path_to_video_file_in: pathlib.Path,
+        path_to_keypoints_out: pathlib.Path,
+        **kwargs,
+    ) -> Future:
+        """Submits the keypoints extraction of a video to the next free instance.
+        Keyword arguments go to `extract_keypoints_from_video`.
+
+        Returns:
+            Future: Resolves to the `StageTimer` of the video.
+        """
+        return self._submit(
+            "video", path_to_video_file_in, path_to_keypoints_out, conf=self.conf, **kwargs
+        )
+
+    def close(self) -> None:
+        """Stops the instances once the submitted tasks are done."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join()
+        if self._collector is not None:
+            if self._collector.is_alive():
+                self._results.put(None)
+            self._collector.join()
+
+    def __enter__(self) -> "ModelPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def measure_pool_throughput(
+    path_to_model: str,
+    num_instances: int,
+    frames: List[np.ndarray],
+    batch_size: int = 1,
+    rounds: int = 4,
+    backend: str = "torch",
+) -> float:
+    """Returns the frames/s of a pool with `num_instances` instances on the frames,
+    submitted `rounds` times in batches of `batch_size` frames.
+    """
+    with ModelPool(path_to_model, num_instances, backend=backend, log_file=None) as pool:
+        batches = [
+            frames[i : i + batch_size] for i in range(0, len(frames), batch_size)
+        ] * rounds
+        start = time.perf_counter()
+        futures = [pool.submit_frames(batch) for batch in batches]
+        for future in futures:
+            future.result()
+        seconds = time.perf_counter() - start
+    return len(frames) * rounds / seconds
+
+
+def find_optimal_num_instances(
+    path_to_model: str,
+    frames: List[np.ndarray],
+    candidates: Optional[Sequence[int]] = None,
+    batch_size: int = 1,
+    rounds: int = 4,
+    backend: str = "torch",
+) -> Dict[int, float]:
+    """Measures the throughput of pools of every candidate size on this machine.
+
+    Args:
+        path_to_model (str): Path to the YOLO pose model.
+        frames (List[np.ndarray]): Frames representative of the workload.
+        candidates (Optional[Sequence[int]], optional): Numbers of instances to try.
+            Defaults to the powers of two up to the number of cores, and that number.
+        batch_size (int, optional): Frames per submitted task. Defaults to 1.
+        rounds (int, optional): Times the frames are submitted. Defaults to 4.
+        backend (str, optional): Inference backend. Defaults to "torch".
+
+    Returns:
+        Dict[int, float]: Frames/s by number of instances, the optimal K is its argmax.
+    """
+    if candidates is None:
+        num_cores = len(available_cores())
+        candidates = sorted(
+            {2**i for i in range(num_cores.bit_length()) if 2**i <= num_cores}
+            | {num_cores}
+        )
+    return {
+        num_instances: measure_pool_throughput(
+            path_to_model, num_instances, frames, batch_size, rounds, backend
+        )
+        for num_instances in candidates
+    }
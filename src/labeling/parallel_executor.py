@@ -0,0 +1,286 @@
+"""The module provides a process pool to extract keypoints from many videos in parallel."""
+import pathlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from src.data.adaptive_resolution import AdaptiveResolution
+from src.data.keypoints_factories import (
+    CONF,
+    extract_keypoints_at_adaptive_resolution,
+    extract_keypoints_from_video,
+    list_video_tasks,
+    open_completion_manifest,
+    pending_video_tasks,
+)
+from src.data.video_metadata import VideoMetadataIndex, build_video_metadata_index
+from src.models.devices import to_device
+from src.labeling.workers import prepare_workers
+from src.models.initialize_models import initialize_yolo_model
+from src.utils.loggers import setup_logger
+from src.utils.timing import StageTimer
+
+# The model of the current worker process, loaded once by `_init_worker`
+_worker_model = None
+
+
+@dataclass
+class VideoResult:
+    """The outcome of processing a single video."""
+
+    path_to_video_file_in: pathlib.Path
+    path_to_keypoints_out: pathlib.Path
+    seconds: float
+    error: Optional[str] = None
+    timer: Optional[StageTimer] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class ParallelRunSummary:
+    """The outcome of processing all videos."""
+
+    results: List[VideoResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def num_succeeded(self) -> int:
+        return sum(result.succeeded for result in self.results)
+
+    @property
+    def num_failed(self) -> int:
+        return len(self.results) - self.num_succeeded
+
+    @property
+    def failed(self) -> List[VideoResult]:
+        return [result for result in self.results if not result.succeeded]
+
+
+def _init_worker(
+    path_to_model: str, threads_per_worker: int, device: str, backend: str = "torch"
+) -> None:
+    """Limits torch intra-op threads and loads the model once per worker process."""
+    global _worker_model
+
+    import torch
+    from ultralytics.utils.torch_utils import select_device
+
+    torch.set_num_threads(threads_per_worker)
+    _worker_model = to_device(
+        initialize_yolo_model(path_to_model, backend), select_device(device)
+    )
+
+
+def _process_video_task(
+    path_to_video_file_in: pathlib.Path,
+    path_to_keypoints_out: pathlib.Path,
+    stride: int = 1,
+    motion_threshold: float = 0.0,
+    resolution: Optional[str] = None,
+) -> VideoResult:
+    """Extracts keypoints from a video, isolating any error to this video.
+    The stage timings travel back to the parent process with the result.
+    """
+    start = time.perf_counter()
+    timer = StageTimer()
+    try:
+        if resolution is not None:
+            extract_keypoints_at_adaptive_resolution(
+                _worker_model,
+                AdaptiveResolution(resolution, conf=CONF),
+                path_to_video_file_in,
+                path_to_keypoints_out,
+                timer=timer,
+                stride=stride,
+                motion_threshold=motion_threshold,
+            )
+        else:
+            extract_keypoints_from_video(
+                _worker_model,
+                path_to_video_file_in,
+                path_to_keypoints_out,
+                timer=timer,
+                stride=stride,
+                motion_threshold=motion_threshold,
+            )
+        error = None
+    except Exception as exc:  # pylint: disable=broad-except
+        error = f"{type(exc).__name__}: {exc}"
+    return VideoResult(
+        path_to_video_file_in,
+        path_to_keypoints_out,
+        time.perf_counter() - start,
+        error,
+        timer,
+    )
+
+
+def _schedule_longest_first(
+    tasks: List[Tuple[pathlib.Path, pathlib.Path]], metadata_index: VideoMetadataIndex
+) -> Tuple[List[Tuple[pathlib.Path, pathlib.Path]], Dict[pathlib.Path, int]]:
+    """Orders the tasks by the frame count of their videos, longest first, so that a long
+    video does not start last and keep one worker busy after the others are done.
+
+    Returns:
+        Tuple[List[Tuple[pathlib.Path, pathlib.Path]], Dict[pathlib.Path, int]]:
+            The ordered tasks and the frame count of every video (0 if unknown).
+    """
+    frame_counts = {}
+    for path_in, _ in tasks:
+        metadata = metadata_index.get(path_in)
+        frame_counts[path_in] = metadata.frame_count if metadata is not None else 0
+    ordered = sorted(tasks, key=lambda task: frame_counts[task[0]], reverse=True)
+    return ordered, frame_counts
+
+
+def parallel_keypoints_factory(
+    path_to_model: str,
+    path_to_video_folder: pathlib.Path,
+    path_to_csv_keypoits_folder: pathlib.Path,
+    classes: Dict[str, str],
+    num_workers: int,
+    threads_per_worker: int,
+    device: str = "cpu",
+    output_format: str = "csv",
+    log_file: Optional[str] = None,
+    resume: bool = True,
+    timer: Optional[StageTimer] = None,
+    stride: int = 1,
+    motion_threshold: float = 0.0,
+    backend: str = "torch",
+    resolution: Optional[str] = None,
+) -> ParallelRunSummary:
+    """Extract keypoints from videos in `num_workers` processes.
+
+    Every worker loads the model once and uses `threads_per_worker` torch threads,
+    so num_workers * threads_per_worker should not exceed the number of cores.
+    A failing video is recorded in the summary and does not stop the other videos.
+    If a worker process dies (e.g. out of memory while loading the model), the pool is
+    broken and every unfinished video is recorded as failed.
+    Videos are submitted longest first by the frame counts of the metadata index of
+    the video folder (see `src.data.video_metadata`), which also give the logged ETA.
+
+    Args:
+        path_to_model (str): Path to the YOLO pose model.
+        path_to_video_folder (pathlib.Path):
+            Path to the folder (with subfolders as classes) with video files.
+        path_to_csv_keypoits_folder (pathlib.Path):
+            Path to the folder where the keypoints will be stored.
+        classes (Dict[str, str]):
+            The classes (ex. "crossing", "defence", "shot", and etc.)
+            to correctly iterate over video folders.
+        num_workers (int): Number of worker processes.
+        threads_per_worker (int): Torch intra-op threads of every worker.
+        device (str): Compute device ('cpu' or 'cuda'). Default is 'cpu'.
+        output_format (str): 'csv' or 'store' (columnar keypoints store). Default is 'csv'.
+        log_file (Optional[str], optional): Path to the log file. Defaults to None.
+        resume (bool): Skip the videos that are up to date in the completion manifest.
+            Default is True.
+        timer (Optional[StageTimer]): Collects the stage timings of all workers.
+            Default is None.
+        stride (int): Run the model on every `stride`-th frame and interpolate
+            the keypoints of the frames in between. Default is 1.
+        motion_threshold (float): Reuse the keypoints of the last inferred frame on
+            near-static frames. Default is 0.0 (off).
+        backend (str): 'torch', 'onnx' or 'openvino' (see `initialize_yolo_model`).
+            Default is 'torch'.
+        resolution (Optional[str]): 'speed', 'balanced' or 'accuracy' to choose the
+            inference resolution of every video from a probe of its first frames.
+            Default is None (the model resolution).
+
+    Returns:
+        ParallelRunSummary: Per-video results and the total wall time.
+    """
+    logger = setup_logger(name="parallel_executor", level="INFO", log_file=log_file)
+    path_to_model, context = prepare_workers(path_to_model, backend)
+    manifest = open_completion_manifest(path_to_csv_keypoits_folder, resume)
+    all_tasks = list_video_tasks(
+        path_to_video_folder, path_to_csv_keypoits_folder, classes, output_format
+    )
+    tasks = pending_video_tasks(
+        all_tasks,
+        manifest,
+        path_to_model,
+        stride=stride,
+        motion_threshold=motion_threshold,
+        resolution=resolution,
+    )
+    logger.info(f"{len(all_tasks) - len(tasks)} videos are up to date, skipping them")
+    tasks, frame_counts = _schedule_longest_first(
+        tasks, build_video_metadata_index(path_to_video_folder)
+    )
+    total_frames = sum(frame_counts.values())
+    logger.info(f"Scheduled {len(tasks)} videos with {total_frames} frames, longest first")
+    summary = ParallelRunSummary()
+    done_frames = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(path_to_model, threads_per_worker, device, backend),
+    ) as executor:
+        futures = {
+            executor.submit(
+                _process_video_task,
+                path_in,
+                path_out,
+                stride,
+                motion_threshold,
+                resolution,
+            ): (path_in, path_out)
+            for path_in, path_out in tasks
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except BrokenProcessPool as err:
+                path_in, path_out = futures[future]
+                result = VideoResult(
+                    path_in, path_out, 0.0, error=f"A worker process died: {err}"
+                )
+            summary.results.append(result)
+            done_frames += frame_counts[result.path_to_video_file_in]
+            if timer is not None and result.timer is not None:
+                timer.merge(result.timer)
+            if result.succeeded:
+                elapsed = time.perf_counter() - start
+                eta = (
+                    f"{elapsed * (total_frames - done_frames) / done_frames:.0f} s"
+                    if done_frames
+                    else "unknown"
+                )
+                logger.info(
+                    f"Processed {result.path_to_video_file_in} in {result.seconds:.1f} s, "
+                    f"{len(summary.results)} of {len(tasks)} videos done, ETA {eta}"
+                )
+                if manifest is not None:
+                    manifest.mark_done(
+                        result.path_to_video_file_in,
+                        result.path_to_keypoints_out,
+                        path_to_model,
+                        CONF,
+                        stride,
+                        motion_threshold,
+                        resolution,
+                    )
+            else:
+                logger.error(
+                    f"Failed to process {result.path_to_video_file_in}: {result.error}"
+                )
+                if manifest is not None:
+                    manifest.mark_failed(result.path_to_video_file_in, result.error)
+
+    summary.seconds = time.perf_counter() - start
+    logger.info(
+        f"Processed {summary.num_succeeded} of {len(tasks)} videos "
+        f"({summary.num_failed} failed) with {num_workers} workers "
+        f"in {summary.seconds:.1f} s"
+    )
+    return summary
@@ -0,0 +1,28 @@
+"""The module provides the setup shared by the model worker processes of
+`src.labeling.parallel_executor` and `src.labeling.model_pool`.
+"""
+import multiprocessing
+from typing import Tuple
+
+from src.models.initialize_models import backend_model_path
+
+
+def prepare_workers(
+    path_to_model: str, backend: str
+) -> Tuple[str, multiprocessing.context.BaseContext]:
+    """Exports the PyTorch weights to the backend once, rather than in every worker,
+    and returns the multiprocessing context to start the workers with.
+
+    The workers are spawned, since forking a process that already holds torch thread
+    pools can deadlock them.
+
+    Args:
+        path_to_model (str): Path to the YOLO pose model.
+        backend (str): 'torch', 'onnx' or 'openvino' (see `initialize_yolo_model`).
+
+    Returns:
+        Tuple[str, multiprocessing.context.BaseContext]: The path of the model the
+            workers load and the "spawn" context.
+    """
+    path_to_model = backend_model_path(path_to_model, backend)
+    return path_to_model, multiprocessing.get_context("spawn")
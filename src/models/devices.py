@@ -0,0 +1,22 @@
+"""The module moves YOLO models to compute devices.
+
+Models exported to ONNX or OpenVINO (see `src.models.initialize_models`) cannot be moved
+with `.to()`, `ultralytics` raises a TypeError for any model that is not a PyTorch one.
+They run where their runtime puts them, so they are left as they are.
+"""
+import pathlib
+
+
+def is_pytorch_model(model) -> bool:
+    """Checks whether a YOLO model holds PyTorch weights rather than an export."""
+    weights = getattr(model, "model", None)
+    return not isinstance(weights, (str, pathlib.Path)) or (
+        pathlib.Path(weights).suffix == ".pt"
+    )
+
+
+def to_device(model, device):
+    """Moves a PyTorch YOLO model to the device and returns an exported model as is."""
+    if is_pytorch_model(model):
+        return model.to(device)
+    return model
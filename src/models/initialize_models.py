@@ -1,10 +1,87 @@
-from ultralytics import YOLO
+import os
+from typing import Optional
 
+from src.data.two_stage_pose import TwoStagePoseEstimator
+
+# Inference backends of `initialize_yolo_model`: PyTorch or a cached export
+BACKENDS = ("torch", "onnx", "openvino")
+
+
+def exported_model_path(path_to_model: str, backend: str) -> str:
+    """Returns where `ultralytics` exports the weights for a backend, next to the weights."""
+    root, _ = os.path.splitext(path_to_model)
+    if backend == "onnx":
+        return f"{root}.onnx"
+    if backend == "openvino":
+        return f"{root}_openvino_model{os.sep}"
+    raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+
+def export_yolo_model(path_to_model: str, backend: str) -> str:
+    """Exports the PyTorch weights to the backend format, unless an export newer than
+    the weights already exists, and returns the path of the export.
+
+    The export has dynamic batch and image sizes, so batched inference and the crops
+    of the two-stage mode work as with the PyTorch model.
+    """
+    path_to_export = exported_model_path(path_to_model, backend)
+    if os.path.exists(path_to_export) and os.path.getmtime(
+        path_to_export
+    ) >= os.path.getmtime(path_to_model):
+        return path_to_export
+
+    from ultralytics import YOLO
 
-def initialize_yolo_model(path_to_model: str):
-    """Initialize and return the YOLO model."""
+    try:
+        return str(YOLO(path_to_model).export(format=backend, dynamic=True))
+    except Exception as exc:
+        raise RuntimeError(f"Failed to export model to {backend}: {exc}") from exc
+
+
+def backend_model_path(path_to_model: str, backend: str) -> str:
+    """Returns the path of the model to load for the backend: the export of PyTorch
+    weights for "onnx" and "openvino" (see `export_yolo_model`), the path as is otherwise.
+    """
+    if backend != "torch" and path_to_model.endswith(".pt"):
+        return export_yolo_model(path_to_model, backend)
+    return path_to_model
+
+
+def initialize_yolo_model(path_to_model: str, backend: str = "torch"):
+    """Initialize and return the YOLO model.
+
+    With the "onnx" or "openvino" backend, the PyTorch weights are exported once (see
+    `export_yolo_model`) and the export is loaded instead. Such a model is called and
+    returns results like the PyTorch one, but cannot be moved with `.to()`, use
+    `src.models.devices.to_device`.
+    """
+    # ultralytics (and torch) are imported on first use to keep startup fast
+    from ultralytics import YOLO
+
+    path_to_model = backend_model_path(path_to_model, backend)
     try:
         model = YOLO(path_to_model)
         return model
     except Exception as exc:
         raise RuntimeError(f"Failed to initialize model: {exc}") from exc
+
+
+def initialize_pose_model(
+    path_to_model: str,
+    path_to_detection_model: Optional[str] = None,
+    crop_size: int = 256,
+    detect_every: int = 1,
+    backend: str = "torch",
+):
+    """Initialize and return the pose model, or with a detection model, a two-stage
+    estimator that runs the pose model on person crops (see `src.data.two_stage_pose`).
+    """
+    pose_model = initialize_yolo_model(path_to_model, backend)
+    if path_to_detection_model is None:
+        return pose_model
+    return TwoStagePoseEstimator(
+        initialize_yolo_model(path_to_detection_model, backend),
+        pose_model,
+        crop_size=crop_size,
+        detect_every=detect_every,
+    )
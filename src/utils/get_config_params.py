@@ -3,6 +3,25 @@ from pathlib import Path
 from src.load_config import load_config
 
 
+def _read_labeling_options(config: dict) -> dict:
+    """Reads the options of the keypoints extraction, shared by all run modes."""
+    return {
+        "output_format": config["keypoints"]["output_format"],
+        "num_workers": config["parallel"]["num_workers"],
+        "threads_per_worker": config["parallel"]["threads_per_worker"],
+        "batch_size": config["batching"]["batch_size"],
+        "max_open_videos": config["batching"]["max_open_videos"],
+        "stride": config["keypoints"]["stride"],
+        "motion_threshold": config["keypoints"]["motion_threshold"],
+        "path_to_detection_model": config["models"]["detection"],
+        "two_stage": config["two_stage"]["enabled"],
+        "crop_size": config["two_stage"]["crop_size"],
+        "detect_every": config["two_stage"]["detect_every"],
+        "backend": config["models"]["backend"],
+        "resolution": config["keypoints"]["resolution"],
+    }
+
+
 def get_config_params_for_autolabeling_on_AWS():
     """Load configuration and extract necessary parameters."""
     config = load_config()
@@ -15,6 +34,7 @@ def get_config_params_for_autolabeling_on_AWS():
         "bucket_path_to_download": config["S3"]["actions"],
         "bucket_path_to_upload": config["S3"]["auto_labeling"],
         "artifact_location": config["S3"]["artifact_location"],
+        **_read_labeling_options(config),
     }
 
     params["path_to_local_video_folder"] = (
@@ -39,6 +59,7 @@ def get_config_params_for_autolabeling_locally():
         "bucket_path_to_download": config["S3"]["actions"],
         "bucket_path_to_upload": config["S3"]["auto_labeling"],
         "artifact_location": config["S3"]["artifact_location"],
+        **_read_labeling_options(config),
     }
 
     params["path_to_local_video_folder"] = (
@@ -63,6 +84,7 @@ def get_config_params_for_autolabeling_debug_mode():
         "bucket_path_to_download": config["S3"]["actions"],
         "bucket_path_to_upload": config["S3"]["auto_labeling"],
         "artifact_location": config["S3"]["artifact_location"],
+        **_read_labeling_options(config),
     }
 
     params["path_to_local_video_folder"] = (
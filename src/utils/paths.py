@@ -0,0 +1,17 @@
+"""The module provides the keys of files in the JSON indexes and manifests of a folder."""
+import os
+import pathlib
+from typing import Union
+
+PathLike = Union[str, pathlib.Path]
+
+
+def relative_key(path: PathLike, folder: PathLike) -> str:
+    """Returns the resolved path of a file relative to a folder, with "/" separators.
+
+    The key is the same for relative and absolute paths to the file, from any working
+    directory, and stays valid when the folder and the file are moved together.
+    """
+    return pathlib.Path(
+        os.path.relpath(pathlib.Path(path).resolve(), pathlib.Path(folder).resolve())
+    ).as_posix()
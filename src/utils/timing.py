@@ -0,0 +1,170 @@
+"""The module provides lightweight per-stage and per-frame timing of the keypoints pipeline.
+
+A timer costs a few `time.perf_counter` calls per frame and 8 bytes per frame latency,
+so it can stay on in production. A disabled timer keeps the same interface and does nothing.
+"""
+import time
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Sequence
+
+import numpy as np
+
+# ultralytics reports these per image in `Results.speed`, in milliseconds
+MODEL_STAGES = ("preprocess", "inference", "postprocess")
+
+
+class StageTimer:
+    """Accumulates wall time per named stage, per video, and the latency of every frame.
+
+    Stages:
+        s3_download, decode, preprocess, inference, postprocess,
+        keypoint_extraction, tracking, write, render, s3_upload
+
+    Attributes:
+        enabled (bool): Whether anything is measured.
+        totals (Dict[str, float]): Total seconds per stage.
+        videos (Dict[str, float]): Total seconds per video.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.totals: Dict[str, float] = defaultdict(float)
+        self.videos: Dict[str, float] = {}
+        self._frame_latencies = array("d")
+        self._frame_start: Optional[float] = None
+
+    def add(self, name: str, seconds: float) -> None:
+        """Adds seconds to the total of a stage."""
+        if self.enabled:
+            self.totals[name] += seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Times the block as a stage."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += time.perf_counter() - start
+
+    @contextmanager
+    def video(self, path_to_video_file_in) -> Iterator[None]:
+        """Times the processing of a whole video."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_video(path_to_video_file_in, time.perf_counter() - start)
+
+    def add_video(self, path_to_video_file_in, seconds: float) -> None:
+        """Records the total seconds of a video."""
+        if self.enabled:
+            self.videos[str(path_to_video_file_in)] = seconds
+
+    def add_model_speed(self, frame_data) -> float:
+        """Adds the model stages of a result from `Results.speed`.
+
+        Returns:
+            float: Seconds spent in the model stages.
+        """
+        if not self.enabled:
+            return 0.0
+        speed = getattr(frame_data, "speed", None) or {}
+        model_seconds = 0.0
+        for name in MODEL_STAGES:
+            if speed.get(name) is not None:
+                self.totals[name] += speed[name] / 1000
+                model_seconds += speed[name] / 1000
+        return model_seconds
+
+    def record_frames(self, seconds: float, num_frames: int = 1) -> None:
+        """Records the latency of frames processed together, split evenly between them."""
+        if self.enabled and num_frames:
+            self._frame_latencies.extend([seconds / num_frames] * num_frames)
+
+    def iter_results(self, results: Iterable) -> Iterator:
+        """Yields streamed model results and times producing every one of them.
+
+        The model stages are taken from `Results.speed`, the rest of the time spent
+        in the stream (reading and decoding the frame) is accounted as `decode`.
+        The frame latency runs from requesting a result until `end_frame` is called.
+        """
+        if not self.enabled:
+            yield from results
+            return
+        iterator = iter(results)
+        while True:
+            self._frame_start = time.perf_counter()
+            try:
+                frame_data = next(iterator)
+            except StopIteration:
+                self._frame_start = None
+                return
+            seconds = time.perf_counter() - self._frame_start
+            model_seconds = self.add_model_speed(frame_data)
+            self.totals["decode"] += max(seconds - model_seconds, 0.0)
+            yield frame_data
+
+    def end_frame(self) -> None:
+        """Records the latency of the frame last yielded by `iter_results`."""
+        if self.enabled and self._frame_start is not None:
+            self._frame_latencies.append(time.perf_counter() - self._frame_start)
+            self._frame_start = None
+
+    @property
+    def num_frames(self) -> int:
+        return len(self._frame_latencies)
+
+    def frame_latency_percentiles(
+        self, percentiles: Sequence[float] = (50, 90, 99)
+    ) -> Dict[float, float]:
+        """Returns the frame latency percentiles in seconds."""
+        if not self.num_frames:
+            return {}
+        latencies = np.frombuffer(self._frame_latencies, dtype=np.float64)
+        return dict(zip(percentiles, np.percentile(latencies, percentiles)))
+
+    def merge(self, other: "StageTimer") -> None:
+        """Adds the measurements of another timer, e.g. one of a worker process."""
+        if not self.enabled:
+            return
+        for name, seconds in other.totals.items():
+            self.totals[name] += seconds
+        self.videos.update(other.videos)
+        self._frame_latencies.extend(other._frame_latencies)
+
+    def metrics(self, wall_seconds: Optional[float] = None) -> Dict[str, float]:
+        """Returns stage totals, frame and video counts and frame latency percentiles
+        as flat metrics, e.g. for `mlflow.log_metrics`. Videos may overlap in time,
+        so the throughput is computed only from the `wall_seconds` of the whole run.
+        """
+        metrics = {f"{name}_s": seconds for name, seconds in self.totals.items()}
+        metrics["frames"] = self.num_frames
+        metrics["videos"] = len(self.videos)
+        if wall_seconds:
+            metrics["wall_s"] = wall_seconds
+            metrics["frames_per_s"] = self.num_frames / wall_seconds
+        for percentile, seconds in self.frame_latency_percentiles().items():
+            metrics[f"frame_latency_p{percentile:g}_ms"] = seconds * 1000
+        return metrics
+
+    def video_metrics(self) -> Iterator[Dict[str, float]]:
+        """Yields the seconds of every video as a metric, one per video in processing order."""
+        for seconds in self.videos.values():
+            yield {"video_s": seconds}
+
+
+def get_timer(timer: Optional[StageTimer]) -> StageTimer:
+    """Returns the timer, or a disabled one if there is none."""
+    return timer if timer is not None else _DISABLED_TIMER
+
+
+_DISABLED_TIMER = StageTimer(enabled=False)
@@ -0,0 +1,39 @@
+import os
+import pathlib
+
+import pytest
+
+from benchmarks.synthetic import write_synthetic_video
+
+
+@pytest.fixture(autouse=True)
+def _loggs_dir(tmp_path, monkeypatch):
+    """Runs every test in its own directory, with the "loggs" folder the loggers write to."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("loggs", exist_ok=True)
+
+
+@pytest.fixture
+def video_folder(tmp_path) -> pathlib.Path:
+    """A folder with a class subfolder holding a short synthetic video."""
+    folder = tmp_path / "videos"
+    (folder / "shot").mkdir(parents=True)
+    write_synthetic_video(folder / "shot" / "clip.avi", 6, 320, 240)
+    return folder
+
+
+@pytest.fixture(scope="session")
+def pose_model_path(tmp_path_factory) -> str:
+    """A YOLOv8n pose checkpoint with random weights, built offline from the bundled config."""
+    torch = pytest.importorskip("torch")
+    ultralytics = pytest.importorskip("ultralytics")
+
+    # The checkpoints of ultralytics pickle the whole model, which newer torch versions
+    # refuse to load by default
+    os.environ.setdefault("TORCH_FORCE_NO_WEIGHTS_ONLY_LOAD", "1")
+    model = ultralytics.YOLO("yolov8n-pose.yaml").model
+    model.kpt_shape = model.yaml["kpt_shape"]
+    model.args = {"task": "pose"}
+    path = tmp_path_factory.mktemp("models") / "yolov8n-pose.pt"
+    torch.save({"model": model, "train_args": {"task": "pose"}}, path)
+    return str(path)
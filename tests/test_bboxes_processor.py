@@ -0,0 +1,39 @@
+import numpy as np
+
+from src.data.bboxes_processor import MIN_SCORE, load_bounding_boxes
+
+# Scores whose float32 value rounds or compares differently than the Python float
+BOX_LINES = {
+    1: ["10.9,20.5,30.99,40.0,0.615", "1.5,2.5,3.5,4.5,0.125"],
+    2: ["16777217.0,5.7,16777219.0,9.2,0.5000000001", "0,0,1,1,0.5"],
+    3: ["-0.5,7.999999999,8.0,9.0,0.995"],
+}
+
+
+def _baseline_labels(lines):
+    """The boxes and labels the baseline drew, parsed with `float`."""
+    drawn = []
+    for line in lines:
+        x1, y1, x2, y2, score = map(float, line.split(","))
+        if score > MIN_SCORE:
+            drawn.append(((int(x1), int(y1), int(x2), int(y2)), f"{score:.2f}"))
+    return drawn
+
+
+def test_drawn_boxes_and_labels_match_the_baseline(tmp_path):
+    path = tmp_path / "boxes.csv"
+    path.write_text(
+        "".join(
+            f"Frame {frame}\n" + "".join(f"{line}\n" for line in lines)
+            for frame, lines in BOX_LINES.items()
+        )
+    )
+    frames_data = load_bounding_boxes(path, chunk_lines=2).filter(MIN_SCORE)
+
+    for frame, lines in BOX_LINES.items():
+        boxes, scores = frames_data.get_frame(frame)
+        drawn = [
+            (tuple(box), f"{score:.2f}")
+            for box, score in zip(boxes.astype(np.int64).tolist(), scores)
+        ]
+        assert drawn == _baseline_labels(lines)
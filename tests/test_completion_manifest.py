@@ -0,0 +1,34 @@
+import os
+
+from src.data.completion_manifest import MANIFEST_NAME, CompletionManifest
+
+
+def test_entries_are_found_from_any_directory(video_folder, tmp_path, monkeypatch):
+    out_folder = tmp_path / "keypoints"
+    (out_folder / "shot").mkdir(parents=True)
+    (out_folder / "shot" / "clip.csv").write_text("Frame\n")
+
+    # The tests run in tmp_path, so relative paths start there
+    manifest = CompletionManifest(os.path.join("keypoints", MANIFEST_NAME))
+    manifest.mark_done(
+        os.path.join("videos", "shot", "clip.avi"),
+        os.path.join("keypoints", "shot", "clip.csv"),
+        "model.pt",
+        0.3,
+    )
+    assert list(manifest.entries) == ["../videos/shot/clip.avi"]
+
+    monkeypatch.chdir(video_folder)
+    manifest = CompletionManifest(out_folder / MANIFEST_NAME)
+    assert manifest.is_up_to_date(
+        video_folder / "shot" / "clip.avi",
+        out_folder / "shot" / "clip.csv",
+        "model.pt",
+        0.3,
+    )
+    assert manifest.is_up_to_date(
+        os.path.join("shot", "clip.avi"),
+        os.path.join("..", "keypoints", "shot", "clip.csv"),
+        "model.pt",
+        0.3,
+    )
@@ -0,0 +1,75 @@
+import pytest
+
+from src.aws.data_exchange import (
+    MANIFEST_NAME,
+    download_data_from_S3,
+    upload_data_to_s3,
+)
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+BUCKET = "test-bucket"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def test_upload_skips_unchanged_files_and_bookkeeping(s3, tmp_path):
+    local = tmp_path / "out"
+    (local / "shot").mkdir(parents=True)
+    (local / "shot" / "clip.csv").write_text("Frame,Person\n")
+    (local / MANIFEST_NAME).write_text("{}")
+    (local / "shot" / "clip.tmp").write_text("partial")
+
+    first = upload_data_to_s3(local, BUCKET, "labels", s3_client=s3)
+    second = upload_data_to_s3(local, BUCKET, "labels", s3_client=s3)
+
+    keys = [obj["Key"] for obj in s3.list_objects_v2(Bucket=BUCKET)["Contents"]]
+    assert keys == ["labels/shot/clip.csv"]
+    assert (first.num_transferred, first.num_skipped) == (1, 0)
+    assert (second.num_transferred, second.num_skipped) == (0, 1)
+
+
+def test_download_skips_unchanged_objects_and_refetches_on_etag_change(s3, tmp_path):
+    s3.put_object(Bucket=BUCKET, Key="actions/shot/clip.mp4", Body=b"first")
+    local = tmp_path / "videos"
+
+    first = download_data_from_S3(BUCKET, "actions", local, s3_client=s3)
+    unchanged = download_data_from_S3(BUCKET, "actions", local, s3_client=s3)
+    s3.put_object(Bucket=BUCKET, Key="actions/shot/clip.mp4", Body=b"other")
+    changed = download_data_from_S3(BUCKET, "actions", local, s3_client=s3)
+
+    assert (first.num_transferred, unchanged.num_skipped) == (1, 1)
+    assert changed.num_transferred == 1
+    assert (local / "shot" / "clip.mp4").read_bytes() == b"other"
+
+
+def test_failed_transfers_are_counted(s3, tmp_path):
+    s3.put_object(Bucket=BUCKET, Key="actions/shot/a.mp4", Body=b"a")
+    s3.put_object(Bucket=BUCKET, Key="actions/shot/b.mp4", Body=b"b")
+
+    class FailingClient:
+        def __getattr__(self, name):
+            return getattr(s3, name)
+
+        def download_file(self, bucket, key, *args, **kwargs):
+            if key.endswith("a.mp4"):
+                raise ConnectionError("connection reset")
+            return s3.download_file(bucket, key, *args, **kwargs)
+
+    local = tmp_path / "videos"
+    summary = download_data_from_S3(BUCKET, "actions", local, s3_client=FailingClient())
+    retry = download_data_from_S3(BUCKET, "actions", local, s3_client=s3)
+
+    assert (summary.num_transferred, summary.num_failed) == (1, 1)
+    # The failed object is not in the manifest, so the next run fetches it
+    assert (retry.num_transferred, retry.num_skipped) == (1, 1)
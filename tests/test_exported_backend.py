@@ -0,0 +1,35 @@
+import pytest
+
+from src.data.keypoints_factories import _to_device, csv_keypoints_factory
+from src.models.devices import is_pytorch_model
+from src.models.initialize_models import initialize_pose_model
+
+
+@pytest.fixture(scope="module")
+def onnx_model(pose_model_path):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    return initialize_pose_model(pose_model_path, backend="onnx")
+
+
+def test_exported_model_is_not_moved(onnx_model):
+    assert not is_pytorch_model(onnx_model)
+    assert _to_device(onnx_model, "cpu") is onnx_model
+
+
+def test_csv_factory_runs_with_an_exported_backend(onnx_model, video_folder, tmp_path):
+    out_folder = tmp_path / "keypoints"
+    csv_keypoints_factory(
+        onnx_model, video_folder, out_folder, {0: "shot"}, output_format="store"
+    )
+    # A model with random weights may find nobody, but the video must be processed
+    manifest = (out_folder / ".completion_manifest.json").read_text()
+    assert '"done"' in manifest
+
+
+def test_two_stage_estimator_with_an_exported_backend(pose_model_path):
+    pytest.importorskip("onnxruntime")
+    estimator = initialize_pose_model(
+        pose_model_path, pose_model_path, backend="onnx"
+    )
+    assert estimator.to("cpu") is estimator
@@ -0,0 +1,47 @@
+import json
+
+import torch
+
+from benchmarks.synthetic import SyntheticResult, synthetic_keypoints, write_synthetic_video
+from src.data.keypoints_factories import batched_keypoints_factory
+
+
+class SmallFramesFailModel:
+    """Finds one person in every frame, but fails on any batch with a small frame."""
+
+    def to(self, device):
+        return self
+
+    def __call__(self, frames, **kwargs):
+        if any(frame.shape[1] < 320 for frame in frames):
+            raise RuntimeError("Broken frame")
+        return [
+            SyntheticResult(torch.from_numpy(synthetic_keypoints(1, 320, 240)))
+            for _ in frames
+        ]
+
+
+def test_failed_video_is_recorded_and_the_others_go_on(tmp_path):
+    video_folder = tmp_path / "videos"
+    (video_folder / "shot").mkdir(parents=True)
+    write_synthetic_video(video_folder / "shot" / "good.avi", 6, 320, 240)
+    write_synthetic_video(video_folder / "shot" / "bad.avi", 6, 160, 120)
+    out_folder = tmp_path / "keypoints"
+    (out_folder / "shot").mkdir(parents=True)
+
+    batched_keypoints_factory(
+        SmallFramesFailModel(),
+        video_folder,
+        out_folder,
+        {0: "shot"},
+        batch_size=4,
+        max_open_videos=2,
+    )
+
+    manifest = json.loads((out_folder / ".completion_manifest.json").read_text())
+    statuses = {key.rsplit("/", 1)[-1]: entry["status"] for key, entry in manifest.items()}
+    assert statuses == {"good.avi": "done", "bad.avi": "failed"}
+    assert "Broken frame" in manifest["../videos/shot/bad.avi"]["error"]
+    # Every frame of the good video was written despite the shared batches
+    lines = (out_folder / "shot" / "good.csv").read_text().splitlines()
+    assert len(lines) == 1 + 6 * 17
@@ -0,0 +1,42 @@
+import json
+
+from src.data.keypoints_factories import csv_keypoints_factory, fused_keypoints_factory
+from src.models.initialize_models import initialize_yolo_model
+from src.utils.timing import StageTimer
+
+
+def test_fused_factory_is_timed_and_resumable(pose_model_path, video_folder, tmp_path):
+    model = initialize_yolo_model(pose_model_path)
+    out_folder = tmp_path / "keypoints"
+    timer = StageTimer()
+
+    fused_keypoints_factory(
+        model, video_folder, out_folder, {0: "shot"}, [[5, 6]], timer=timer
+    )
+    assert (out_folder / "shot" / "clip.avi").exists()
+    assert timer.num_frames == 6
+    assert {"inference", "render"} <= set(timer.totals)
+    manifest = json.loads((out_folder / ".completion_manifest.json").read_text())
+    assert [entry["status"] for entry in manifest.values()] == ["done"]
+
+    # An up-to-date video is skipped on the next run
+    second_timer = StageTimer()
+    fused_keypoints_factory(
+        model, video_folder, out_folder, {0: "shot"}, [[5, 6]], timer=second_timer
+    )
+    assert second_timer.num_frames == 0
+
+
+def test_fused_factory_renders_videos_of_a_csv_run(pose_model_path, video_folder, tmp_path):
+    model = initialize_yolo_model(pose_model_path)
+    out_folder = tmp_path / "keypoints"
+    csv_keypoints_factory(model, video_folder, out_folder, {0: "shot"})
+    assert not (out_folder / "shot" / "clip.avi").exists()
+
+    # The keypoints are up to date, but the video with keypoints was never rendered
+    timer = StageTimer()
+    fused_keypoints_factory(
+        model, video_folder, out_folder, {0: "shot"}, [[5, 6]], timer=timer
+    )
+    assert (out_folder / "shot" / "clip.avi").exists()
+    assert timer.num_frames == 6
@@ -0,0 +1,41 @@
+import csv
+
+import cv2
+import numpy as np
+import torch
+
+from benchmarks.synthetic import SyntheticResult, synthetic_keypoints
+from src.data.keypoints_interpolation import StridedKeyPointsExtractor
+
+
+class StaticPersonsModel:
+    """Finds the same two persons in every frame."""
+
+    def __init__(self):
+        self.keypoints = torch.from_numpy(synthetic_keypoints(2, 320, 240))
+
+    def __call__(self, frame, **kwargs):
+        return [SyntheticResult(self.keypoints.clone())]
+
+
+def test_person_ids_survive_a_long_static_stretch(tmp_path):
+    path_to_video = tmp_path / "static.avi"
+    writer = cv2.VideoWriter(
+        str(path_to_video), cv2.VideoWriter_fourcc(*"MJPG"), 25, (320, 240)
+    )
+    for _ in range(120):
+        writer.write(np.full((240, 320, 3), 128, dtype=np.uint8))
+    writer.release()
+
+    path_to_csv = tmp_path / "static.csv"
+    extractor = StridedKeyPointsExtractor(
+        StaticPersonsModel(), stride=1, motion_threshold=1.0, log_file=None
+    )
+    extractor.write_keypoints(path_to_video, path_to_csv)
+
+    with open(path_to_csv, newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert len({row["Frame"] for row in rows}) == 120
+    # The motion gate reuses the persons for up to 50 frames in a row, longer than
+    # the tracker keeps a track without a match
+    assert {row["Person"] for row in rows} == {"0", "1"}
@@ -0,0 +1,98 @@
+import numpy as np
+
+from benchmarks.synthetic import synthetic_keypoints
+from src.data.keypoints_store import (
+    CSV_HEADER,
+    KEYPOINTS_DTYPE,
+    KEYPOINTS_FILE,
+    NUM_KEYPOINTS,
+    PERSONS_FILE,
+    KeyPointsCSVAppender,
+    KeyPointsStore,
+    KeyPointsStoreAppender,
+    convert_csv_to_store,
+)
+
+# Frame number -> (number of persons, interpolated), with gaps and an empty frame
+FRAMES = {0: (2, False), 1: (3, True), 2: (0, False), 5: (1, False), 6: (2, True)}
+ROW_SIZE = NUM_KEYPOINTS * 3 * np.dtype(KEYPOINTS_DTYPE).itemsize
+
+
+def _append_frames(appender, frames=FRAMES):
+    for frame_number, (num_persons, interpolated) in frames.items():
+        keypoints = synthetic_keypoints(num_persons, seed=frame_number)
+        # Track IDs out of order, as a tracker gives them
+        person_ids = np.arange(num_persons)[::-1] + 10 * frame_number
+        appender.append(frame_number, keypoints, interpolated, person_ids)
+
+
+def test_csv_to_store_to_csv_round_trip(tmp_path):
+    csv_path = tmp_path / "clip.csv"
+    with KeyPointsCSVAppender(csv_path, flag_interpolated=True) as appender:
+        _append_frames(appender)
+
+    store = KeyPointsStore.open(convert_csv_to_store(csv_path))
+    assert store.complete
+    # A frame without persons has no rows in a CSV file
+    assert store.frames.tolist() == [0, 1, 5, 6]
+    assert store.interpolated.tolist() == [False, True, False, True]
+    assert store.get_frame_person_ids(1).tolist() == [10, 11, 12]
+    assert store.get_frame(6).shape == (2, NUM_KEYPOINTS, 3)
+    assert store.frame_runs().tolist() == [[0, 2], [5, 7]]
+
+    csv_path_out = tmp_path / "clip_out.csv"
+    store.write_to_csv(csv_path_out)
+    assert csv_path_out.read_text() == csv_path.read_text()
+
+
+def test_empty_csv_gives_an_empty_store(tmp_path):
+    csv_path = tmp_path / "empty.csv"
+    csv_path.write_text(",".join(CSV_HEADER) + "\n")
+
+    store = KeyPointsStore.open(convert_csv_to_store(csv_path))
+    assert len(store) == 0
+    assert 0 not in store
+    assert store.get_frame(0).shape == (0, NUM_KEYPOINTS, 3)
+    assert store.frame_runs().shape == (0, 2)
+
+
+def test_store_is_readable_while_it_is_appended(tmp_path):
+    store_path = tmp_path / "clip.kpts"
+    appender = KeyPointsStoreAppender(store_path)
+    _append_frames(appender, {0: (2, False), 1: (1, True)})
+    appender.flush()
+
+    store = KeyPointsStore.open(store_path)
+    assert not store.complete
+    assert store.frames.tolist() == [0, 1]
+    assert store.get_frame_person_ids(0).tolist() == [0, 1]
+
+    _append_frames(appender, {4: (3, False)})
+    appender.close()
+    store = KeyPointsStore.open(store_path)
+    assert store.complete
+    assert store.frames.tolist() == [0, 1, 4]
+    assert store.is_interpolated(1) and not store.is_interpolated(4)
+
+
+def test_truncated_store_is_read_up_to_the_last_whole_frame(tmp_path):
+    store_path = tmp_path / "clip.kpts"
+    appender = KeyPointsStoreAppender(store_path)
+    _append_frames(appender)
+    appender.flush()
+    # An interrupted run: the keypoints of the last frame did not fully reach the disk
+    with open(store_path / KEYPOINTS_FILE, "r+b") as file:
+        file.truncate(6 * ROW_SIZE + ROW_SIZE // 2)
+
+    store = KeyPointsStore.open(store_path)
+    assert not store.complete
+    assert store.frames.tolist() == [0, 1, 2, 5]
+    assert store.get_frame_person_ids(5).tolist() == [50]
+    assert 6 not in store
+
+    # Without all track IDs, the persons fall back to their positions in the frames
+    with open(store_path / PERSONS_FILE, "r+b") as file:
+        file.truncate(8)
+    store = KeyPointsStore.open(store_path)
+    assert store.get_frame_person_ids(1).tolist() == [0, 1, 2]
+    appender.close()
@@ -0,0 +1,62 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from src.data.video_encoders import FFmpegVideoWriter, VideoEncoderSettings
+from src.data.video_handler import _read_video_frames
+
+FRAMES = [np.full((48, 64, 3), 10 * i, dtype=np.uint8) for i in range(5)]
+
+
+def _encode(settings: VideoEncoderSettings, path) -> int:
+    writer = settings.open(path, 25, 64, 48)
+    for frame in FRAMES:
+        writer.write(frame)
+    writer.release()
+    return sum(1 for _ in _read_video_frames(path))
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [
+        VideoEncoderSettings("mjpg"),
+        VideoEncoderSettings("mjpg", quality=80),
+        VideoEncoderSettings("mp4v"),
+    ],
+    ids=["mjpg", "mjpg_quality", "mp4v"],
+)
+def test_opencv_encoders_write_every_frame(settings, tmp_path):
+    assert _encode(settings, tmp_path / f"out{settings.suffix}") == len(FRAMES)
+
+
+@pytest.mark.skipif(
+    VideoEncoderSettings("x264").ffmpeg_path() is None, reason="ffmpeg is not installed"
+)
+def test_x264_writes_every_frame(tmp_path):
+    settings = VideoEncoderSettings("x264")
+    writer = settings.open(tmp_path / "probe.mp4", 25, 64, 48)
+    assert isinstance(writer, FFmpegVideoWriter)
+    writer.release()
+    assert _encode(settings, tmp_path / "out.mp4") == len(FRAMES)
+
+
+def test_x264_falls_back_to_mp4v_without_ffmpeg(tmp_path):
+    settings = VideoEncoderSettings("x264", ffmpeg=str(tmp_path / "no-ffmpeg"))
+    assert settings.ffmpeg_path() is None
+    assert _encode(settings, tmp_path / "out.mp4") == len(FRAMES)
+
+
+@pytest.mark.skipif(shutil.which("false") is None, reason="needs the `false` command")
+def test_failing_ffmpeg_does_not_raise_on_release(tmp_path):
+    settings = VideoEncoderSettings("x264", ffmpeg="false")
+    writer = settings.open(tmp_path / "out.mp4", 25, 64, 48)
+    writer._process.wait()
+    with pytest.raises(IOError):
+        writer.write(FRAMES[0])
+    writer.release()
+
+
+def test_unknown_encoder_is_rejected():
+    with pytest.raises(ValueError):
+        VideoEncoderSettings("h265")
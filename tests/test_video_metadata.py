@@ -0,0 +1,42 @@
+import os
+import shutil
+
+from src.data import video_metadata
+from src.data.video_metadata import (
+    INDEX_NAME,
+    VideoMetadataIndex,
+    build_video_metadata_index,
+)
+
+
+def _no_probing(path_to_video):
+    raise AssertionError(f"{path_to_video} was probed again")
+
+
+def test_index_is_hit_by_relative_absolute_and_moved_paths(
+    video_folder, tmp_path, monkeypatch
+):
+    build_video_metadata_index(video_folder)
+    monkeypatch.setattr(video_metadata, "probe_video", _no_probing)
+
+    index = VideoMetadataIndex(video_folder / INDEX_NAME)
+    assert list(index.entries) == ["shot/clip.avi"]
+    # The tests run in tmp_path, so both paths name the same video
+    assert index.get(video_folder / "shot" / "clip.avi").frame_count == 6
+    assert index.get(os.path.join("videos", "shot", "clip.avi")).frame_count == 6
+
+    moved_folder = tmp_path / "moved"
+    shutil.copytree(video_folder, moved_folder)
+    moved_index = VideoMetadataIndex(moved_folder / INDEX_NAME)
+    assert moved_index.get(moved_folder / "shot" / "clip.avi").frame_count == 6
+
+
+def test_index_of_a_read_only_folder_is_kept_in_memory(video_folder, tmp_path):
+    # A path under a regular file cannot be written, even by root
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    index = VideoMetadataIndex(blocker / INDEX_NAME)
+
+    assert index.refresh([video_folder / "shot" / "clip.avi"]) == 1
+    assert len(index.entries) == 1
+    assert not (blocker / INDEX_NAME).exists()
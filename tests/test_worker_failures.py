@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.labeling.model_pool import ModelPool
+from src.labeling.parallel_executor import parallel_keypoints_factory
+
+
+def test_model_pool_fails_pending_work_of_a_dead_instance(pose_model_path):
+    pool = ModelPool(
+        pose_model_path, cores=[0], warmup_frames=0, imgsz=64, log_file=None
+    )
+    try:
+        process = pool._processes[0]
+        process.kill()
+        process.join()
+        # Either the collector has already noticed the dead instance and the submit
+        # fails, or the future fails once it does
+        with pytest.raises(RuntimeError):
+            pool.submit_frames([np.zeros((64, 64, 3), dtype=np.uint8)]).result(timeout=30)
+        with pytest.raises(RuntimeError):
+            pool.submit_frames([np.zeros((64, 64, 3), dtype=np.uint8)])
+    finally:
+        pool.close()
+
+
+def test_parallel_factory_records_videos_of_a_broken_pool(video_folder, tmp_path):
+    # The workers fail to load the model, which breaks the process pool
+    out_folder = tmp_path / "keypoints"
+    summary = parallel_keypoints_factory(
+        str(tmp_path / "missing.pt"),
+        video_folder,
+        out_folder,
+        {0: "shot"},
+        num_workers=1,
+        threads_per_worker=1,
+    )
+    assert summary.num_failed == 1
+    assert "worker process died" in summary.failed[0].error
+    manifest = json.loads((out_folder / ".completion_manifest.json").read_text())
+    assert [entry["status"] for entry in manifest.values()] == ["failed"]